@@ -0,0 +1,235 @@
+"""
+Нагрузка на страницы для чтения: синхронные представления под WSGI против
+асинхронных под ASGI (kyberapp/async_views.py).
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_async --concurrency 200 --requests 5000
+
+По умолчанию приложение вызывается в этом же процессе, без сети, в трёх
+режимах:
+- ``wsgi-sync`` — ``WSGIHandler`` в пуле из ``--threads`` потоков (как
+  gunicorn с ``--threads``), синхронные представления;
+- ``asgi-sync`` — ``ASGIHandler``, синхронные представления (каждый
+  запрос выполняется в потоке);
+- ``asgi-async`` — ``ASGIHandler``, асинхронные представления.
+
+``--concurrency`` клиентов по кругу запрашивают страницы ``--paths``;
+задержка считается от отправки запроса до получения ответа целиком
+(включая ожидание свободного потока). ``--no-page-cache`` отключает кеш
+страниц, чтобы каждый запрос читал базу.
+
+С ``--url`` нагрузка подаётся по HTTP на уже запущенный сервер, например
+``gunicorn kyberprotect.wsgi --threads 32`` или
+``uvicorn kyberprotect.asgi:application``; режимы тогда не используются.
+
+Выводит JSON: запросов в секунду, p50/p99 задержки в миллисекундах
+и количество ошибок для каждого режима.
+
+Результаты в одном процессе стоит читать с поправкой: в Django 4.2
+middleware на ``MiddlewareMixin`` (сессии, CSRF, сообщения...) под ASGI
+выполняются через ``sync_to_async`` в одном общем потоке, и при базе
+в памяти этот поток ограничивает пропускную способность обоих
+ASGI-режимов. Асинхронные представления выигрывают там, где запрос
+ждёт сеть (внешний кеш, база на другом сервере), — это проверяется
+режимом ``--url``.
+"""
+import argparse
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from benchmarks.common import percentile, setup_django, temporary_database
+
+MODES = ('wsgi-sync', 'asgi-sync', 'asgi-async')
+
+
+def seed(news=60, lessons=40):
+    from kyberapp.models import Lesson, News, Test
+
+    News.objects.bulk_create([News(title=f'Новость {number}', content='Текст новости ' * 20,
+                                   is_published=True) for number in range(news)])
+    created = Lesson.objects.bulk_create([Lesson(title=f'Урок {number}',
+                                                 description='Описание урока ' * 20)
+                                          for number in range(lessons)])
+    Test.objects.bulk_create([Test(lesson=lesson, title=f'Тест {lesson.pk}') for lesson in created])
+    return ['/', '/lessons/', f'/news/{News.objects.first().pk}/',
+            f'/lessons/{created[0].pk}/']
+
+
+def wsgi_caller(threads):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+    executor = ThreadPoolExecutor(max_workers=threads)
+
+    def call(path):
+        status = []
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'HTTP_HOST': 'testserver',
+            'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        }
+        body = handler(environ, lambda code, headers: status.append(int(code.split()[0])))
+        try:
+            b''.join(body)
+        finally:
+            body.close()
+        return status[0]
+
+    async def request(path):
+        return await asyncio.get_running_loop().run_in_executor(executor, call, path)
+
+    return request
+
+
+def asgi_caller():
+    from django.core.handlers.asgi import ASGIHandler
+
+    handler = ASGIHandler()
+
+    async def request(path):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': b'', 'root_path': '', 'headers': [(b'host', b'testserver')],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        disconnected = asyncio.Event()
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await handler(scope, receive, send)
+        disconnected.set()
+        return status[0]
+
+    return request
+
+
+def http_caller(base_url):
+    """
+    Клиент HTTP/1.1 с keep-alive: одно соединение на клиента нагрузки.
+    """
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    connections = {}
+
+    async def request(path, client_id):
+        if client_id not in connections:
+            connections[client_id] = await asyncio.open_connection(host, port)
+        reader, writer = connections[client_id]
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n\r\n'.encode())
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = None
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        if length is None:
+            # Без Content-Length тело читается до закрытия соединения.
+            await reader.read()
+            del connections[client_id]
+        else:
+            await reader.readexactly(length)
+        return status
+
+    return request
+
+
+async def load(request, paths, concurrency, total, pass_client_id=False):
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def client(client_id):
+        nonlocal errors
+        for number in counter:
+            path = paths[number % len(paths)]
+            started = time.perf_counter()
+            try:
+                args = (path, client_id) if pass_client_id else (path,)
+                status = await request(*args)
+            except Exception:
+                status = None
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(client_id) for client_id in range(concurrency)))
+    seconds = time.perf_counter() - started
+    return {
+        'requests': total, 'errors': errors,
+        'rps': round(total / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def run_in_process(args):
+    from django.core.cache import cache
+    from django.test import override_settings
+
+    from kyberapp.urls import build_urlpatterns
+
+    paths = args.paths or seed()
+    report = {'concurrency': args.concurrency, 'threads': args.threads,
+              'page_cache': not args.no_page_cache, 'paths': paths}
+    for mode in args.modes:
+        class Urls:
+            urlpatterns = build_urlpatterns(use_async_views=mode == 'asgi-async')
+
+        request = wsgi_caller(args.threads) if mode == 'wsgi-sync' else asgi_caller()
+        with override_settings(ROOT_URLCONF=Urls, DEBUG=False, ALLOWED_HOSTS=['testserver'],
+                               KYBERAPP_PAGE_CACHE={'ENABLED': not args.no_page_cache}):
+            cache.clear()
+            asyncio.run(load(request, paths, min(args.concurrency, 20), len(paths) * 5))
+            report[mode] = asyncio.run(load(request, paths, args.concurrency, args.requests))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32,
+                        help='Потоков WSGI-сервера в режиме wsgi-sync (по умолчанию 32).')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--paths', nargs='+',
+                        help='Адреса страниц (по умолчанию — страницы тестовых данных).')
+    parser.add_argument('--no-page-cache', action='store_true',
+                        help='Отключить кеш страниц для анонимных посетителей.')
+    parser.add_argument('--url', help='Подать нагрузку по HTTP на запущенный сервер.')
+    args = parser.parse_args()
+
+    if args.url:
+        paths = args.paths or ['/', '/lessons/']
+        result = asyncio.run(load(http_caller(args.url), paths, args.concurrency,
+                                  args.requests, pass_client_id=True))
+        print(json.dumps({'url': args.url, 'paths': paths, **result}, indent=2))
+        return
+
+    setup_django()
+    with temporary_database():
+        print(json.dumps(run_in_process(args), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Уменьшенные копии изображений (``images.generate_variants``): размер копий
+по сравнению с исходным файлом и время их создания.
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_images --kind lesson media/achievements/frame_2.png
+
+Без аргументов берутся все изображения из MEDIA_ROOT. Копии создаются во
+временном каталоге. Выводит JSON: для каждого файла — размер исходника,
+размеры копий по форматам и ширинам и время создания в миллисекундах.
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import setup_django, temporary_database
+
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+
+
+def run(paths, kind):
+    from django.core.files.storage import default_storage
+
+    from kyberapp.images import generate_variants
+
+    report = []
+    for path in paths:
+        name = default_storage.save(f'bench/{path.name}', path.open('rb'))
+        started = time.perf_counter()
+        derivative = generate_variants(name, kind, force=True)
+        milliseconds = (time.perf_counter() - started) * 1000
+        if derivative is None:
+            continue
+        report.append({
+            'file': str(path),
+            'size': [derivative.width, derivative.height],
+            'original_bytes': default_storage.size(name),
+            'variants': {f'{variant["format"]}-{variant["width"]}w':
+                         default_storage.size(variant['name'])
+                         for variant in derivative.variants},
+            'ms': round(milliseconds, 1),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='*', type=Path)
+    parser.add_argument('--kind', default='lesson',
+                        help='Вид изображения — ключ SIZES (по умолчанию lesson).')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import override_settings
+
+    paths = args.paths or sorted(path for path in Path(settings.MEDIA_ROOT).rglob('*')
+                                 if path.suffix.lower() in IMAGE_SUFFIXES)
+    media_root = tempfile.mkdtemp()
+    try:
+        with temporary_database(), override_settings(MEDIA_ROOT=media_root):
+            print(json.dumps(run(paths, args.kind), indent=2))
+    finally:
+        shutil.rmtree(media_root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Импорт тестов: ``kyberapp.importers`` (bulk_create пачками) против
+сохранения каждой строки через ``save()``.
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_import --tests 100 --questions 50
+
+Выводит JSON со временем импорта в секундах для обоих способов и временем
+повторного импорта того же файла в режиме обновления.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import setup_django, temporary_database
+
+
+def make_records(lesson_id, tests, questions, answers, prefix):
+    for test_number in range(tests):
+        yield {
+            'external_id': f'{prefix}-{test_number}', 'lesson_id': lesson_id,
+            'title': f'Тест {test_number}',
+            'questions': [
+                {'external_id': f'q{number}', 'question_text': f'Вопрос {number}',
+                 'question_type': 'one',
+                 'answers': [{'external_id': f'a{answer}', 'answer_text': f'Ответ {answer}',
+                              'is_correct': answer == 0} for answer in range(answers)]}
+                for number in range(questions)
+            ],
+        }
+
+
+def save_one_by_one(records):
+    from kyberapp.models import Answer, Question, Test
+
+    for record in records:
+        test = Test.objects.create(lesson_id=record['lesson_id'], title=record['title'])
+        for question_data in record['questions']:
+            question = Question.objects.create(test=test,
+                                               question_text=question_data['question_text'],
+                                               question_type=question_data['question_type'])
+            for answer in question_data['answers']:
+                Answer.objects.create(question=question, answer_text=answer['answer_text'],
+                                      is_correct=answer['is_correct'])
+
+
+def run(tests, questions, answers, batch_size):
+    from kyberapp.importers import import_tests, read_records
+    from kyberapp.models import Lesson
+
+    lesson = Lesson.objects.create(title='Урок', description='Описание')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tests.jsonl')
+        with open(path, 'w', encoding='utf-8') as stream:
+            for record in make_records(lesson.pk, tests, questions, answers, 'bulk'):
+                stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        started = time.perf_counter()
+        stats = import_tests(read_records(path), batch_size=batch_size)
+        bulk_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        import_tests(read_records(path), upsert=True, batch_size=batch_size)
+        upsert_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    save_one_by_one(make_records(lesson.pk, tests, questions, answers, 'save'))
+    save_seconds = time.perf_counter() - started
+
+    return {'tests': stats['tests'], 'questions': stats['questions'],
+            'answers': stats['answers'], 'import_s': round(bulk_seconds, 3),
+            'upsert_again_s': round(upsert_seconds, 3), 'save_per_row_s': round(save_seconds, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tests', type=int, default=100)
+    parser.add_argument('--questions', type=int, default=50)
+    parser.add_argument('--answers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database():
+        print(json.dumps(run(args.tests, args.questions, args.answers, args.batch_size),
+                         indent=2))
+
+
+if __name__ == '__main__':
+    main()
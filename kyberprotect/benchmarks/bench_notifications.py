@@ -0,0 +1,98 @@
+"""
+Рассылка уведомлений о новости: ``notifications.fan_out`` (iterator +
+bulk_create пачками + одно почтовое соединение) против цикла
+``Notification.objects.create`` по пользователям.
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_notifications --users 100000
+
+Выводит JSON со временем и пиковым объёмом памяти Python (tracemalloc,
+отдельным запуском) для обоих способов. Письма отправляются в заглушку (dummy backend).
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import setup_django, temporary_database
+
+
+def seed_users(users, chunk_size=50000):
+    from django.db import connection
+
+    from kyberapp.models import CustomUser
+
+    table = connection.ops.quote_name(CustomUser._meta.db_table)
+    with connection.cursor() as cursor:
+        for offset in range(0, users, chunk_size):
+            cursor.executemany(
+                f'INSERT INTO {table} (password, is_superuser, username, first_name, last_name, '
+                f'email, is_staff, is_active, date_joined, notify_by_email, progress) '
+                f"VALUES ('', 0, %s, '', '', %s, 0, 1, '2026-01-01', %s, '{{}}')",
+                [(f'user{number}', f'user{number}@example.com', number % 2 == 0)
+                 for number in range(offset, min(users, offset + chunk_size))],
+            )
+
+
+def traced(func, reset):
+    """
+    Выполняет ``func`` дважды: без tracemalloc (время) и под ним (пиковая
+    память), вызывая ``reset`` перед каждым запуском.
+    """
+    reset()
+    started = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - started
+    reset()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, round(seconds, 3), round(peak / 2 ** 20, 1)
+
+
+def run(users, chunk_size, naive_users):
+    from django.core.mail import get_connection
+
+    from kyberapp.models import CustomUser, Notification
+    from kyberapp.notifications import fan_out
+
+    seed_users(users)
+    connection = get_connection('django.core.mail.backends.dummy.EmailBackend')
+    def reset():
+        Notification.objects.all().delete()
+
+    stats, seconds, peak_mb = traced(lambda: fan_out(
+        CustomUser.objects.filter(is_active=True), 'Новая новость', 'Текст новости',
+        chunk_size=chunk_size, connection=connection), reset)
+
+    def naive():
+        for user in CustomUser.objects.all()[:naive_users]:
+            Notification.objects.create(user=user, title='Новая новость', message='Текст новости')
+
+    _, naive_seconds, naive_peak_mb = traced(naive, reset)
+    return {
+        'users': users, 'chunk_size': chunk_size,
+        'fan_out': {**stats, 'seconds': seconds, 'peak_mb': peak_mb},
+        'create_loop': {'users': min(users, naive_users), 'seconds': naive_seconds,
+                        'peak_mb': naive_peak_mb,
+                        'estimated_seconds_for_all': round(naive_seconds * users
+                                                           / min(users, naive_users), 1)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--naive-users', type=int, default=10000,
+                        help='Сколько пользователей обработать циклом create() для сравнения.')
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database():
+        print(json.dumps(run(args.users, args.chunk_size, args.naive_users), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Сравнение постраничного вывода новостей: Paginator (COUNT + OFFSET)
+и KeysetPaginator (курсор по (created_at, id)).
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_pagination --rows 1000000
+
+Выводит JSON с медианным временем получения страницы на разной глубине.
+"""
+import argparse
+import json
+from datetime import timedelta
+
+from benchmarks.common import measure, setup_django, temporary_database
+
+
+def seed_news(rows, chunk_size=50000):
+    from django.db import connection
+    from django.utils import timezone
+
+    from kyberapp.models import News
+
+    table = connection.ops.quote_name(News._meta.db_table)
+    started = timezone.now() - timedelta(seconds=rows)
+    with connection.cursor() as cursor:
+        for offset in range(0, rows, chunk_size):
+            cursor.executemany(
+                f'INSERT INTO {table} (title, content, image, created_at, is_published) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [(f'Новость {number}', 'Текст новости', '',
+                  started + timedelta(seconds=number), number % 10 != 0)
+                 for number in range(offset, min(rows, offset + chunk_size))],
+            )
+
+
+def run(rows, per_page, repeat):
+    from django.core.paginator import Paginator
+
+    from kyberapp.models import News
+    from kyberapp.pagination import NEXT, KeysetPaginator
+
+    seed_news(rows)
+    queryset = News.objects.filter(is_published=True)
+    published = queryset.count()
+    last_page = max(1, (published + per_page - 1) // per_page)
+
+    results = []
+    for page_number in sorted({1, 10, 100, 1000, 10000, last_page // 2, last_page}):
+        if page_number > last_page:
+            continue
+        # Paginator кеширует COUNT(*) в объекте, поэтому создаём его на каждый запрос.
+        offset_ms = measure(lambda: list(Paginator(queryset.order_by('-created_at', '-id'),
+                                                   per_page).get_page(page_number)), repeat)
+
+        keyset = KeysetPaginator(queryset, per_page, ordering=('-created_at', '-id'))
+        cursor = None
+        if page_number > 1:
+            boundary = queryset.order_by('-created_at', '-id')[(page_number - 1) * per_page - 1]
+            cursor = keyset.encode_cursor(boundary, NEXT)
+        keyset_ms = measure(lambda: list(keyset.get_page(cursor)), repeat)
+
+        results.append({'page': page_number, 'offset_ms': round(offset_ms, 3),
+                        'keyset_ms': round(keyset_ms, 3)})
+    return {'rows': rows, 'published': published, 'per_page': per_page, 'pages': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--per-page', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database():
+        print(json.dumps(run(args.rows, args.per_page, args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Накладные расходы замеров kyberapp/perf.py: время запроса со включёнными
+замерами (PerfMiddleware, обёртка SQL, замер шаблонов) и без них.
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_perf --requests 500 --rounds 20
+
+Запросы к страницам тестовых данных выполняются по очереди через
+``WSGIHandler`` в этом же процессе; режимы чередуются по раундам, чтобы
+фоновый шум поровну попадал в оба. ``--no-page-cache`` отключает кеш
+страниц: запросы становятся тяжелее, и доля замеров — меньше.
+
+Выводит JSON: медианное по раундам время запроса в микросекундах для
+каждого режима и накладные расходы в процентах (медиана по парам
+соседних раундов).
+"""
+import argparse
+import io
+import json
+import statistics
+import sys
+import time
+
+from benchmarks.bench_async import seed
+from benchmarks.common import setup_django, temporary_database
+
+
+def make_environ(path):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'HTTP_HOST': 'testserver',
+        'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    }
+
+
+def run_round(handler, paths, requests):
+    started = time.perf_counter()
+    for number in range(requests):
+        body = handler(make_environ(paths[number % len(paths)]), lambda status, headers: None)
+        b''.join(body)
+        body.close()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def run(requests, rounds, page_cache):
+    from django.core.cache import cache
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.test import override_settings
+
+    from kyberapp import perf
+
+    paths = seed()
+    handler = WSGIHandler()
+    timings = {'disabled': [], 'enabled': []}
+    with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver'],
+                           KYBERAPP_PAGE_CACHE={'ENABLED': page_cache}):
+        cache.clear()
+        run_round(handler, paths, len(paths) * 20)  # прогрев
+        for number in range(rounds):
+            # Порядок режимов меняется каждый раунд.
+            for mode in sorted(timings, reverse=number % 2 == 1):
+                enabled = mode == 'enabled'
+                # Без замеров обёртки SQL на соединении нет вовсе.
+                if perf.execute_wrapper in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(perf.execute_wrapper)
+                if enabled:
+                    connection.execute_wrappers.insert(0, perf.execute_wrapper)
+                with override_settings(KYBERAPP_PERF={'ENABLED': enabled}):
+                    timings[mode].append(run_round(handler, paths, requests))
+    # Раунды сравниваются попарно: соседние раунды идут при одинаковом
+    # фоне, и медиана разниц устойчивее к шуму, чем разница медиан.
+    overheads = [(enabled - disabled) / disabled * 100
+                 for disabled, enabled in zip(timings['disabled'], timings['enabled'])]
+    return {
+        'paths': paths, 'requests_per_round': requests, 'rounds': rounds,
+        'page_cache': page_cache,
+        'disabled_us': round(statistics.median(timings['disabled']), 1),
+        'enabled_us': round(statistics.median(timings['enabled']), 1),
+        'overhead_percent': round(statistics.median(overheads), 2),
+        'views_recorded': sorted(perf.registry.snapshot()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--no-page-cache', action='store_true',
+                        help='Отключить кеш страниц для анонимных посетителей.')
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database():
+        print(json.dumps(run(args.requests, args.rounds, not args.no_page_cache), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Сравнение поиска по урокам: LIKE (``icontains`` по заголовку и описанию)
+и полнотекстовый индекс FTS5 (``kyberapp.search``).
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_search --rows 300000
+
+Выводит JSON с медианным временем запроса для нескольких поисковых строк.
+Редкое слово (``ботнет`` встречается в одном уроке из 10000) LIKE ищет
+полным просмотром таблицы, а FTS5 читает только список документов по слову.
+Слово, которое есть почти в каждом уроке, наоборот, дешевле для LIKE с LIMIT
+(первые 20 строк находятся сразу), а FTS5 ранжирует по bm25 все совпадения.
+"""
+import argparse
+import json
+import random
+
+from benchmarks.common import measure, setup_django, temporary_database
+
+RARE_WORD = 'ботнет'
+WORDS = ('пароль фишинг вирус шифрование резервная копия обновление браузер почта '
+         'сеть роутер антивирус двухфакторная аутентификация утечка данные телефон '
+         'приложение ссылка вложение мошенник').split()
+
+
+def seed_lessons(rows, chunk_size=50000):
+    from django.db import connection
+    from django.utils import timezone
+
+    from kyberapp.models import Lesson
+
+    table = connection.ops.quote_name(Lesson._meta.db_table)
+    generator = random.Random(0)
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        for offset in range(0, rows, chunk_size):
+            cursor.executemany(
+                f'INSERT INTO {table} (title, description, image, created_at) '
+                f'VALUES (%s, %s, %s, %s)',
+                [(' '.join(generator.choices(WORDS, k=3)),
+                  ' '.join(generator.choices(WORDS, k=40)
+                           + ([RARE_WORD] if number % 10000 == 0 else [])), '', now)
+                 for number in range(offset, min(rows, offset + chunk_size))],
+            )
+
+
+def run(rows, queries, repeat):
+    from django.db.models import Q
+
+    from kyberapp.models import Lesson
+    from kyberapp.search import LESSON, rebuild_index, search
+
+    seed_lessons(rows)
+    rebuild_index(batch_size=5000)
+
+    results = []
+    for query in queries:
+        condition = Q()
+        for term in query.split():
+            condition &= Q(title__icontains=term) | Q(description__icontains=term)
+        like_ms = measure(lambda: list(Lesson.objects.filter(condition)[:20]), repeat)
+        fts_ms = measure(lambda: search(query, kinds=[LESSON]), repeat)
+        results.append({'query': query, 'matches': Lesson.objects.filter(condition).count(),
+                        'like_ms': round(like_ms, 3),
+                        'fts_ms': round(fts_ms, 3)})
+    return {'rows': rows, 'queries': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--query', action='append', dest='queries',
+                        help='Поисковая строка (можно указать несколько раз).')
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database():
+        print(json.dumps(run(args.rows, args.queries or [RARE_WORD, 'фишинг', 'утечка данные'],
+                             args.repeat), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
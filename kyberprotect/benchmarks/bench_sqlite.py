@@ -0,0 +1,155 @@
+"""
+Смешанная нагрузка чтения и записи на файловую базу SQLite: настройки
+Django по умолчанию против kyberapp/database.py (WAL, PRAGMA, повторное
+использование соединений, повтор транзакций записи).
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_sqlite --threads 8 --operations 4000 --write-ratio 0.2
+
+``--threads`` потоков выполняют ``--operations`` операций, как отдельные
+запросы: соединение закрывается или сохраняется по ``CONN_MAX_AGE`` так
+же, как после запроса Django. Чтение — страница уроков, новостей и
+результатов пользователя; запись — отправка теста (``submit_test``).
+
+Режимы:
+- ``baseline`` — журнал отката, PRAGMA по умолчанию, новое соединение на
+  каждый запрос, без повторов;
+- ``tuned`` — настройки ``KYBERAPP_SQLITE`` по умолчанию и
+  ``CONN_MAX_AGE=600``.
+
+Каждый режим работает со своей временной базой во временном каталоге.
+Выводит JSON: операций в секунду, p50/p99 задержки чтения и записи
+в миллисекундах и число ошибок «database is locked».
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_submissions import make_post, seed
+from benchmarks.common import percentile, setup_django, temporary_database
+
+MODES = {
+    'baseline': ({'ENABLED': False, 'RETRY_ATTEMPTS': 1}, 0),
+    'tuned': ({}, 600),
+}
+
+
+def read(user):
+    from kyberapp.models import Lesson, News, TestResult
+
+    list(Lesson.objects.order_by('created_at', 'id')[:10])
+    list(News.objects.filter(is_published=True).order_by('-created_at', '-id')[:6])
+    list(TestResult.objects.filter(user=user).order_by('-id')[:20])
+
+
+def seed_content(lessons=50, news=50):
+    from kyberapp.models import Lesson, News
+
+    Lesson.objects.bulk_create([Lesson(title=f'Урок {number}', description='Описание')
+                                for number in range(lessons)])
+    News.objects.bulk_create([News(title=f'Новость {number}', content='Текст', is_published=True)
+                              for number in range(news)])
+
+
+def run_mode(operations, threads, write_ratio, users, questions):
+    from django.db import close_old_connections, connection
+    from django.db.utils import OperationalError
+
+    from kyberapp.database import is_locked_error
+    from kyberapp.submissions import submit_test
+
+    test, users, answers = seed(users, questions)
+    seed_content()
+    posts = [make_post(answers, correct) for correct in (True, False)]
+    connection.close()
+
+    rng = random.Random(0)
+    plan = [rng.random() < write_ratio for _ in range(operations)]
+    plan_lock = threading.Lock()
+    latencies = {'read': [], 'write': []}
+    errors = {'locked': 0, 'other': 0}
+
+    def worker():
+        while True:
+            with plan_lock:
+                if not plan:
+                    break
+                number, is_write = len(plan), plan.pop()
+            user = users[number % len(users)]
+            close_old_connections()
+            started = time.perf_counter()
+            try:
+                if is_write:
+                    submit_test(user, test, posts[number % 2])
+                else:
+                    read(user)
+            except OperationalError as error:
+                errors['locked' if is_locked_error(error) else 'other'] += 1
+                continue
+            finally:
+                close_old_connections()
+            latencies['write' if is_write else 'read'].append(
+                (time.perf_counter() - started) * 1000)
+        connection.close()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+    return {
+        'journal_mode': journal_mode,
+        'ops_per_second': round(operations / seconds, 1),
+        'read_p50_ms': round(percentile(latencies['read'], 50), 2),
+        'read_p99_ms': round(percentile(latencies['read'], 99), 2),
+        'write_p50_ms': round(percentile(latencies['write'], 50), 2),
+        'write_p99_ms': round(percentile(latencies['write'], 99), 2),
+        'locked_errors': errors['locked'],
+        'other_errors': errors['other'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=4000)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test import override_settings
+
+    report = {'threads': args.threads, 'operations': args.operations,
+              'write_ratio': args.write_ratio}
+    directory = tempfile.mkdtemp()
+    try:
+        for mode in args.modes:
+            sqlite_config, conn_max_age = MODES[mode]
+            # Временная база — файл: у базы в памяти нет ни WAL, ни блокировок файла.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, f'{mode}.sqlite3')
+            connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+            with override_settings(KYBERAPP_SQLITE=sqlite_config), temporary_database():
+                report[mode] = run_mode(args.operations, args.threads, args.write_ratio,
+                                        args.users, args.questions)
+    finally:
+        shutil.rmtree(directory)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
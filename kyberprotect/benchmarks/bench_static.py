@@ -0,0 +1,100 @@
+"""
+Стили страницы: исходные CSS из base.html (отдельный запрос на каждый файл
+и на каждый локальный ``@import``, без сжатия) против набора
+``bundles/site.css`` после ``collectstatic`` (один запрос, сжатая копия).
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_static
+
+``collectstatic`` выполняется во временный каталог. Выводит JSON с числом
+запросов и байтами, переданными при первой загрузке, для обоих способов.
+"""
+import argparse
+import json
+import logging
+import posixpath
+import re
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import setup_django
+
+CSS_IMPORT = re.compile(r'@import\s+(?:url\()?\s*[\'"]?([^\'")\s]+)')
+
+
+def legacy_requests(sources):
+    """
+    Исходные файлы и всё, что они подключают через локальный @import.
+    """
+    from django.contrib.staticfiles import finders
+
+    seen = []
+
+    def visit(name):
+        if name in seen:
+            return
+        seen.append(name)
+        with open(finders.find(name), encoding='utf-8') as file:
+            for url in CSS_IMPORT.findall(file.read()):
+                if '://' not in url:
+                    visit(posixpath.normpath(posixpath.join(posixpath.dirname(name),
+                                                            url)))
+
+    for source in sources:
+        visit(source)
+    return seen
+
+
+def run(encoding):
+    from django.contrib.staticfiles import finders
+    from django.contrib.staticfiles.storage import staticfiles_storage
+    from django.core.management import call_command
+    from django.test import Client
+
+    from kyberapp.assets import get_config
+
+    started = time.perf_counter()
+    call_command('collectstatic', interactive=False, verbosity=0)
+    collect_seconds = time.perf_counter() - started
+
+    client = Client()
+    report = {'collectstatic_seconds': round(collect_seconds, 2)}
+    for bundle, sources in get_config()['BUNDLES'].items():
+        legacy = legacy_requests(sources)
+        legacy_bytes = 0
+        for name in legacy:
+            with open(finders.find(name), 'rb') as file:
+                legacy_bytes += len(file.read())
+        response = client.get('/static/' + staticfiles_storage.hashed_files[bundle],
+                              HTTP_ACCEPT_ENCODING=encoding)
+        report[bundle] = {
+            'legacy': {'requests': len(legacy), 'bytes': legacy_bytes},
+            'bundle': {'requests': 1, 'bytes': len(b''.join(response.streaming_content)),
+                       'content_encoding': response.get('Content-Encoding', 'identity'),
+                       'cache_control': response['Cache-Control']},
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--accept-encoding', default='br, gzip',
+                        help='Заголовок Accept-Encoding запроса (по умолчанию "br, gzip").')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import override_settings
+
+    # Предупреждения об отсутствующих картинках темы здесь не нужны.
+    logging.getLogger('kyberapp.assets').setLevel(logging.ERROR)
+    static_root = tempfile.mkdtemp()
+    try:
+        with override_settings(STATIC_ROOT=static_root, ALLOWED_HOSTS=['testserver']):
+            print(json.dumps(run(args.accept_encoding), indent=2))
+    finally:
+        shutil.rmtree(static_root)
+
+
+if __name__ == '__main__':
+    main()
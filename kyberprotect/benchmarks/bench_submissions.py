@@ -0,0 +1,111 @@
+"""
+Отправка тестов: проверка в запросе (``submissions.submit_test``) против
+очереди (``submission_queue.enqueue`` + ``grade_worker``).
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_submissions --submissions 2000 --batch-size 50
+
+Выводит JSON: для проверки в запросе — задержку запроса (p50/p95)
+и пропускную способность; для очереди — задержку постановки в очередь,
+пропускную способность обработчика и время от отправки до результата
+при разборе накопившейся очереди (как после всплеска перед дедлайном).
+Замер однопроцессный, на временной базе SQLite.
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import percentile, setup_django, temporary_database
+
+
+def seed(users, questions):
+    from kyberapp.models import Answer, CustomUser, Lesson, Question, Task, Test
+
+    lesson = Lesson.objects.create(title='Урок', description='Описание')
+    Task.objects.create(lesson=lesson, question='Задача', points=questions)
+    test = Test.objects.create(lesson=lesson, title='Экзамен')
+    for number in range(questions):
+        question = Question.objects.create(test=test, question_text=f'Вопрос {number}',
+                                           question_type='one')
+        Answer.objects.bulk_create([Answer(question=question, answer_text=f'Ответ {answer}',
+                                           is_correct=answer == 0) for answer in range(4)])
+    answers = {question.pk: [answer.pk for answer in question.answers.order_by('pk')]
+               for question in test.questions.all()}
+    users = CustomUser.objects.bulk_create(
+        [CustomUser(username=f'user{number}', email=f'user{number}@example.com')
+         for number in range(users)])
+    return test, users, answers
+
+
+def make_post(answers, correct):
+    from django.http import QueryDict
+
+    data = QueryDict(mutable=True)
+    for question_id, answer_ids in answers.items():
+        data.setlist(f'question_{question_id}', [str(answer_ids[0 if correct else 1])])
+    return data
+
+
+def summary(latencies_ms, seconds, count):
+    return {'p50_ms': round(percentile(latencies_ms, 50), 3),
+            'p95_ms': round(percentile(latencies_ms, 95), 3),
+            'per_second': round(count / seconds, 1)}
+
+
+def run(submissions, users, questions, batch_size):
+    from kyberapp.models import Submission, TestResult
+    from kyberapp.submission_queue import enqueue, run_worker
+    from kyberapp.submissions import submit_test
+
+    test, users, answers = seed(users, questions)
+    posts = [make_post(answers, number % 3 != 0) for number in range(submissions)]
+
+    latencies = []
+    started = time.perf_counter()
+    for number, data in enumerate(posts):
+        request_started = time.perf_counter()
+        submit_test(users[number % len(users)], test, data)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+    inline = summary(latencies, time.perf_counter() - started, submissions)
+
+    TestResult.objects.all().delete()
+    latencies = []
+    started = time.perf_counter()
+    for number, data in enumerate(posts):
+        request_started = time.perf_counter()
+        enqueue(users[number % len(users)], test, data)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+    queued = summary(latencies, time.perf_counter() - started, submissions)
+
+    started = time.perf_counter()
+    run_worker(batch_size=batch_size, once=True)
+    worker_seconds = time.perf_counter() - started
+    end_to_end = [(processed_at - created_at).total_seconds() * 1000
+                  for created_at, processed_at in
+                  Submission.objects.values_list('created_at', 'processed_at')]
+    return {
+        'submissions': submissions, 'questions': questions, 'batch_size': batch_size,
+        'inline_request': inline,
+        'queue_request': queued,
+        'worker_per_second': round(submissions / worker_seconds, 1),
+        'queue_end_to_end_p50_ms': round(percentile(end_to_end, 50), 1),
+        'queue_end_to_end_p95_ms': round(percentile(end_to_end, 95), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--submissions', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    with temporary_database():
+        print(json.dumps(run(args.submissions, args.users, args.questions, args.batch_size),
+                         indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""
+Нагрузочный прогон всех маршрутов kyberapp/urls.py и проверки теста
+на синтетических данных (kyberapp/seeding.py) со сравнением с базовой
+линией.
+
+Запуск из каталога проекта:
+    python -m benchmarks.bench_suite --concurrency 4 --requests 200
+    python -m benchmarks.bench_suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_suite --baseline benchmarks/baseline.json
+
+Временная база — файл во временном каталоге, её заполняет ``seed``
+с объёмами ``--users``, ``--lessons``... (как у ``manage.py seed_bench``).
+Каждый сценарий — один маршрут (для ``test_detail`` отдельно страница
+теста и отправка ответов, ``grading``) — выполняется ``--requests`` раз
+через тестовый клиент Django в ``--concurrency`` потоках; у каждого
+потока свои клиенты: анонимный, вошедший пользователь и сотрудник.
+Перед замером каждый поток выполняет сценарий один раз (прогрев кешей).
+Маршрут без сценария — ошибка: новый маршрут нужно добавить в ``scenarios``.
+
+Выводит JSON: для каждого сценария запросов в секунду, p50/p95/p99
+задержки в миллисекундах, медиану и максимум SQL-запросов на запрос
+и количество ответов с неожиданным статусом.
+
+С ``--baseline`` результат сравнивается с сохранённым. В поле
+``changes`` для каждого сценария выводится изменение числа SQL-запросов
+и относительное изменение пропускной способности и перцентилей.
+Регрессия — рост медианы SQL-запросов, ответы с неожиданным статусом
+или падение запросов в секунду больше чем на ``--tolerance`` (доля,
+по умолчанию 0.5). Регрессии выводятся в поле ``regressions``, и скрипт
+завершается с кодом 1. Перцентили при нескольких потоках в одном
+процессе во многом определяет планирование GIL (p95 кешированной
+страницы от прогона к прогону отличается вдвое), поэтому по ним
+прогон не проваливается. Время зависит от машины: базовую линию
+для сравнения стоит сохранять на той же машине, где идёт проверка;
+число SQL-запросов от машины не зависит.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from benchmarks.common import percentile, setup_django, temporary_database
+
+Scenario = namedtuple('Scenario', 'url_name method client path data expected')
+
+# Сравниваемые с базовой линией параметры прогона.
+RUN_PARAMETERS = ('volumes', 'concurrency', 'requests')
+
+
+def scenarios(worker):
+    """
+    Сценарии одного потока.
+
+    Параметры:
+    worker: словарь с ID объектов, доступных пользователю потока.
+
+    Возвращает:
+    Словарь: имя сценария -> ``Scenario``.
+    """
+    lesson_id, test_id = worker['lesson_id'], worker['test_id']
+    return {
+        'home': Scenario('home', 'get', 'anonymous', '/', None, 200),
+        'lessons': Scenario('lessons', 'get', 'anonymous', '/lessons/', None, 200),
+        'lesson_detail': Scenario('lesson_detail', 'get', 'anonymous', f'/lessons/{lesson_id}/',
+                                  None, 200),
+        'news_detail': Scenario('news_detail', 'get', 'anonymous', f'/news/{worker["news_id"]}/',
+                                None, 200),
+        'search': Scenario('search', 'get', 'anonymous', '/search/', {'q': 'фишинг пароль'}, 200),
+        'login': Scenario('login', 'get', 'anonymous', '/login/', None, 200),
+        'register': Scenario('register', 'get', 'anonymous', '/register/', None, 200),
+        'logout': Scenario('logout', 'get', 'anonymous', '/logout/', None, 302),
+        'admin_faq': Scenario('admin_faq', 'get', 'anonymous', '/admin-faq/', None, 200),
+        'achievements': Scenario('achievements', 'get', 'user', '/achievements/', None, 200),
+        'profile': Scenario('profile', 'get', 'user', '/profile/', None, 200),
+        'test_detail': Scenario('test_detail', 'get', 'user', f'/test/{test_id}/', None, 200),
+        'grading': Scenario('test_detail', 'post', 'user', f'/test/{test_id}/',
+                            worker['answers'], 200),
+        'submission_status': Scenario('submission_status', 'get', 'user',
+                                      f'/submissions/{worker["submission_id"]}/', None, 200),
+        'inbox': Scenario('inbox', 'get', 'user', '/notifications/', None, 200),
+        'mark_notifications_read': Scenario('mark_notifications_read', 'post', 'user',
+                                            '/notifications/read/',
+                                            {'notification': worker['notification_ids']}, 302),
+        'unread_count': Scenario('unread_count', 'get', 'user', '/notifications/unread-count/',
+                                 None, 200),
+        'metrics': Scenario('metrics', 'get', 'staff', '/metrics/', None, 200),
+        'leaderboard': Scenario('leaderboard', 'get', 'user', '/leaderboard/', None, 200),
+        'lesson_leaderboard': Scenario('lesson_leaderboard', 'get', 'user',
+                                       f'/leaderboard/lesson/{lesson_id}/', None, 200),
+        'test_leaderboard': Scenario('test_leaderboard', 'get', 'user',
+                                     f'/leaderboard/test/{test_id}/', None, 200),
+    }
+
+
+def check_coverage(names):
+    """
+    Возвращает имена маршрутов kyberapp/urls.py, для которых нет сценария.
+    """
+    from kyberapp.urls import urlpatterns
+
+    covered = {scenario.url_name for scenario in names.values()}
+    return sorted(pattern.name for pattern in urlpatterns
+                  if getattr(pattern, 'name', None) and pattern.name not in covered)
+
+
+def prepare_workers(concurrency):
+    """
+    Клиенты и ID объектов для каждого потока: пользователь потока —
+    ``bench<N>`` (N от 1), сотрудник — ``bench0``.
+    """
+    from django.test import Client
+
+    from kyberapp.models import CustomUser, News, Notification, Submission, Test
+
+    staff = CustomUser.objects.get(username='bench0')
+    test = Test.objects.select_related('lesson').prefetch_related('questions__answers').first()
+    # Ответы отправки: первый ответ каждого вопроса.
+    answers = {f'question_{question.pk}': [str(question.answers.all()[0].pk)]
+               for question in test.questions.all() if question.answers.all()}
+    news_id = News.objects.filter(is_published=True).values_list('pk', flat=True).first()
+    workers = []
+    for number in range(concurrency):
+        user = CustomUser.objects.get(username=f'bench{number + 1}')
+        clients = {'anonymous': Client(), 'user': Client(), 'staff': Client()}
+        clients['user'].force_login(user)
+        clients['staff'].force_login(staff)
+        workers.append({
+            'clients': clients,
+            'lesson_id': test.lesson_id,
+            'test_id': test.pk,
+            'news_id': news_id,
+            'answers': answers,
+            'submission_id': Submission.objects.filter(user=user).values_list('pk', flat=True)[0],
+            'notification_ids': [str(pk) for pk in Notification.objects.filter(user=user)
+                                 .values_list('pk', flat=True)[:3]],
+        })
+    return workers
+
+
+def send(worker, scenario):
+    """
+    Выполняет запрос сценария.
+
+    Возвращает:
+    Тройку (время в миллисекундах, количество SQL-запросов, статус верный).
+    """
+    from django.db import connection
+
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    client = worker['clients'][scenario.client]
+    started = time.perf_counter()
+    with connection.execute_wrapper(count):
+        response = getattr(client, scenario.method)(scenario.path, scenario.data)
+    elapsed = (time.perf_counter() - started) * 1000
+    return elapsed, queries[0], response.status_code == scenario.expected
+
+
+def run_scenario(name, workers, requests):
+    from django.db import connection
+
+    latencies, queries, errors = [], [], [0]
+    lock = threading.Lock()
+    counters = [requests // len(workers) + (number < requests % len(workers))
+                for number in range(len(workers))]
+
+    def run(worker, count):
+        scenario = scenarios(worker)[name]
+        send(worker, scenario)  # прогрев
+        for _ in range(count):
+            elapsed, query_count, ok = send(worker, scenario)
+            with lock:
+                latencies.append(elapsed)
+                queries.append(query_count)
+                errors[0] += not ok
+        connection.close()
+
+    threads = [threading.Thread(target=run, args=(worker, count))
+               for worker, count in zip(workers, counters)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries': statistics.median(queries) if queries else 0,
+        'queries_max': max(queries, default=0),
+        'errors': errors[0],
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Сравнивает результат с базовой линией.
+
+    Возвращает:
+    Пару (изменения по сценариям, список регрессий).
+    """
+    changes, regressions = {}, []
+    for name, current in report['scenarios'].items():
+        if current['errors']:
+            regressions.append(f'{name}: ответов с неожиданным статусом: {current["errors"]}')
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        changes[name] = {
+            'queries': current['queries'] - base['queries'],
+            **{key: round(current[key] / base[key] - 1, 3) if base[key] else None
+               for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms')},
+        }
+        if current['queries'] > base['queries']:
+            regressions.append(f'{name}: SQL-запросов {base["queries"]} -> {current["queries"]}')
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f'{name}: запросов в секунду {base["rps"]} -> {current["rps"]}')
+    return changes, regressions
+
+
+def run(volumes, concurrency, requests, only):
+    from django.test import override_settings
+
+    from kyberapp.seeding import seed
+
+    seed(**volumes)
+    workers = prepare_workers(concurrency)
+    names = scenarios(workers[0])
+    missing = check_coverage(names)
+    if missing:
+        sys.exit(f'Нет сценариев для маршрутов: {", ".join(missing)}')
+    report = {'volumes': volumes, 'concurrency': concurrency, 'requests': requests,
+              'scenarios': {}}
+    with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+        for name in names:
+            if not only or name in only:
+                report['scenarios'][name] = run_scenario(name, workers, requests)
+    return report
+
+
+def main():
+    setup_django()
+    from django.db import connection
+
+    from kyberapp.seeding import VOLUMES
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Запросов на сценарий (по умолчанию 200).')
+    for name, default in VOLUMES.items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default)
+    parser.add_argument('--only', nargs='+', help='Выполнить только эти сценарии.')
+    parser.add_argument('--baseline', help='Сравнить с сохранённым JSON.')
+    parser.add_argument('--save-baseline', help='Сохранить результат как базовую линию.')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Допустимое падение запросов в секунду (доля, по умолчанию 0.5).')
+    args = parser.parse_args()
+    parameters = {'volumes': {name: getattr(args, name) for name in VOLUMES},
+                  'concurrency': args.concurrency, 'requests': args.requests}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        # С другими объёмами или нагрузкой сравнение не имеет смысла.
+        for name in RUN_PARAMETERS:
+            if baseline[name] != parameters[name]:
+                sys.exit(f'Параметр {name} отличается от базовой линии: '
+                         f'{baseline[name]} != {parameters[name]}')
+
+    directory = tempfile.mkdtemp()
+    try:
+        # База — файл: параллельным писателям нужен WAL и ожидание блокировок.
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'suite.sqlite3')
+        with temporary_database():
+            report = run(parameters['volumes'], args.concurrency, args.requests, args.only)
+    finally:
+        shutil.rmtree(directory)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+            file.write('\n')
+    if baseline is not None:
+        report['changes'], report['regressions'] = compare(report, baseline, args.tolerance)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Общие функции для скриптов нагрузочных замеров.
+
+Скрипты запускаются из каталога проекта (рядом с manage.py), например:
+    python -m benchmarks.bench_pagination
+и работают с временной тестовой базой, не трогая db.sqlite3.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kyberprotect.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def temporary_database(keepdb=False):
+    """
+    Создаёт тестовую базу (для SQLite — в памяти) и применяет миграции.
+    """
+    from django.test.utils import setup_databases, teardown_databases
+
+    old_config = setup_databases(verbosity=0, interactive=False, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0, keepdb=keepdb)
+
+
+def measure(func, repeat=5):
+    """
+    Выполняет ``func`` ``repeat`` раз и возвращает медианное время в миллисекундах.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def percentile(values, percent):
+    """
+    Перцентиль (0–100) по отсортированной копии списка.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
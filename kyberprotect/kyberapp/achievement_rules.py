@@ -0,0 +1,286 @@
+"""
+Правила выдачи достижений по полю ``Achievement.condition``.
+
+Условие (например, ``"finish_5_lessons"``) разбирается один раз
+и превращается в правило: набор событий, после которых его стоит проверять,
+и запрос, возвращающий ID пользователей, выполнивших условие.
+
+Поддерживаемые условия:
+- ``finish_<N>_lessons`` — пройдены тесты N разных уроков;
+- ``finish_lesson_<ID>`` — пройден тест урока с указанным ID;
+- ``pass_<N>_tests`` — пройдено N разных тестов;
+- ``pass_test_<ID>`` — пройден тест с указанным ID;
+- ``complete_<N>_tasks`` — выполнено N задач (задачи урока считаются
+  выполненными, когда пройден тест этого урока).
+
+Кроме того, достижения, привязанные к задачам (``Task.achievement``),
+выдаются по событию выполнения задачи.
+"""
+import logging
+import re
+import threading
+from functools import lru_cache
+
+from django.db.models import Count
+
+from .leaderboards import refresh_entries
+from .models import Achievement, Task, TestResult, UserAchievement
+from .progress import refresh_progress
+from .routers import primary
+from .versions import get_version
+
+logger = logging.getLogger(__name__)
+
+# События, после которых проверяются условия.
+TEST_PASSED = 'test_passed'
+TASK_DONE = 'task_done'
+LESSON_FINISHED = 'lesson_finished'
+
+
+class Rule:
+    """
+    Скомпилированное условие получения достижения.
+    """
+
+    def __init__(self, condition, events, users_query):
+        self.condition = condition
+        self.events = frozenset(events)
+        self._users_query = users_query
+
+    def qualifying_users(self, user_ids=None):
+        """
+        Запрос с ID пользователей, выполнивших условие.
+
+        Параметры:
+        user_ids: ограничить проверку этими пользователями (по умолчанию — все).
+        """
+        passed = TestResult.objects.filter(passed=True)
+        if user_ids is not None:
+            passed = passed.filter(user_id__in=user_ids)
+        return self._users_query(passed).order_by().values_list('user_id', flat=True)
+
+    def __repr__(self):
+        return f'<Rule {self.condition!r}>'
+
+
+_registry = []  # (регулярное выражение, события, фабрика запроса)
+
+
+def condition(pattern, events):
+    """
+    Регистрирует вид условия.
+
+    Декорируемая функция получает параметры из регулярного выражения
+    и возвращает функцию, которая по запросу пройденных ``TestResult``
+    строит запрос пользователей, выполнивших условие.
+    """
+    regex = re.compile(pattern)
+
+    def decorator(factory):
+        _registry.append((regex, events, factory))
+        return factory
+
+    return decorator
+
+
+@condition(r'^finish_(?P<count>\d+)_lessons$', events=(LESSON_FINISHED,))
+def finish_lessons(count):
+    count = int(count)
+    return lambda passed: (passed.values('user_id')
+                           .annotate(lessons=Count('test__lesson_id', distinct=True))
+                           .filter(lessons__gte=count))
+
+
+@condition(r'^finish_lesson_(?P<lesson_id>\d+)$', events=(LESSON_FINISHED,))
+def finish_lesson(lesson_id):
+    return lambda passed: passed.filter(test__lesson_id=int(lesson_id)).distinct()
+
+
+@condition(r'^pass_(?P<count>\d+)_tests$', events=(TEST_PASSED,))
+def pass_tests(count):
+    count = int(count)
+    return lambda passed: (passed.values('user_id')
+                           .annotate(tests=Count('test_id', distinct=True))
+                           .filter(tests__gte=count))
+
+
+@condition(r'^pass_test_(?P<test_id>\d+)$', events=(TEST_PASSED,))
+def pass_test(test_id):
+    return lambda passed: passed.filter(test_id=int(test_id)).distinct()
+
+
+@condition(r'^complete_(?P<count>\d+)_tasks$', events=(TASK_DONE,))
+def complete_tasks(count):
+    count = int(count)
+    return lambda passed: (passed.values('user_id')
+                           .annotate(tasks=Count('test__lesson__tasks', distinct=True))
+                           .filter(tasks__gte=count))
+
+
+@lru_cache(maxsize=None)
+def compile_condition(text):
+    """
+    Превращает строку условия в правило.
+
+    Возвращает:
+    Объект ``Rule`` или ``None``, если условие не распознано.
+    """
+    text = (text or '').strip()
+    for regex, events, factory in _registry:
+        match = regex.match(text)
+        if match:
+            return Rule(text, events, factory(**match.groupdict()))
+    return None
+
+
+_index = (None, {})  # (версия, событие -> [(ID достижения, правило), ...])
+_lock = threading.Lock()
+
+
+def get_rule_index():
+    """
+    Возвращает индекс «событие -> правила», собирая его при изменении
+    списка достижений.
+    """
+    global _index
+    version = get_version('achievements')
+    if _index[0] == version:
+        return _index[1]
+
+    index = {}
+    with primary():
+        conditions = list(Achievement.objects.values_list('id', 'condition'))
+    for achievement_id, text in conditions:
+        rule = compile_condition(text)
+        if rule is None:
+            logger.debug('Условие достижения %s не распознано: %r', achievement_id, text)
+            continue
+        for event in rule.events:
+            index.setdefault(event, []).append((achievement_id, rule))
+
+    with _lock:
+        _index = (version, index)
+    return index
+
+
+def award(user, achievement_ids, refresh=True):
+    """
+    Присваивает пользователю достижения одним ``bulk_create``.
+    Уже полученные достижения пропускаются.
+
+    Параметры:
+    refresh: пересчитать сводку прогресса и место в общем рейтинге
+             (``False``, если вызывающий код пересчитает их сам).
+    """
+    UserAchievement.objects.bulk_create(
+        [UserAchievement(user_id=user.pk, achievement_id=achievement_id)
+         for achievement_id in achievement_ids],
+        ignore_conflicts=True,
+    )
+    if refresh:
+        refresh_progress([user.pk])
+        refresh_entries([user.pk], test_ids=())
+
+
+def evaluate(user, events, task_ids=(), refresh=True):
+    """
+    Проверяет правила, которые могли сработать после событий, и выдаёт
+    достижения.
+
+    Параметры:
+    user: пользователь, с которым произошли события.
+    events: коллекция событий (``TEST_PASSED``, ``TASK_DONE``, ``LESSON_FINISHED``).
+    task_ids: ID выполненных задач (для события ``TASK_DONE``).
+    refresh: пересчитать сводку прогресса после выдачи достижений.
+
+    Возвращает:
+    Множество ID впервые полученных достижений.
+    """
+    index = get_rule_index()
+    candidates = {}
+    for event in events:
+        for achievement_id, rule in index.get(event, ()):
+            candidates[achievement_id] = rule
+
+    task_achievement_ids = set()
+    if TASK_DONE in events:
+        task_achievement_ids = set(Task.objects.filter(pk__in=task_ids,
+                                                       achievement__isnull=False)
+                                   .values_list('achievement_id', flat=True))
+
+    if not candidates and not task_achievement_ids:
+        return set()
+
+    earned = set(UserAchievement.objects.filter(
+        user_id=user.pk, achievement_id__in=set(candidates) | task_achievement_ids,
+    ).values_list('achievement_id', flat=True))
+
+    new_ids = task_achievement_ids - earned
+    for achievement_id, rule in candidates.items():
+        if achievement_id not in earned and rule.qualifying_users([user.pk]).exists():
+            new_ids.add(achievement_id)
+
+    if new_ids:
+        award(user, new_ids, refresh=refresh)
+        logger.info('Пользователю %s присвоены достижения %s', user.pk, sorted(new_ids))
+    return new_ids
+
+
+def on_test_passed(user, test, task_ids=None, refresh=True):
+    """
+    Обрабатывает успешное прохождение теста: тест пройден, урок завершён,
+    задачи урока выполнены.
+
+    Параметры:
+    task_ids: ID задач урока, если они уже известны вызывающему коду.
+    refresh: пересчитать сводку прогресса после выдачи достижений.
+    """
+    if task_ids is None:
+        task_ids = Task.objects.filter(lesson_id=test.lesson_id).values_list('id', flat=True)
+    return evaluate(user, (TEST_PASSED, LESSON_FINISHED, TASK_DONE), task_ids=task_ids,
+                    refresh=refresh)
+
+
+def backfill(batch_size=1000):
+    """
+    Проверяет все правила для всех пользователей и выдаёт недостающие
+    достижения. Каждое правило проверяется одним запросом по всем
+    пользователям, записи создаются пачками по ``batch_size``.
+
+    Возвращает:
+    Количество проверенных пар (пользователь, достижение), прошедших условие.
+    """
+    def pairs():
+        for achievement_id, text in Achievement.objects.values_list('id', 'condition'):
+            rule = compile_condition(text)
+            if rule is None:
+                continue
+            for user_id in rule.qualifying_users().iterator(chunk_size=batch_size):
+                yield user_id, achievement_id
+
+        # Достижения за задачи: задачи урока выполнены, если пройден его тест.
+        task_pairs = (TestResult.objects.filter(passed=True,
+                                                test__lesson__tasks__achievement__isnull=False)
+                      .order_by()
+                      .values_list('user_id', 'test__lesson__tasks__achievement_id')
+                      .distinct())
+        yield from task_pairs.iterator(chunk_size=batch_size)
+
+    def flush(batch):
+        UserAchievement.objects.bulk_create(batch, ignore_conflicts=True)
+        user_ids = {user_achievement.user_id for user_achievement in batch}
+        refresh_progress(user_ids)
+        refresh_entries(user_ids, test_ids=())
+
+    total = 0
+    batch = []
+    for user_id, achievement_id in pairs():
+        batch.append(UserAchievement(user_id=user_id, achievement_id=achievement_id))
+        if len(batch) >= batch_size:
+            flush(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        flush(batch)
+        total += len(batch)
+    return total
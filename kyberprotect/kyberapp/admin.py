@@ -3,8 +3,25 @@ from django.contrib.auth.admin import UserAdmin
 from .models import (
     CustomUser, Lesson, Task, Achievement,
     UserAchievement, Notification, News,
-    Test, Question, Answer, UserTest
+    Test, Question, Answer, UserTest, UserProgress, Submission
 )
+from .routers import reporting
+from .search import filter_queryset
+
+
+# Поиск в админке через полнотекстовый индекс вместо LIKE по каждому полю
+class FullTextSearchMixin:
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return filter_queryset(queryset, search_term), False
+
+
+# Списки-отчёты читаются с реплики базы (см. routers.py)
+class ReplicaReportMixin:
+    def changelist_view(self, request, extra_context=None):
+        with reporting():
+            return super().changelist_view(request, extra_context)
 
 
 # Админка для управления пользовательскими данными
@@ -23,7 +40,7 @@ class CustomUserAdmin(UserAdmin):
 
 # Админка для лекций
 @admin.register(Lesson)
-class LessonAdmin(admin.ModelAdmin):
+class LessonAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('title', 'created_at')
     search_fields = ('title',)
     ordering = ('-created_at',)
@@ -62,7 +79,7 @@ class NotificationAdmin(admin.ModelAdmin):
 
 # Админка для новостей
 @admin.register(News)
-class NewsAdmin(admin.ModelAdmin):
+class NewsAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('title', 'created_at', 'is_published')
     list_filter = ('created_at', 'is_published')
     search_fields = ('title', 'content')
@@ -72,7 +89,7 @@ class NewsAdmin(admin.ModelAdmin):
 # Админка для тестов, связанных с лекциями
 @admin.register(Test)
 class TestAdmin(admin.ModelAdmin):
-    list_display = ('lesson', 'title', 'is_active', 'created_at')
+    list_display = ('lesson', 'title', 'total_points', 'is_active', 'created_at')
     list_filter = ('is_active', 'created_at')
     search_fields = ('title',)
     ordering = ('-created_at',)
@@ -80,7 +97,7 @@ class TestAdmin(admin.ModelAdmin):
 
 # Админка для вопросов к тестам
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin):
+class QuestionAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('test', 'question_text', 'question_type')
     list_filter = ('question_type',)
     search_fields = ('question_text',)
@@ -98,8 +115,37 @@ class AnswerAdmin(admin.ModelAdmin):
 
 # Админка для отслеживания прохождения тестов пользователями
 @admin.register(UserTest)
-class UserTestAdmin(admin.ModelAdmin):
+class UserTestAdmin(ReplicaReportMixin, admin.ModelAdmin):
     list_display = ('user', 'test', 'score', 'completed_at')
     list_filter = ('completed_at',)
     search_fields = ('user__username', 'test__title')
     ordering = ('-completed_at',)
+
+
+# Админка для сводок прогресса пользователей (только просмотр)
+@admin.register(UserProgress)
+class UserProgressAdmin(ReplicaReportMixin, admin.ModelAdmin):
+    list_display = ('user', 'earned_achievements', 'progress_percent',
+                    'passed_tests', 'updated_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'earned_achievements', 'progress_percent',
+                       'passed_tests', 'completed_task_ids', 'catalog_version',
+                       'updated_at')
+
+
+# Админка для очереди отправленных тестов
+@admin.register(Submission)
+class SubmissionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'test', 'status', 'attempts', 'created_at',
+                    'processed_at')
+    list_filter = ('status',)
+    search_fields = ('user__username', 'test__title')
+    readonly_fields = ('user', 'test', 'answers', 'attempts', 'error', 'worker',
+                       'result', 'created_at', 'started_at', 'processed_at')
+    actions = ['requeue']
+
+    @admin.action(description='Вернуть в очередь')
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status=Submission.DONE).update(
+            status=Submission.PENDING, attempts=0, error='', worker='')
+        self.message_user(request, f'Возвращено в очередь: {updated}')
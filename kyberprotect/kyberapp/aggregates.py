@@ -0,0 +1,63 @@
+"""
+Денормализованные агрегаты и их пересчёт.
+
+``Test.total_points`` хранит сумму баллов за задачи урока теста. Значение
+обновляется одним UPDATE на стороне базы при создании, изменении и удалении
+задач (см. ``signals.py``). Массовые операции над ``Task`` через
+``QuerySet.update()`` сигналов не вызывают — после них нужно вызвать
+``refresh_test_totals`` или команду ``recompute_test_totals``.
+"""
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Task, Test
+
+
+def lesson_points(lesson_ref):
+    """
+    Выражение с суммой баллов за задачи урока (0, если задач нет).
+
+    Параметры:
+    lesson_ref: выражение с ID урока, например ``OuterRef('lesson_id')``.
+    """
+    points = (Task.objects.filter(lesson_id=lesson_ref)
+              .order_by()
+              .values('lesson_id')
+              .annotate(total=Sum('points'))
+              .values('total'))
+    return Coalesce(Subquery(points, output_field=IntegerField()), Value(0))
+
+
+def compute_lesson_points(lesson_id):
+    """
+    Считает сумму баллов за задачи урока одним запросом.
+    """
+    return (Task.objects.filter(lesson_id=lesson_id)
+            .aggregate(total=Coalesce(Sum('points'), Value(0)))['total'])
+
+
+def refresh_test_totals(lesson_ids=None):
+    """
+    Пересчитывает ``Test.total_points`` для тестов указанных уроков
+    (или для всех тестов) одним UPDATE.
+
+    Возвращает:
+    Количество обновлённых тестов.
+    """
+    tests = Test.objects.all()
+    if lesson_ids is not None:
+        tests = tests.filter(lesson_id__in=[lesson_id for lesson_id in lesson_ids
+                                            if lesson_id is not None])
+    return tests.update(total_points=lesson_points(OuterRef('lesson_id')))
+
+
+def find_stale_test_totals():
+    """
+    Ищет тесты, у которых сохранённая сумма баллов не совпадает с реальной.
+
+    Возвращает:
+    Список кортежей (ID теста, сохранённое значение, ожидаемое значение).
+    """
+    return list(Test.objects.annotate(expected=lesson_points(OuterRef('lesson_id')))
+                .exclude(total_points=F('expected'))
+                .values_list('id', 'total_points', 'expected'))
@@ -0,0 +1,163 @@
+"""
+Статистика вопросов и тестов по файлам ``exports.py``.
+
+Для каждого вопроса (по набору ``answers``) считаются:
+- ``p_value`` — трудность: доля верных ответов;
+- ``discrimination`` — индекс дискриминации: доля верных ответов у 27%
+  результатов теста с наибольшим числом верных ответов минус доля у 27%
+  с наименьшим (при равных суммах порядок — по ID результата);
+- ``point_biserial`` — корреляция ответа на вопрос с числом верных ответов
+  на остальные вопросы теста (``nan``, если один из рядов постоянен).
+Вопросы с ``discrimination`` ниже ``LOW_DISCRIMINATION`` плохо отделяют
+сильных учеников от слабых — их стоит пересмотреть.
+
+Для тестов (по набору ``results``): число результатов, доля пройденных
+и средний балл.
+
+Все величины считаются над массивами NumPy без циклов по строкам
+(группировка — ``np.unique`` и ``np.bincount``), поэтому миллионы строк
+обрабатываются за секунды. Нужен пакет ``numpy``, для чтения Parquet
+и Arrow — ещё и ``pyarrow``.
+"""
+import csv
+import os
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy необязателен
+    np = None
+
+from .exports import pyarrow
+
+# Доля результатов в верхней и нижней группах индекса дискриминации.
+GROUP_SHARE = 0.27
+LOW_DISCRIMINATION = 0.2
+
+
+def _require_numpy():
+    if np is None:
+        raise ValueError('Для статистики требуется пакет numpy')
+
+
+def load_columns(path, columns):
+    """
+    Читает колонки выгруженного файла (CSV, Parquet или Arrow по расширению).
+
+    Возвращает:
+    Словарь: имя колонки -> массив NumPy int64.
+    """
+    _require_numpy()
+    extension = os.path.splitext(path)[1]
+    if extension in ('.parquet', '.arrow'):
+        if pyarrow is None:
+            raise ValueError('Для чтения Parquet и Arrow требуется пакет pyarrow')
+        if extension == '.parquet':
+            table = pyarrow.parquet.read_table(path, columns=columns)
+        else:
+            with pyarrow.memory_map(path) as source:
+                table = pyarrow.ipc.open_file(source).read_all().select(columns)
+        return {name: table.column(name).to_numpy().astype(np.int64) for name in columns}
+
+    # CSV читается построчно в компактные массивы, а не в список словарей.
+    with open(path, encoding='utf-8', newline='') as stream:
+        reader = csv.reader(stream)
+        header = next(reader)
+        missing = set(columns) - set(header)
+        if missing:
+            raise ValueError(f'{path}: нет колонок {", ".join(sorted(missing))}')
+        indexes = [header.index(name) for name in columns]
+        values = np.fromiter((int(row[index]) for row in reader for index in indexes),
+                             dtype=np.int64)
+    values = values.reshape(-1, len(columns))
+    return {name: values[:, number] for number, name in enumerate(columns)}
+
+
+def _ratio(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.full(len(numerator), np.nan),
+                     where=denominator != 0)
+
+
+def item_statistics(result_ids, test_ids, question_ids, correct):
+    """
+    Статистика вопросов по строкам набора ``answers``.
+
+    Параметры:
+    result_ids, test_ids, question_ids, correct: массивы одной длины
+    (колонки набора; ``correct`` — 0/1).
+
+    Возвращает:
+    Словарь массивов, строка на вопрос по возрастанию ID: ``question_id``,
+    ``test_id``, ``responses``, ``p_value``, ``discrimination``,
+    ``point_biserial``.
+    """
+    _require_numpy()
+    correct = np.asarray(correct, dtype=np.float64)
+    questions, first_row, question_index = np.unique(question_ids, return_index=True,
+                                                     return_inverse=True)
+    question_index = question_index.reshape(-1)
+    results, result_index = np.unique(result_ids, return_inverse=True)
+    result_index = result_index.reshape(-1)
+    totals = np.bincount(result_index, weights=correct, minlength=len(results))
+
+    # Место результата среди результатов своего теста по числу верных ответов.
+    result_tests = np.zeros(len(results), dtype=np.int64)
+    result_tests[result_index] = np.asarray(test_ids)
+    order = np.lexsort((results, totals, result_tests))
+    tests, test_starts, test_sizes = np.unique(result_tests[order], return_index=True,
+                                               return_counts=True)
+    test_of_sorted = np.repeat(np.arange(len(tests)), test_sizes)
+    position = np.empty(len(results), dtype=np.int64)
+    position[order] = np.arange(len(results)) - test_starts[test_of_sorted]
+    size = np.empty(len(results), dtype=np.int64)
+    size[order] = test_sizes[test_of_sorted]
+    group = np.maximum(1, np.floor(size * GROUP_SHARE + 0.5)).astype(np.int64)
+    upper = (position >= size - group)[result_index]
+    lower = (position < group)[result_index]
+
+    count = len(questions)
+    responses = np.bincount(question_index, minlength=count).astype(np.float64)
+    right = np.bincount(question_index, weights=correct, minlength=count)
+    discrimination = (
+        _ratio(np.bincount(question_index, weights=correct * upper, minlength=count),
+               np.bincount(question_index, weights=upper, minlength=count))
+        - _ratio(np.bincount(question_index, weights=correct * lower, minlength=count),
+                 np.bincount(question_index, weights=lower, minlength=count)))
+
+    # Точечно-бисериальная корреляция с суммой по остальным вопросам.
+    rest = totals[result_index] - correct
+    sum_rest = np.bincount(question_index, weights=rest, minlength=count)
+    sum_rest2 = np.bincount(question_index, weights=rest * rest, minlength=count)
+    sum_product = np.bincount(question_index, weights=correct * rest, minlength=count)
+    covariance = responses * sum_product - right * sum_rest
+    variance = (responses * right - right * right) * (responses * sum_rest2 - sum_rest * sum_rest)
+    point_biserial = _ratio(covariance, np.sqrt(np.maximum(variance, 0)))
+
+    return {
+        'question_id': questions,
+        'test_id': np.asarray(test_ids)[first_row],
+        'responses': responses.astype(np.int64),
+        'p_value': _ratio(right, responses),
+        'discrimination': discrimination,
+        'point_biserial': point_biserial,
+    }
+
+
+def pass_statistics(test_ids, scores, passed):
+    """
+    Статистика тестов по строкам набора ``results``.
+
+    Возвращает:
+    Словарь массивов, строка на тест по возрастанию ID: ``test_id``,
+    ``results``, ``pass_rate``, ``mean_score``.
+    """
+    _require_numpy()
+    tests, test_index, counts = np.unique(test_ids, return_inverse=True, return_counts=True)
+    test_index = test_index.reshape(-1)
+    return {
+        'test_id': tests,
+        'results': counts,
+        'pass_rate': np.bincount(test_index, weights=np.asarray(passed, dtype=np.float64),
+                                 minlength=len(tests)) / counts,
+        'mean_score': np.bincount(test_index, weights=np.asarray(scores, dtype=np.float64),
+                                  minlength=len(tests)) / counts,
+    }
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class KyberappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'kyberapp'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .database import configure_connection
+        from .perf import install_execute_wrapper
+
+        connection_created.connect(configure_connection, dispatch_uid='kyberapp.database')
+        connection_created.connect(install_execute_wrapper, dispatch_uid='kyberapp.perf')
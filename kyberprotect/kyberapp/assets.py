@@ -0,0 +1,363 @@
+"""
+Сборка и раздача статических файлов.
+
+``collectstatic`` с хранилищем ``AssetsStorage``:
+
+1. склеивает CSS/JS из ``BUNDLES`` в один файл на набор. Локальные
+   ``@import`` встраиваются на место, относительные ``url()`` пересчитываются
+   от каталога набора, CSS сжимается (``minify_css``);
+2. добавляет в имена всех файлов хеш содержимого
+   (``ManifestStaticFilesStorage``: ``bundles/site.3f2a…c1.css``) — такие
+   файлы можно кешировать в браузере навсегда;
+3. рядом с текстовыми файлами кладёт сжатые копии ``.gz`` и, если установлен
+   пакет ``brotli``, ``.br``.
+
+``StaticAssetsMiddleware`` отдаёт файлы из ``STATIC_ROOT`` без участия
+остального стека: выбирает сжатую копию по ``Accept-Encoding``, ставит
+``Content-Encoding``, ``ETag`` и ``Cache-Control`` и отвечает ``304`` на
+``If-None-Match``. Тег ``{% bundle %}`` (templatetags/assets.py) выводит
+один ``<link>``/``<script>`` на набор, а пока ``collectstatic`` не запускали —
+теги исходных файлов.
+
+Настройки (``settings.KYBERAPP_STATIC``):
+- ``BUNDLES`` — наборы: имя файла набора -> список исходных файлов;
+- ``COMPRESS_EXTENSIONS`` — расширения файлов, для которых создаются
+  сжатые копии;
+- ``SERVE`` — раздавать ``STATIC_ROOT`` через ``StaticAssetsMiddleware`` (``True``);
+- ``MAX_AGE`` — ``max-age`` для файлов без хеша в имени, секунды (3600).
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+from email.utils import formatdate
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BUNDLES': {
+        'bundles/site.css': [
+            'css/bootstrap.min.css',
+            'css/fancybox/jquery.fancybox.css',
+            'css/flexslider.css',
+            'css/style.css',
+        ],
+    },
+    'COMPRESS_EXTENSIONS': ('.css', '.js', '.svg', '.eot', '.ttf', '.otf', '.json',
+                            '.txt', '.xml', '.map', '.ico'),
+    'SERVE': True,
+    'MAX_AGE': 60 * 60,
+}
+
+# Сжатые копии, от лучшего сжатия к худшему: (Content-Encoding, суффикс файла).
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+_CSS_STRING_OR_COMMENT = re.compile(
+    r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*!.*?\*/)|/\*.*?\*/', re.S)
+_CSS_SPACES = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r' ?([{};,>]) ?')
+_CSS_IMPORT = re.compile(r'@import\s+(?:url\(\s*)?([\'"]?)([^\'")\s]+)\1\s*\)?\s*([^;]*);')
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_CSS_CHARSET = re.compile(r'@charset\s+[^;]+;\s*')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_STATIC', {})}
+
+
+def _compact_css(css):
+    css = _CSS_SPACES.sub(' ', css)
+    css = _CSS_PUNCTUATION.sub(r'\1', css)
+    # Пробел перед двоеточием не трогаем: "a :hover" и "a:hover" — разные селекторы.
+    return css.replace(': ', ':').replace(';}', '}')
+
+
+def minify_css(css):
+    """
+    Удаляет из CSS комментарии и лишние пробелы. Строки в кавычках
+    и комментарии ``/*! ... */`` (лицензии) не изменяются.
+    """
+    chunks, position = [], 0
+    for match in _CSS_STRING_OR_COMMENT.finditer(css):
+        chunks.append(_compact_css(css[position:match.start()]))
+        chunks.append(match.group(1) or '')
+        position = match.end()
+    chunks.append(_compact_css(css[position:]))
+    return ''.join(chunks).strip()
+
+
+def _is_local(url):
+    return not re.match(r'^([a-z]+:|/|#)', url)
+
+
+def _rebase_urls(css, source, bundle):
+    """
+    Пересчитывает относительные ``url()`` из каталога ``source``
+    в каталог ``bundle``.
+    """
+    def rebase(match):
+        quote, url = match.groups()
+        if not _is_local(url):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        relative = posixpath.relpath(target, posixpath.dirname(bundle) or '.')
+        return f'url({quote}{relative}{suffix}{quote})'
+
+    return _CSS_URL.sub(rebase, css)
+
+
+def build_css_bundle(bundle, sources, read):
+    """
+    Склеивает CSS-файлы в один.
+
+    Параметры:
+    bundle: имя файла набора (от него считаются относительные url()).
+    sources: имена исходных файлов по порядку.
+    read: функция, возвращающая текст файла по имени.
+
+    Возвращает:
+    Сжатый текст набора. Внешние ``@import`` (шрифты с других сайтов)
+    переносятся в начало — в другом месте браузер их не применит.
+    """
+    imports, seen = [], set()
+
+    def inline(source):
+        if source in seen:
+            return ''
+        seen.add(source)
+        css = _CSS_CHARSET.sub('', read(source))
+
+        def replace_import(match):
+            url, media = match.group(2), match.group(3).strip()
+            if not _is_local(url) or media:
+                imports.append(_rebase_urls(match.group(0), source, bundle))
+                return ''
+            return inline(posixpath.normpath(posixpath.join(posixpath.dirname(source), url)))
+
+        css = _CSS_IMPORT.sub(replace_import, css)
+        return _rebase_urls(css, source, bundle)
+
+    body = '\n'.join(inline(source) for source in sources)
+    return minify_css('\n'.join(imports + [body]))
+
+
+def build_js_bundle(sources, read):
+    # Скрипты только склеиваются: сжатие JS регулярными выражениями
+    # ненадёжно, а основной выигрыш даёт сжатая копия .gz/.br.
+    return '\n;\n'.join(read(source).strip() for source in sources) + '\n'
+
+
+def compress(content):
+    """
+    Возвращает сжатые варианты содержимого: {суффикс файла: байты}.
+    Вариант пропускается, если он почти не меньше исходника.
+    """
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    return {suffix: data for suffix, data in variants.items()
+            if len(data) < len(content) * 0.95}
+
+
+class AssetsStorage(ManifestStaticFilesStorage):
+    """
+    Хранилище ``collectstatic``: наборы, хеши в именах файлов и сжатые копии.
+    """
+
+    def url(self, name, force=False):
+        if not self.hashed_files and not force:
+            # collectstatic ещё не запускали (разработка, тесты) — отдаём
+            # ссылки на файлы без хеша.
+            return StaticFilesStorage.url(self, name)
+        return super().url(name, force)
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def safe_converter(matchobj):
+            # В CSS темы есть ссылки на отсутствующие картинки — оставляем их
+            # как есть, а не прерываем collectstatic.
+            try:
+                return converter(matchobj)
+            except ValueError:
+                missing = (name, matchobj.group('url'))
+                if missing not in self.missing_urls:
+                    self.missing_urls.add(missing)
+                    logger.warning('%s: файл %s не найден', *missing)
+                return matchobj.group('matched')
+
+        return safe_converter
+
+    def build_bundles(self, paths):
+        def read(source):
+            storage, path = paths[source]
+            with storage.open(path) as file:
+                return file.read().decode('utf-8')
+
+        for bundle, sources in get_config()['BUNDLES'].items():
+            if bundle.endswith('.css'):
+                content = build_css_bundle(bundle, sources, read)
+            else:
+                content = build_js_bundle(sources, read)
+            if self.exists(bundle):
+                self.delete(bundle)
+            self._save(bundle, ContentFile(content.encode('utf-8')))
+            paths[bundle] = (self, bundle)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        self.missing_urls = set()
+        self.build_bundles(paths)
+        yield from super().post_process(paths, dry_run, **options)
+
+        extensions = tuple(get_config()['COMPRESS_EXTENSIONS'])
+        for name in sorted(set(self.hashed_files.values())):
+            if not name.endswith(extensions):
+                continue
+            with self.open(name) as file:
+                content = file.read()
+            for suffix, data in compress(content).items():
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(data))
+                yield name, name + suffix, True
+
+
+def accepted_encodings(header):
+    """
+    Разбирает ``Accept-Encoding`` и возвращает множество кодировок,
+    которые клиент принимает (``q`` больше нуля).
+    """
+    encodings = set()
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        quality = re.search(r'q=([\d.]+)', params)
+        if encoding and not (quality and float(quality.group(1)) == 0):
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def _etag(stat, encoding=''):
+    suffix = f'-{encoding}' if encoding else ''
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{suffix}"'
+
+
+def _etag_matches(header, etag):
+    if header.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in header.split(','))
+
+
+class StaticAssetsMiddleware:
+    """
+    Отдаёт файлы из ``STATIC_ROOT`` со сжатыми копиями и ``ETag``.
+    Запросы к другим адресам и к отсутствующим файлам проходят дальше.
+
+    Работает и под ASGI, не переводя остальные запросы в поток. Файл
+    под ASGI читается в потоке целиком: статику в рабочем режиме обычно
+    отдаёт веб-сервер перед приложением.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.strip('/') + '/'
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _static_name(self, request):
+        if (request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix)
+                and settings.STATIC_ROOT and get_config()['SERVE']):
+            return request.path[len(self.prefix):]
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        name = self._static_name(request)
+        if name is not None:
+            response = self.serve(request, name)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        name = self._static_name(request)
+        if name is not None:
+            response = await sync_to_async(self.serve)(request, name, stream=False)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def serve(self, request, name, stream=True):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+            stat = os.stat(path)
+        except (SuspiciousFileOperation, OSError, ValueError):
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        encoding = ''
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for candidate, suffix in ENCODINGS:
+            if candidate in accepted:
+                try:
+                    encoded_stat = os.stat(path + suffix)
+                except OSError:
+                    continue
+                encoding, path, stat_for_length = candidate, path + suffix, encoded_stat
+                break
+        else:
+            stat_for_length = stat
+
+        etag = _etag(stat, encoding)
+        max_age = IMMUTABLE_MAX_AGE if HASHED_NAME.search(name) else get_config()['MAX_AGE']
+        headers = {
+            'ETag': etag,
+            'Cache-Control': f'public, max-age={max_age}'
+                             + (', immutable' if max_age == IMMUTABLE_MAX_AGE else ''),
+            'Vary': 'Accept-Encoding',
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+        }
+        if _etag_matches(request.headers.get('If-None-Match', ''), etag):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type in ('application/javascript',
+                                                                     'image/svg+xml'):
+                content_type += '; charset=utf-8'
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=content_type)
+            elif not stream:
+                with open(path, 'rb') as file:
+                    response = HttpResponse(file.read(), content_type=content_type)
+            else:
+                response = FileResponse(open(path, 'rb'), content_type=content_type,
+                                        filename=posixpath.basename(name))
+            response['Content-Length'] = stat_for_length.st_size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        for header, value in headers.items():
+            response[header] = value
+        return response
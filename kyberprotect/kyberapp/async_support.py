@@ -0,0 +1,81 @@
+"""
+Вспомогательные функции для асинхронных представлений (см. async_views.py).
+
+В Django 4.2 асинхронные методы кеша (``aget``, ``aset``...) выполняют
+синхронные в пуле потоков. Кеш в памяти процесса (``LocMemCache``)
+ввода-вывода не выполняет, поэтому для него синхронные методы вызываются
+прямо в цикле событий, без перехода в поток; для остальных бэкендов
+используются ``a``-методы Django.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import Http404
+
+
+def _backend(cache):
+    return caches[DEFAULT_CACHE_ALIAS] if cache is None else cache
+
+
+async def aget(key, default=None, cache=None):
+    cache = _backend(cache)
+    if isinstance(cache, LocMemCache):
+        return cache.get(key, default)
+    return await cache.aget(key, default)
+
+
+async def aget_many(keys, cache=None):
+    cache = _backend(cache)
+    if isinstance(cache, LocMemCache):
+        return cache.get_many(keys)
+    return await cache.aget_many(keys)
+
+
+async def aadd(key, value, timeout=None, cache=None):
+    cache = _backend(cache)
+    if isinstance(cache, LocMemCache):
+        return cache.add(key, value, timeout)
+    return await cache.aadd(key, value, timeout)
+
+
+async def aset(key, value, timeout=None, cache=None):
+    cache = _backend(cache)
+    if isinstance(cache, LocMemCache):
+        return cache.set(key, value, timeout)
+    return await cache.aset(key, value, timeout)
+
+
+async def aset_many(data, timeout=None, cache=None):
+    cache = _backend(cache)
+    if isinstance(cache, LocMemCache):
+        return cache.set_many(data, timeout)
+    return await cache.aset_many(data, timeout)
+
+
+async def adelete(key, cache=None):
+    cache = _backend(cache)
+    if isinstance(cache, LocMemCache):
+        return cache.delete(key)
+    return await cache.adelete(key)
+
+
+async def aload_user(request):
+    """
+    Загружает пользователя запроса, чтобы дальше к ``request.user``
+    можно было обращаться из асинхронного кода.
+
+    В Django 4.2 нет ``request.auser()``: пользователь читается из сессии
+    синхронными запросами к базе. Без cookie сессии запросов нет (посетитель
+    анонимный), и переход в поток не нужен.
+    """
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'{queryset.model._meta.object_name} не найден')
@@ -0,0 +1,108 @@
+"""
+Асинхронные версии страниц для чтения: главная, уроки, урок, новость,
+достижения.
+
+Под ASGI синхронное представление выполняется в потоке, поэтому каждый
+запрос — переход из цикла событий в поток и обратно. Эти представления
+выполняются прямо в цикле событий: данные читаются асинхронным API ORM,
+кеш — через async_support.py, а всё, что шаблону нужно из базы или кеша
+(пользователь, счётчик уведомлений, копии изображений, количество уроков),
+загружается до отрисовки — сама отрисовка ввода-вывода не выполняет.
+Свежая копия страницы из кеша (см. page_cache.py) отдаётся анонимному
+посетителю вообще без перехода в поток.
+
+Какие представления использовать, определяет настройка
+``settings.KYBERAPP_ASYNC_VIEWS``:
+- ``ENABLED`` — подключить асинхронные версии в urls.py (``False``;
+  kyberprotect/asgi.py по умолчанию включает их переменной окружения
+  ``KYBERAPP_ASYNC_VIEWS=1``).
+"""
+from django.conf import settings
+from django.shortcuts import render
+
+from . import async_support
+from .images import aprefetch_variants
+from .inbox import aget_unread_count
+from .models import Lesson, News, Test, UserAchievement
+from .page_cache import cache_public_page
+from .pagination import KeysetPaginator
+
+DEFAULTS = {
+    'ENABLED': False,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_ASYNC_VIEWS', {})}
+
+
+def is_enabled():
+    return get_config()['ENABLED']
+
+
+async def _prepare(request):
+    """
+    Загружает пользователя и счётчик непрочитанных уведомлений для шапки.
+    """
+    user = await async_support.aload_user(request)
+    if user.is_authenticated:
+        # Значение берёт context_processors.notifications.
+        request.unread_notifications = await aget_unread_count(user)
+    return user
+
+
+@cache_public_page('news_list', params=('cursor',))
+async def home(request):
+    await _prepare(request)
+    paginator = KeysetPaginator(News.objects.filter(is_published=True), 6,
+                                ordering=('-created_at', '-id'))
+    page_obj = await paginator.aget_page(request.GET.get('cursor'))
+    await aprefetch_variants(news_item.image for news_item in page_obj)
+    return render(request, "kyberapp/home.html", {"page_obj": page_obj})
+
+
+@cache_public_page('news:{pk}', params=())
+async def news_detail(request, pk):
+    await _prepare(request)
+    news_item = await async_support.aget_object_or_404(News.objects.all(), pk=pk)
+    await aprefetch_variants([news_item.image])
+    return render(request, 'kyberapp/news_detail.html', {'news_item': news_item})
+
+
+@cache_public_page('lessons', params=('cursor',))
+async def lessons(request):
+    await _prepare(request)
+    paginator = KeysetPaginator(Lesson.objects.all(), 10, ordering=('created_at', 'id'),
+                                count_cache_key='kyberapp:lessons_count')
+    page_obj = await paginator.aget_page(request.GET.get('cursor'))
+    await paginator.aget_approximate_count()
+    await aprefetch_variants(lesson.image for lesson in page_obj)
+    return render(request, "kyberapp/lessons.html", {'page_obj': page_obj})
+
+
+async def lesson_detail(request, lesson_id):
+    """
+    Асинхронная версия ``views.lesson_detail``.
+    """
+    user = await _prepare(request)
+    lesson = await async_support.aget_object_or_404(Lesson.objects.all(), id=lesson_id)
+    test_id = await (Test.objects.filter(lesson_id=lesson.pk).order_by('pk')
+                     .values_list('pk', flat=True).afirst())
+    if test_id is None:
+        test_link = None
+    elif user.is_authenticated:
+        test_link = f"/test/{test_id}/"
+    else:
+        test_link = f"/login/?next=/test/{test_id}/"
+    return render(request, "kyberapp/lesson_detail.html", {'lesson': lesson, 'test_link': test_link})
+
+
+async def achievements(request):
+    """
+    Асинхронная версия ``views.achievements``. Достижения читаются вместе
+    с названиями одним запросом, чтобы шаблон не обращался к базе.
+    """
+    user = await _prepare(request)
+    user_achievements = [user_achievement async for user_achievement in
+                         UserAchievement.objects.filter(user=user).select_related('achievement')]
+    return render(request, "kyberapp/achievements.html", {'user_achievements': user_achievements})
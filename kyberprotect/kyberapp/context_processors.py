@@ -0,0 +1,16 @@
+from .inbox import get_unread_count
+
+
+def notifications(request):
+    """
+    Добавляет в контекст шаблонов количество непрочитанных уведомлений.
+    Значение вычисляется, только если шаблон его использует, и берётся
+    из кеша (см. inbox.py).
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'unread_notifications': 0}
+    # Асинхронные представления считают значение заранее (см. async_views.py).
+    if hasattr(request, 'unread_notifications'):
+        return {'unread_notifications': request.unread_notifications}
+    return {'unread_notifications': lambda: get_unread_count(user)}
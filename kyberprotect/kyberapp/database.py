@@ -0,0 +1,117 @@
+"""
+Настройка SQLite для работы под нагрузкой.
+
+При открытии каждого соединения (сигнал ``connection_created``, подключается
+в apps.py) выполняются PRAGMA из настроек:
+- ``journal_mode=wal`` — читатели не блокируют писателя и наоборот; режим
+  сохраняется в файле базы, рядом появляются файлы ``-wal`` и ``-shm``;
+- ``synchronous=normal`` — в режиме WAL база остаётся целостной, при
+  отключении питания могут потеряться лишь последние транзакции;
+- ``mmap_size``, ``cache_size``, ``temp_store`` — чтение через отображение
+  файла в память и больший кеш страниц;
+- ``busy_timeout`` — сколько миллисекунд ждать блокировку записи, прежде чем
+  вернуть «database is locked».
+
+Соединения переиспользуются между запросами через ``CONN_MAX_AGE``
+в ``settings.DATABASES``. Если блокировку дождаться не удалось (или
+транзакция, начавшаяся с чтения, не может перейти к записи — в этом случае
+SQLite не ждёт вовсе), транзакцию записи повторяет декоратор
+``retry_on_locked`` с экспоненциальной паузой.
+
+Настройки (``settings.KYBERAPP_SQLITE``):
+- ``ENABLED`` — выполнять PRAGMA при открытии соединения (``True``);
+- ``PRAGMAS`` — словарь PRAGMA и значений (см. ``DEFAULTS``);
+- ``RETRY_ATTEMPTS`` — попыток транзакции записи, включая первую (5);
+- ``RETRY_DELAY`` — пауза перед первым повтором, секунды (0.05); далее
+  удваивается, со случайным разбросом;
+- ``RETRY_MAX_DELAY`` — наибольшая пауза, секунды (1.0).
+"""
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'PRAGMAS': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        # Отрицательное значение — размер в КиБ, а не в страницах.
+        'cache_size': -32 * 1024,
+        'temp_store': 'memory',
+    },
+    'RETRY_ATTEMPTS': 5,
+    'RETRY_DELAY': 0.05,
+    'RETRY_MAX_DELAY': 1.0,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_SQLITE', {})}
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    Обработчик ``connection_created``: выполняет PRAGMA для соединений SQLite.
+    """
+    config = get_config()
+    if connection.vendor != 'sqlite' or not config['ENABLED']:
+        return
+    with connection.cursor() as cursor:
+        for name, value in config['PRAGMAS'].items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked_error(error):
+    """
+    Возвращает ``True``, если ошибка — занятая блокировка SQLite
+    («database is locked», «database table is locked»).
+    """
+    return isinstance(error, OperationalError) and 'is locked' in str(error)
+
+
+def retry_on_locked(func=None, *, using=None):
+    """
+    Декоратор: повторяет функцию, если база занята другой записью.
+
+    Функция должна сама открывать транзакцию (или выполнять один запрос
+    в режиме автофиксации): при ошибке транзакция откатывается целиком
+    и выполняется заново. Внутри внешней транзакции повторов нет — ошибка
+    передаётся наружу, повторять нужно внешнюю транзакцию.
+
+    Пример::
+
+        @retry_on_locked
+        def save_results(test_results):
+            with transaction.atomic():
+                ...
+    """
+    if func is None:
+        return functools.partial(retry_on_locked, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if transaction.get_connection(using).in_atomic_block:
+            return func(*args, **kwargs)
+        config = get_config()
+        for attempt in range(1, config['RETRY_ATTEMPTS'] + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if attempt >= config['RETRY_ATTEMPTS'] or not is_locked_error(error):
+                    raise
+                # Случайная пауза, чтобы повторы не столкнулись снова.
+                delay = min(config['RETRY_MAX_DELAY'], config['RETRY_DELAY'] * 2 ** (attempt - 1))
+                delay = random.uniform(delay / 2, delay)
+                logger.info('%s: база занята (%s), повтор %s через %.3f с',
+                            func.__qualname__, error, attempt, delay)
+                time.sleep(delay)
+
+    return wrapper
@@ -0,0 +1,199 @@
+"""
+Выгрузка результатов тестов для анализа.
+
+Наборы данных (``DATASETS``):
+- ``results`` — результаты тестов (``TestResult``);
+- ``history`` — история прохождений (``UserTest``);
+- ``answers`` — правильность ответа на каждый вопрос теста: строка на
+  вопрос каждого результата с сохранённым выбором ответов
+  (``TestResult.selected_answers``, см. ``selections.py``). Правильность
+  считается по текущему ключу теста (``grading.get_answer_key``);
+  вопрос без ответа — неверный.
+
+Строки читаются с реплики (``routers.reporting``) через
+``iterator(chunk_size=...)`` — на PostgreSQL это курсор на стороне
+сервера — и сразу пишутся в файл, поэтому память не зависит от размера
+таблиц: CSV пишется построчно, Parquet и Arrow (формат файла Arrow IPC,
+он же Feather 2) — пачками по ``chunk_size`` строк. Для Parquet и Arrow
+нужен пакет ``pyarrow``.
+
+Используется командой ``manage.py export_results``; статистика по
+выгруженным файлам — ``analytics.py``.
+
+Настройки (``settings.KYBERAPP_EXPORT``):
+- ``CHUNK_SIZE`` — строк в одной выборке и одной пачке файла (2000).
+"""
+import csv
+import os
+
+from django.conf import settings
+
+from .grading import get_answer_key
+from .models import TestResult, UserTest
+from .routers import reporting
+from .selections import decode_selection
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - pyarrow необязателен
+    pyarrow = None
+
+DEFAULTS = {
+    'CHUNK_SIZE': 2000,
+}
+
+FORMATS = ('csv', 'parquet', 'arrow')
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Набор данных -> колонки (имя, тип). Типы: int, bool, datetime.
+DATASETS = {
+    'results': [('id', 'int'), ('user_id', 'int'), ('test_id', 'int'), ('lesson_id', 'int'),
+                ('score', 'int'), ('total_points', 'int'), ('passed', 'bool')],
+    'history': [('id', 'int'), ('user_id', 'int'), ('test_id', 'int'), ('score', 'int'),
+                ('completed_at', 'datetime')],
+    'answers': [('result_id', 'int'), ('user_id', 'int'), ('test_id', 'int'),
+                ('question_id', 'int'), ('correct', 'bool')],
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_EXPORT', {})}
+
+
+def _result_rows(chunk_size, test_ids):
+    results = TestResult.objects.order_by('pk')
+    if test_ids:
+        results = results.filter(test_id__in=test_ids)
+    yield from results.values_list('pk', 'user_id', 'test_id', 'test__lesson_id', 'score',
+                                   'test__total_points', 'passed').iterator(chunk_size=chunk_size)
+
+
+def _history_rows(chunk_size, test_ids):
+    history = UserTest.objects.order_by('pk')
+    if test_ids:
+        history = history.filter(test_id__in=test_ids)
+    yield from history.values_list('pk', 'user_id', 'test_id', 'score',
+                                   'completed_at').iterator(chunk_size=chunk_size)
+
+
+def _answer_rows(chunk_size, test_ids):
+    results = TestResult.objects.filter(selected_answers__isnull=False).order_by('pk')
+    if test_ids:
+        results = results.filter(test_id__in=test_ids)
+    for result_id, user_id, test_id, selected_answers in (
+            results.values_list('pk', 'user_id', 'test_id', 'selected_answers')
+            .iterator(chunk_size=chunk_size)):
+        # Ключ хранится в памяти процесса: запросы — один раз на тест.
+        question_results = get_answer_key(test_id).question_results(
+            decode_selection(selected_answers))
+        for question_id, correct in question_results.items():
+            yield result_id, user_id, test_id, question_id, correct
+
+
+ROWS = {'results': _result_rows, 'history': _history_rows, 'answers': _answer_rows}
+
+
+def iter_rows(dataset, chunk_size=None, test_ids=None):
+    """
+    Строки набора данных по порядку первичного ключа (у ``answers`` — ID результата).
+
+    Параметры:
+    dataset: имя набора из ``DATASETS``.
+    chunk_size: строк в одной выборке из базы (по умолчанию ``CHUNK_SIZE``).
+    test_ids: выгрузить только результаты этих тестов.
+
+    Возвращает:
+    Генератор кортежей в порядке колонок ``DATASETS[dataset]``.
+    """
+    return ROWS[dataset](chunk_size or get_config()['CHUNK_SIZE'], test_ids)
+
+
+def write_csv(rows, columns, stream):
+    """
+    Пишет строки в CSV с заголовком; логические значения — 0/1, время — ISO 8601.
+
+    Возвращает:
+    Количество строк.
+    """
+    writer = csv.writer(stream)
+    writer.writerow([name for name, kind in columns])
+    converters = [int if kind == 'bool' else (lambda value: value.isoformat())
+                  if kind == 'datetime' else None for name, kind in columns]
+    count = 0
+    for row in rows:
+        writer.writerow([value if convert is None or value is None else convert(value)
+                         for convert, value in zip(converters, row)])
+        count += 1
+    return count
+
+
+def _arrow_schema(columns):
+    types = {'int': pyarrow.int64(), 'bool': pyarrow.bool_(),
+             'datetime': pyarrow.timestamp('us', tz='UTC')}
+    return pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+
+def write_arrow(rows, columns, path, file_format='parquet', chunk_size=None):
+    """
+    Пишет строки в файл Parquet или Arrow IPC пачками по ``chunk_size`` строк.
+
+    Возвращает:
+    Количество строк.
+    """
+    if pyarrow is None:
+        raise ValueError('Для выгрузки в Parquet и Arrow требуется пакет pyarrow')
+    chunk_size = chunk_size or get_config()['CHUNK_SIZE']
+    schema = _arrow_schema(columns)
+    if file_format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    else:
+        writer = pyarrow.ipc.new_file(path, schema)
+    count = 0
+    with writer:
+        batch = [[] for _ in columns]
+        for row in rows:
+            for values, value in zip(batch, row):
+                values.append(value)
+            count += 1
+            if len(batch[0]) >= chunk_size:
+                writer.write_batch(pyarrow.record_batch(batch, schema=schema))
+                batch = [[] for _ in columns]
+        if batch[0] or not count:
+            writer.write_batch(pyarrow.record_batch(batch, schema=schema))
+    return count
+
+
+def export(directory, datasets=None, file_format='csv', chunk_size=None, test_ids=None):
+    """
+    Выгружает наборы данных в каталог: файл ``<набор>.<формат>`` на набор.
+
+    Параметры:
+    directory: каталог для файлов (создаётся при необходимости).
+    datasets: имена наборов (по умолчанию все).
+    file_format: ``csv``, ``parquet`` или ``arrow``.
+    chunk_size: строк в выборке из базы и в пачке файла.
+    test_ids: выгрузить только результаты этих тестов.
+
+    Возвращает:
+    Словарь: имя набора -> (путь к файлу, количество строк).
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f'Неизвестный формат: {file_format}')
+    if file_format != 'csv' and pyarrow is None:
+        raise ValueError('Для выгрузки в Parquet и Arrow требуется пакет pyarrow')
+    os.makedirs(directory, exist_ok=True)
+    exported = {}
+    with reporting():
+        for dataset in datasets or DATASETS:
+            columns = DATASETS[dataset]
+            rows = iter_rows(dataset, chunk_size, test_ids)
+            path = os.path.join(directory, dataset + EXTENSIONS[file_format])
+            if file_format == 'csv':
+                with open(path, 'w', encoding='utf-8', newline='') as stream:
+                    count = write_csv(rows, columns, stream)
+            else:
+                count = write_arrow(rows, columns, path, file_format, chunk_size)
+            exported[dataset] = (path, count)
+    return exported
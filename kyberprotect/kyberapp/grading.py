@@ -0,0 +1,186 @@
+"""
+Проверка ответов на тесты по заранее скомпилированному ключу.
+
+Ключ теста (``AnswerKey``) собирается из базы один раз и хранится в памяти
+процесса, пока вопросы и ответы теста не изменятся (см. ``signals.py``
+и ``versions.py``).
+Сама проверка отправленной формы не обращается к базе данных.
+"""
+import threading
+from dataclasses import dataclass
+
+from .models import Answer, Question
+from .routers import primary
+from .selections import encode_selection
+from .versions import get_version
+
+
+@dataclass(frozen=True)
+class QuestionKey:
+    """
+    Ключ одного вопроса: тип вопроса, ID правильных ответов и всех ответов.
+    """
+    question_type: str
+    correct_ids: frozenset
+    answer_ids: frozenset
+
+    def is_correct(self, selected):
+        """
+        Проверяет выбранные пользователем ответы (список строк из POST).
+
+        Повторяет прежнюю логику ``take_test``: для вопроса с одним ответом
+        верным считается первый (по ID) правильный ответ, для вопроса
+        с несколькими ответами набор выбранных ответов должен точно
+        совпадать с набором правильных.
+        """
+        if not self.correct_ids:
+            return False
+        if self.question_type == 'one':
+            return len(selected) == 1 and selected[0] == str(min(self.correct_ids))
+        if self.question_type == 'multiple':
+            return sorted(selected) == sorted(str(answer_id) for answer_id in self.correct_ids)
+        return False
+
+
+@dataclass(frozen=True)
+class AnswerKey:
+    """
+    Неизменяемый ключ теста: ID вопроса -> ``QuestionKey``, а также
+    наименьший и наибольший ID ответов теста (диапазон маски выбора,
+    см. ``selections.py``).
+    """
+    test_id: int
+    questions: dict
+    first_answer_id: int = None
+    last_answer_id: int = None
+
+    def grade(self, data):
+        """
+        Считает количество верно отвеченных вопросов за один проход.
+
+        Параметры:
+        data: QueryDict (или любой объект с методом ``getlist``) с ответами
+              в полях ``question_<id>``.
+
+        Возвращает:
+        Количество вопросов, на которые дан правильный ответ.
+        """
+        score = 0
+        for question_id, question_key in self.questions.items():
+            if question_key.is_correct(data.getlist(f'question_{question_id}')):
+                score += 1
+        return score
+
+    def selected_ids(self, data):
+        """
+        ID выбранных ответов из формы; значения, не являющиеся ответами
+        своего вопроса, отбрасываются.
+        """
+        selected = set()
+        for question_id, question_key in self.questions.items():
+            for value in data.getlist(f'question_{question_id}'):
+                if value.isdigit() and int(value) in question_key.answer_ids:
+                    selected.add(int(value))
+        return sorted(selected)
+
+    def encode_selection(self, data):
+        """
+        Упаковывает выбранные в форме ответы для ``TestResult.selected_answers``.
+        """
+        return encode_selection(self.selected_ids(data), self.first_answer_id,
+                                self.last_answer_id)
+
+    def question_results(self, answer_ids):
+        """
+        Правильность ответа на каждый вопрос по ID выбранных ответов
+        (например, из ``selections.decode_selection``).
+
+        Возвращает:
+        Словарь: ID вопроса -> ``True``, если ответ верный.
+        """
+        answer_ids = set(answer_ids)
+        return {
+            question_id: question_key.is_correct(
+                [str(answer_id) for answer_id in sorted(question_key.answer_ids & answer_ids)])
+            for question_id, question_key in self.questions.items()
+        }
+
+
+_answer_keys = {}  # ID теста -> (версия содержимого, AnswerKey)
+_lock = threading.Lock()
+
+
+def compile_answer_key(test_id):
+    """
+    Собирает ключ теста из базы данных двумя запросами.
+    """
+    correct = {}
+    for question_id, question_type in (Question.objects.filter(test_id=test_id)
+                                       .order_by('id')
+                                       .values_list('id', 'question_type')):
+        correct[question_id] = (question_type, set(), set())
+
+    for question_id, answer_id, is_correct in (Answer.objects.filter(question__test_id=test_id)
+                                               .values_list('question_id', 'id', 'is_correct')):
+        correct[question_id][2].add(answer_id)
+        if is_correct:
+            correct[question_id][1].add(answer_id)
+
+    all_ids = [answer_id for _, _, answer_ids in correct.values() for answer_id in answer_ids]
+    return AnswerKey(
+        test_id=test_id,
+        questions={
+            question_id: QuestionKey(question_type, frozenset(correct_ids), frozenset(answer_ids))
+            for question_id, (question_type, correct_ids, answer_ids) in correct.items()
+        },
+        first_answer_id=min(all_ids, default=None),
+        last_answer_id=max(all_ids, default=None),
+    )
+
+
+def get_answer_key(test_id):
+    """
+    Возвращает ключ теста из кеша процесса, при необходимости собирая его.
+
+    Ключ действителен, пока не изменилась версия содержимого теста
+    (``versions.get_version('test', test_id)``), поэтому изменения, сделанные
+    в другом процессе, тоже учитываются при общем бэкенде кеша.
+    """
+    version = get_version('test', test_id)
+    cached = _answer_keys.get(test_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    # Реплика может отставать от версии: ключ собирается по основной базе.
+    with primary():
+        answer_key = compile_answer_key(test_id)
+    with _lock:
+        _answer_keys[test_id] = (version, answer_key)
+    return answer_key
+
+
+def invalidate_answer_key(test_id=None):
+    """
+    Сбрасывает ключ теста (или все ключи, если ``test_id`` не указан)
+    в кеше текущего процесса.
+    """
+    with _lock:
+        if test_id is None:
+            _answer_keys.clear()
+        else:
+            _answer_keys.pop(test_id, None)
+
+
+def grade_submission(test, data):
+    """
+    Проверяет ответы пользователя на тест.
+
+    Параметры:
+    test: объект Test или его ID.
+    data: QueryDict с ответами пользователя.
+
+    Возвращает:
+    Количество правильно отвеченных вопросов.
+    """
+    test_id = getattr(test, 'pk', test)
+    return get_answer_key(test_id).grade(data)
@@ -0,0 +1,263 @@
+"""
+Уменьшенные копии загруженных изображений.
+
+Аватары, картинки уроков и новостей и иконки достижений загружаются
+в исходном размере, а на страницах показываются миниатюрами. После
+сохранения объекта (и фиксации транзакции) фоновый пул потоков создаёт
+копии исходника нужной ширины в форматах WebP и JPEG. Имена копий строятся
+из хеша содержимого исходника (``variants/ab/<хеш>-360w.webp``), поэтому
+файл по имени никогда не меняется: его можно отдавать с
+``Cache-Control: immutable``, а одинаковые исходники делят одни копии.
+
+Список копий хранится в ``ImageDerivative`` и кешируется; тег шаблона
+``{% responsive_image %}`` (templatetags/images.py) строит по нему
+``<picture>`` с ``srcset``, а пока копий нет — обычный ``<img>``
+с исходным файлом. Уже загруженные изображения обрабатывает команда
+``manage.py generate_image_variants``.
+
+Настройки (``settings.KYBERAPP_IMAGES``):
+- ``ENABLED`` — создавать копии при сохранении (``True``);
+- ``ASYNC`` — создавать копии в фоновом пуле потоков (``True``);
+- ``WORKERS`` — потоков в пуле (2);
+- ``FORMATS`` — форматы копий (``('webp', 'jpeg')``);
+- ``QUALITY`` — качество сжатия (80);
+- ``SIZES`` — ширины копий по видам изображений.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import async_support
+from .models import Achievement, CustomUser, ImageDerivative, Lesson, News
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ASYNC': True,
+    'WORKERS': 2,
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'SIZES': {
+        'avatar': (48, 96, 192),
+        'lesson': (360, 720, 1080),
+        'news': (360, 720, 1080),
+        'achievement': (64, 128, 256),
+    },
+}
+
+PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+MISSING_TIMEOUT = 5 * 60
+
+_executor = None
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_IMAGES', {})}
+
+
+def _manifest_key(name):
+    return f'kyberapp:image:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+def get_variants(name):
+    """
+    Возвращает список копий изображения (словари с ключами ``format``,
+    ``width``, ``height``, ``name``) или пустой список, если копий нет.
+    """
+    if not name:
+        return []
+    key = _manifest_key(name)
+    variants = cache.get(key)
+    if variants is None:
+        variants = (ImageDerivative.objects.filter(source=name)
+                    .values_list('variants', flat=True).first())
+        # Отсутствие копий тоже кешируем, но ненадолго.
+        cache.set(key, variants or [], None if variants else MISSING_TIMEOUT)
+        variants = variants or []
+    return variants
+
+
+async def aprefetch_variants(images):
+    """
+    Загружает списки копий изображений страницы одним обращением к кешу
+    (и одним запросом к базе для отсутствующих в кеше) и сохраняет их
+    в атрибуте ``prefetched_variants``, чтобы тег ``responsive_image``
+    при отрисовке не обращался ни к кешу, ни к базе.
+    """
+    images = [image for image in images if image]
+    names = {_manifest_key(image.name): image.name for image in images}
+    cached = await async_support.aget_many(list(names))
+    manifests = {names[key]: variants for key, variants in cached.items()}
+    missing = {name for name in names.values() if name not in manifests}
+    if missing:
+        found = {source: variants async for source, variants in ImageDerivative.objects
+                 .filter(source__in=missing).values_list('source', 'variants')}
+        manifests.update(found)
+        if found:
+            await async_support.aset_many({_manifest_key(name): variants
+                                           for name, variants in found.items()}, None)
+        absent = missing - found.keys()
+        if absent:
+            await async_support.aset_many({_manifest_key(name): [] for name in absent},
+                                          MISSING_TIMEOUT)
+    for image in images:
+        image.prefetched_variants = manifests.get(image.name) or []
+
+
+def variant_name(digest, width, image_format):
+    extension = 'jpg' if image_format == 'jpeg' else image_format
+    return f'variants/{digest[:2]}/{digest}-{width}w.{extension}'
+
+
+def _target_widths(widths, source_width):
+    # Исходник не увеличиваем: вместо более широких копий делаем одну
+    # в исходную ширину — перекодирование всё равно уменьшает файл.
+    targets = {width for width in widths if width < source_width}
+    if len(targets) < len(set(widths)):
+        targets.add(source_width)
+    return sorted(targets)
+
+
+def _encode(image, image_format, quality):
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        # В JPEG нет прозрачности — кладём изображение на белый фон.
+        background = Image.new('RGB', image.size, 'white')
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    options = {'quality': quality}
+    if image_format == 'jpeg':
+        options.update(optimize=True, progressive=True)
+    else:
+        options['method'] = 4
+    image.save(buffer, PIL_FORMATS[image_format], **options)
+    return buffer.getvalue()
+
+
+def generate_variants(name, kind, force=False):
+    """
+    Создаёт копии изображения и сохраняет их список.
+
+    Параметры:
+    name: имя исходного файла в хранилище (``FieldFile.name``).
+    kind: вид изображения — ключ ``SIZES`` (``'lesson'``, ``'news'``...).
+    force: пересоздать копии, даже если они уже есть.
+
+    Возвращает:
+    Объект ``ImageDerivative`` или ``None``, если исходник не удалось прочитать.
+    """
+    config = get_config()
+    if not force and get_variants(name):
+        return ImageDerivative.objects.filter(source=name).first()
+    try:
+        with default_storage.open(name, 'rb') as source:
+            content = source.read()
+        image = Image.open(io.BytesIO(content))
+        image = ImageOps.exif_transpose(image)
+    except (OSError, UnidentifiedImageError) as error:
+        logger.warning('Не удалось прочитать изображение %s: %s', name, error)
+        return None
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode
+                              else 'RGB')
+
+    # Параметры сжатия входят в хеш: при их смене копии получат новые имена.
+    digest = hashlib.sha1(content + f':{config["QUALITY"]}'.encode()).hexdigest()[:20]
+    variants = []
+    # От широких копий к узким: каждую следующую уменьшаем из предыдущей,
+    # а не из исходника — для больших исходников это в разы быстрее.
+    resized = image
+    for width in reversed(_target_widths(config['SIZES'][kind], image.width)):
+        height = max(1, round(image.height * width / image.width))
+        names = {image_format: variant_name(digest, width, image_format)
+                 for image_format in config['FORMATS']}
+        if force or not all(default_storage.exists(target) for target in names.values()):
+            if width != resized.width:
+                # reducing_gap: сначала быстрое уменьшение в целое число раз, затем LANCZOS.
+                resized = resized.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+            for image_format, target in names.items():
+                if default_storage.exists(target):
+                    default_storage.delete(target)
+                names[image_format] = default_storage.save(
+                    target, ContentFile(_encode(resized, image_format, config['QUALITY'])))
+        variants[:0] = [{'format': image_format, 'width': width, 'height': height,
+                         'name': target} for image_format, target in names.items()]
+
+    derivative, _ = ImageDerivative.objects.update_or_create(
+        source=name,
+        defaults={'digest': digest, 'width': image.width, 'height': image.height,
+                  'variants': variants},
+    )
+    cache.set(_manifest_key(name), variants, None)
+    return derivative
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=get_config()['WORKERS'],
+                                       thread_name_prefix='kyberapp-images')
+    return _executor
+
+
+def _run(name, kind, on_ready):
+    try:
+        if generate_variants(name, kind) and on_ready:
+            on_ready()
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s', name)
+
+
+def _run_in_pool(name, kind, on_ready):
+    try:
+        _run(name, kind, on_ready)
+    finally:
+        # У потока пула свои соединения с базой — закрываем их.
+        connections.close_all()
+
+
+def schedule_variants(image, kind, on_ready=None):
+    """
+    Запускает создание копий изображения после фиксации транзакции.
+
+    Параметры:
+    image: значение поля ``ImageField``.
+    kind: вид изображения — ключ ``SIZES``.
+    on_ready: функция без аргументов, вызываемая после создания копий
+              (например, сброс кеша страниц).
+    """
+    config = get_config()
+    if not config['ENABLED'] or not image or get_variants(image.name):
+        return
+    name = image.name
+
+    def submit():
+        if config['ASYNC']:
+            _get_executor().submit(_run_in_pool, name, kind, on_ready)
+        else:
+            _run(name, kind, on_ready)
+
+    transaction.on_commit(submit)
+
+
+def image_fields():
+    """
+    Возвращает пары (QuerySet, поле, вид) всех изображений, для которых
+    создаются копии.
+    """
+    return [
+        (CustomUser.objects.exclude(avatar='').exclude(avatar=None), 'avatar', 'avatar'),
+        (Lesson.objects.exclude(image=''), 'image', 'lesson'),
+        (News.objects.exclude(image='').exclude(image=None), 'image', 'news'),
+        (Achievement.objects.exclude(icon=''), 'icon', 'achievement'),
+    ]
@@ -0,0 +1,472 @@
+"""
+Массовый импорт тестов с вопросами и вариантами ответов.
+
+Каждый тест описывается записью вида::
+
+    {"external_id": "phishing-1", "lesson_id": 3, "title": "Фишинг",
+     "is_active": true,
+     "questions": [
+         {"external_id": "q1", "question_text": "...", "question_type": "one",
+          "answers": [{"external_id": "a1", "answer_text": "...", "is_correct": true},
+                      ...]},
+         ...]}
+
+Поддерживаемые форматы: JSON (список записей или ``{"tests": [...]}``),
+JSON Lines (запись в строке), YAML (один или несколько документов,
+требуется PyYAML) и CSV (строка на вариант ответа, строки одного теста
+и одного вопроса идут подряд; колонки см. ``CSV_COLUMNS``).
+
+Записи читаются и проверяются по одной, поэтому файлы любого формата
+не загружаются в память целиком: JSON разбирается потоково
+(``JSONArrayReader``) — в памяти только текущая запись и буфер чтения.
+Каждый тест сохраняется в отдельной транзакции: тест — обычным
+``save()``, вопросы и ответы — ``bulk_create`` пачками. В режиме обновления (``upsert``) тесты, вопросы и ответы
+сопоставляются по ``external_id``; лишние вопросы и ответы удаляются,
+поэтому повторный импорт того же файла ничего не меняет.
+"""
+import csv
+import itertools
+import json
+import os
+
+from django.db import transaction
+
+from .grading import invalidate_answer_key
+from .models import Answer, Lesson, Question, Test
+from .search import index_objects
+from .versions import bump_version
+
+FORMATS = ('json', 'jsonl', 'yaml', 'csv')
+EXTENSIONS = {'.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl',
+              '.yaml': 'yaml', '.yml': 'yaml', '.csv': 'csv'}
+
+CSV_COLUMNS = ('test_external_id', 'lesson_id', 'test_title', 'test_is_active',
+               'question_external_id', 'question_text', 'question_type',
+               'answer_external_id', 'answer_text', 'is_correct')
+
+QUESTION_TYPES = {value for value, label in Question._meta.get_field('question_type').choices}
+TRUE_STRINGS = {'1', 'true', 'yes', 'да', '+'}
+
+
+class ImportValidationError(ValueError):
+    """
+    Запись теста не прошла проверку.
+    """
+
+
+def detect_format(path):
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def read_records(path, file_format=None):
+    """
+    Читает записи тестов из файла.
+
+    Возвращает:
+    Итератор пар (место в файле, запись) — место используется в сообщениях
+    об ошибках.
+    """
+    file_format = file_format or detect_format(path)
+    if file_format not in FORMATS:
+        raise ValueError(f'Неизвестный формат файла {path}')
+    readers = {'json': _read_json, 'jsonl': _read_jsonl, 'yaml': _read_yaml, 'csv': _read_csv}
+    with open(path, encoding='utf-8', newline='' if file_format == 'csv' else None) as stream:
+        yield from readers[file_format](path, stream)
+
+
+class JSONArrayReader:
+    """
+    Потоковое чтение записей JSON-документа: элементов массива верхнего
+    уровня или массива ``tests`` объекта верхнего уровня. Объект без
+    ``tests`` считается одной записью.
+
+    Файл читается блоками по ``CHUNK_SIZE`` символов; каждая запись
+    разбирается ``json.JSONDecoder.raw_decode``, после чего прочитанная
+    часть буфера отбрасывается.
+    """
+    CHUNK_SIZE = 64 * 1024
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.stream.read(self.CHUNK_SIZE)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        self.eof = not chunk
+        return bool(chunk)
+
+    def _peek(self):
+        """
+        Следующий значимый символ (пустая строка в конце файла).
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in self.WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer) or not self._fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f'некорректный JSON: ожидается {" или ".join(chars)}, '
+                             f'получено {char or "конец файла"}')
+        self.position += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as error:
+                if self.eof or not self._fill():
+                    raise ValueError(f'некорректный JSON: {error}')
+                continue
+            # Число в конце буфера может продолжаться в следующем блоке.
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.position = end
+            return value
+
+    def _array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(',]') == ']':
+                return
+
+    def __iter__(self):
+        if self._peek() != '{':
+            yield from self._array()
+        else:
+            self.position += 1
+            record, streamed = {}, False
+            while self._peek() != '}':
+                if record or streamed:
+                    self._expect(',')
+                key = self._value()
+                if not isinstance(key, str):
+                    raise ValueError('некорректный JSON: ключ объекта должен быть строкой')
+                self._expect(':')
+                if key == 'tests' and self._peek() == '[':
+                    streamed = True
+                    yield from self._array()
+                else:
+                    record[key] = self._value()
+            self.position += 1
+            if not streamed:
+                yield record
+        if self._peek():
+            raise ValueError('некорректный JSON: лишние данные после документа')
+
+
+def _read_json(path, stream):
+    for number, record in enumerate(JSONArrayReader(stream), 1):
+        yield f'{path}[{number}]', record
+
+
+def _read_jsonl(path, stream):
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        location = f'{path}:{line_number}'
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            record = ImportValidationError(f'некорректный JSON: {error}')
+        yield location, record
+
+
+def _read_yaml(path, stream):
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError('Для импорта YAML требуется пакет PyYAML')
+    number = 0
+    for document in yaml.safe_load_all(stream):
+        for record in document if isinstance(document, list) else [document]:
+            number += 1
+            yield f'{path}[{number}]', record
+
+
+def _read_csv(path, stream):
+    reader = csv.DictReader(stream)
+    missing = set(CSV_COLUMNS) - {'test_external_id', 'test_is_active',
+                                  'question_external_id', 'answer_external_id'} \
+        - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f'В {path} нет колонок: {", ".join(sorted(missing))}')
+
+    def test_key(row):
+        return row.get('test_external_id') or (row['lesson_id'], row['test_title'])
+
+    def question_key(row):
+        return row.get('question_external_id') or row['question_text']
+
+    for number, (key, test_rows) in enumerate(itertools.groupby(reader, key=test_key), 1):
+        test_rows = list(test_rows)
+        first = test_rows[0]
+        record = {
+            'external_id': first.get('test_external_id') or None,
+            'lesson_id': first['lesson_id'],
+            'title': first['test_title'],
+            'questions': [],
+        }
+        if first.get('test_is_active'):
+            record['is_active'] = first['test_is_active']
+        for question_key_value, question_rows in itertools.groupby(test_rows, key=question_key):
+            question_rows = list(question_rows)
+            record['questions'].append({
+                'external_id': question_rows[0].get('question_external_id') or None,
+                'question_text': question_rows[0]['question_text'],
+                'question_type': question_rows[0]['question_type'],
+                'answers': [{'external_id': row.get('answer_external_id') or None,
+                             'answer_text': row['answer_text'],
+                             'is_correct': row['is_correct']}
+                            for row in question_rows],
+            })
+        yield f'{path}[{number}]', record
+
+
+def _text(data, field, max_length=None, required=True):
+    value = data.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ImportValidationError(f'не заполнено поле {field}')
+    if max_length and len(value) > max_length:
+        raise ImportValidationError(f'поле {field} длиннее {max_length} символов')
+    return value
+
+
+def _bool(value, default=False):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_STRINGS
+
+
+def _external_id(data, where, required):
+    value = _text(data, 'external_id', max_length=100, required=False) or None
+    if required and value is None:
+        raise ImportValidationError(f'{where}: в режиме обновления нужен external_id')
+    return value
+
+
+def validate_record(record, lesson_ids, upsert=False):
+    """
+    Проверяет запись теста и приводит значения к нужным типам.
+
+    Параметры:
+    record: запись из файла (словарь).
+    lesson_ids: множество ID существующих уроков.
+    upsert: режим обновления — все объекты должны иметь ``external_id``.
+
+    Возвращает:
+    Нормализованную запись.
+
+    Исключения:
+    ImportValidationError: запись некорректна.
+    """
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ImportValidationError('запись теста должна быть объектом')
+
+    try:
+        lesson_id = int(record.get('lesson_id', record.get('lesson')))
+    except (TypeError, ValueError):
+        raise ImportValidationError('не указан lesson_id')
+    if lesson_id not in lesson_ids:
+        raise ImportValidationError(f'урок {lesson_id} не найден')
+
+    test = {
+        'external_id': _external_id(record, 'тест', upsert),
+        'lesson_id': lesson_id,
+        'title': _text(record, 'title', max_length=255),
+        'is_active': _bool(record.get('is_active'), default=True),
+        'questions': [],
+    }
+    questions = record.get('questions')
+    if not isinstance(questions, list) or not questions:
+        raise ImportValidationError('у теста нет вопросов')
+
+    question_ids = set()
+    for number, question in enumerate(questions, 1):
+        where = f'вопрос {number}'
+        if not isinstance(question, dict):
+            raise ImportValidationError(f'{where}: должен быть объектом')
+        question_type = _text(question, 'question_type')
+        if question_type not in QUESTION_TYPES:
+            raise ImportValidationError(f'{where}: неизвестный тип {question_type!r}')
+        external_id = _external_id(question, where, upsert)
+        if external_id is not None:
+            if external_id in question_ids:
+                raise ImportValidationError(f'{where}: повторяется external_id {external_id!r}')
+            question_ids.add(external_id)
+
+        answers = question.get('answers')
+        if not isinstance(answers, list) or len(answers) < 2:
+            raise ImportValidationError(f'{where}: нужно не меньше двух вариантов ответа')
+        answer_ids = set()
+        normalized_answers = []
+        for answer_number, answer in enumerate(answers, 1):
+            answer_where = f'{where}, ответ {answer_number}'
+            if not isinstance(answer, dict):
+                raise ImportValidationError(f'{answer_where}: должен быть объектом')
+            answer_external_id = _external_id(answer, answer_where, upsert)
+            if answer_external_id is not None:
+                if answer_external_id in answer_ids:
+                    raise ImportValidationError(
+                        f'{answer_where}: повторяется external_id {answer_external_id!r}')
+                answer_ids.add(answer_external_id)
+            normalized_answers.append({
+                'external_id': answer_external_id,
+                'answer_text': _text(answer, 'answer_text', max_length=255),
+                'is_correct': _bool(answer.get('is_correct')),
+            })
+
+        correct = sum(answer['is_correct'] for answer in normalized_answers)
+        if not correct:
+            raise ImportValidationError(f'{where}: нет правильного ответа')
+        if question_type == 'one' and correct > 1:
+            raise ImportValidationError(f'{where}: у вопроса с одним ответом несколько правильных')
+
+        test['questions'].append({
+            'external_id': external_id,
+            'question_text': _text(question, 'question_text'),
+            'question_type': question_type,
+            'answers': normalized_answers,
+        })
+    return test
+
+
+def _insert_test(data, batch_size):
+    if data['external_id'] and Test.objects.filter(external_id=data['external_id']).exists():
+        raise ImportValidationError(
+            f'тест {data["external_id"]!r} уже импортирован (используйте режим обновления)')
+    test = Test.objects.create(external_id=data['external_id'], lesson_id=data['lesson_id'],
+                               title=data['title'], is_active=data['is_active'])
+    questions = Question.objects.bulk_create(
+        [Question(test=test, external_id=question['external_id'],
+                  question_text=question['question_text'],
+                  question_type=question['question_type'])
+         for question in data['questions']],
+        batch_size=batch_size,
+    )
+    if any(question.pk is None for question in questions):
+        # База не вернула ID вставленных строк — вопросы нового теста
+        # читаем заново в порядке вставки.
+        questions = list(test.questions.order_by('pk'))
+    answers = Answer.objects.bulk_create(
+        [Answer(question_id=question.pk, **answer)
+         for question, question_data in zip(questions, data['questions'])
+         for answer in question_data['answers']],
+        batch_size=batch_size,
+    )
+    return test, questions, len(answers)
+
+
+def _upsert_test(data, batch_size):
+    test, created = Test.objects.update_or_create(
+        external_id=data['external_id'],
+        defaults={'lesson_id': data['lesson_id'], 'title': data['title'],
+                  'is_active': data['is_active']},
+    )
+    Question.objects.bulk_create(
+        [Question(test=test, external_id=question['external_id'],
+                  question_text=question['question_text'],
+                  question_type=question['question_type'])
+         for question in data['questions']],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['test', 'external_id'],
+        update_fields=['question_text', 'question_type'],
+    )
+    # После вставки с обновлением ID строк известны не на всех СУБД,
+    # поэтому читаем их одним запросом.
+    existing = {external_id: pk for pk, external_id in
+                Question.objects.filter(test=test).values_list('pk', 'external_id')}
+    imported = {question['external_id'] for question in data['questions']}
+    stale = [pk for external_id, pk in existing.items() if external_id not in imported]
+    if stale:
+        Question.objects.filter(pk__in=stale).delete()
+
+    Answer.objects.bulk_create(
+        [Answer(question_id=existing[question['external_id']], **answer)
+         for question in data['questions'] for answer in question['answers']],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['question', 'external_id'],
+        update_fields=['answer_text', 'is_correct'],
+    )
+    imported_answers = {(existing[question['external_id']], answer['external_id'])
+                        for question in data['questions'] for answer in question['answers']}
+    stale = [pk for pk, question_id, external_id in
+             Answer.objects.filter(question__test=test)
+             .values_list('pk', 'question_id', 'external_id')
+             if (question_id, external_id) not in imported_answers]
+    if stale:
+        Answer.objects.filter(pk__in=stale).delete()
+
+    # Через related manager у вопросов уже есть test — индексу поиска
+    # (search.document) не нужен запрос теста на каждый вопрос.
+    questions = list(test.questions.order_by('pk'))
+    return test, questions, len(imported_answers)
+
+
+def import_tests(records, upsert=False, batch_size=500, dry_run=False):
+    """
+    Проверяет и сохраняет записи тестов.
+
+    Параметры:
+    records: итератор пар (место в файле, запись), см. ``read_records``.
+    upsert: обновлять тесты с теми же ``external_id`` вместо создания новых.
+    batch_size: размер пачки ``bulk_create``.
+    dry_run: только проверить записи, ничего не сохраняя.
+
+    Возвращает:
+    Словарь с количеством тестов, вопросов и ответов и списком ошибок
+    (место в файле, сообщение). Тесты с ошибками пропускаются.
+    """
+    lesson_ids = set(Lesson.objects.values_list('pk', flat=True))
+    stats = {'tests': 0, 'questions': 0, 'answers': 0, 'errors': []}
+    seen = set()
+    for location, record in records:
+        try:
+            data = validate_record(record, lesson_ids, upsert)
+            if data['external_id'] is not None:
+                if data['external_id'] in seen:
+                    raise ImportValidationError(
+                        f'тест {data["external_id"]!r} уже встречался в импорте')
+                seen.add(data['external_id'])
+            if dry_run:
+                answers = sum(len(question['answers']) for question in data['questions'])
+                stats['tests'] += 1
+                stats['questions'] += len(data['questions'])
+                stats['answers'] += answers
+                continue
+            with transaction.atomic():
+                save = _upsert_test if upsert else _insert_test
+                test, questions, answers = save(data, batch_size)
+                # bulk_create не вызывает сигналов — индекс поиска обновляем сами.
+                index_objects(questions)
+        except ImportValidationError as error:
+            stats['errors'].append((location, str(error)))
+            continue
+
+        bump_version('test', test.pk)
+        invalidate_answer_key(test.pk)
+        stats['tests'] += 1
+        stats['questions'] += len(questions)
+        stats['answers'] += answers
+    return stats
@@ -0,0 +1,105 @@
+"""
+Уведомления пользователя: счётчик непрочитанных и отметка о прочтении.
+
+Количество непрочитанных уведомлений хранится в кеше по пользователю
+и меняется на месте (``incr``/``decr``) при создании и прочтении
+уведомлений, поэтому шапка сайта не выполняет ``COUNT(*)`` на каждой
+странице. Если счётчика в кеше нет, он считается одним запросом по
+частичному индексу непрочитанных уведомлений (``notification_unread_idx``).
+После массового создания уведомлений (``notifications.fan_out``) счётчики
+пачки сбрасываются одной операцией кеша и пересчитываются при следующем
+чтении.
+"""
+from django.core.cache import cache
+
+from . import async_support
+from .models import Notification
+
+UNREAD_TIMEOUT = 60 * 60
+
+
+def _unread_key(user_id):
+    return f'kyberapp:unread:{user_id}'
+
+
+def get_unread_count(user):
+    """
+    Возвращает количество непрочитанных уведомлений пользователя.
+
+    Параметры:
+    user: пользователь или его ID.
+    """
+    user_id = getattr(user, 'pk', user)
+    key = _unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        # add, а не set: параллельный incr/decr уже мог создать более свежее значение.
+        cache.add(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+async def aget_unread_count(user):
+    """
+    Асинхронная версия ``get_unread_count``.
+    """
+    user_id = getattr(user, 'pk', user)
+    key = _unread_key(user_id)
+    count = await async_support.aget(key)
+    if count is None:
+        count = await Notification.objects.filter(user_id=user_id, is_read=False).acount()
+        await async_support.aadd(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+def _adjust(user_id, delta):
+    key = _unread_key(user_id)
+    try:
+        if cache.incr(key, delta) < 0:
+            cache.delete(key)
+    except ValueError:
+        # Счётчика нет в кеше — он будет посчитан при следующем чтении.
+        pass
+
+
+def unread_added(user_id, count=1):
+    _adjust(user_id, count)
+
+
+def unread_removed(user_id, count=1):
+    _adjust(user_id, -count)
+
+
+def reset_unread_counts(user_ids):
+    """
+    Сбрасывает счётчики пользователей одной операцией кеша.
+    """
+    cache.delete_many([_unread_key(user_id) for user_id in user_ids])
+
+
+def mark_read(user, notification_ids):
+    """
+    Отмечает уведомления пользователя прочитанными одним UPDATE.
+
+    Возвращает:
+    Количество уведомлений, которые были непрочитанными.
+    """
+    updated = (Notification.objects
+               .filter(user_id=user.pk, pk__in=notification_ids, is_read=False)
+               .update(is_read=True))
+    if updated:
+        unread_removed(user.pk, updated)
+    return updated
+
+
+def mark_all_read(user):
+    """
+    Отмечает все уведомления пользователя прочитанными одним UPDATE.
+
+    Возвращает:
+    Количество отмеченных уведомлений.
+    """
+    updated = Notification.objects.filter(user_id=user.pk, is_read=False).update(is_read=True)
+    # Не записываем 0: уведомление могло появиться сразу после UPDATE.
+    cache.delete(_unread_key(user.pk))
+    return updated
@@ -0,0 +1,256 @@
+"""
+Рейтинги пользователей: по тесту, по уроку и общий.
+
+Места хранятся в таблице ``LeaderboardEntry`` и пересчитываются только
+для пользователей, чьи результаты или достижения изменились
+(``refresh_entries``): по тесту — лучший балл пользователя, по уроку —
+сумма лучших баллов по тестам урока, в общем рейтинге — сумма лучших
+баллов по всем тестам, а при равенстве — количество достижений.
+Страница рейтинга не агрегирует результаты всех пользователей.
+
+Для каждого рейтинга в кеше лежит небольшой снимок: первые ``TOP_K``
+мест и число участников; он живёт ``TIMEOUT`` секунд, поэтому чужие
+изменения видны в нём с такой задержкой. Место пользователя в снимок не
+входит: это его текущий ключ (балл, достижения) — запрос по уникальному
+индексу — и 1 плюс число строго лучших строк, которое считается двумя
+COUNT по диапазонам индекса ``leaderboard_rank_idx`` (``score > s`` и
+``score = s AND achievements > a``) без чтения строк таблицы. Места
+с равным ключом делят одну позицию.
+
+Команда ``manage.py rebuild_leaderboards`` пересчитывает все рейтинги
+(или с ``--check`` только ищет расхождения с результатами).
+
+Настройки (``settings.KYBERAPP_LEADERBOARD``):
+- ``TIMEOUT`` — время жизни снимка рейтинга в секундах (60);
+- ``TOP_K`` — сколько первых мест хранить в снимке и показывать (100);
+- ``PAGE_SIZE`` — мест на странице (20).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import CustomUser, LeaderboardEntry, TestResult, UserAchievement
+from .routers import primary
+from .versions import bump_version, get_version
+
+DEFAULTS = {
+    'TIMEOUT': 60,
+    'TOP_K': 100,
+    'PAGE_SIZE': 20,
+}
+
+GLOBAL = LeaderboardEntry.GLOBAL
+LESSON = LeaderboardEntry.LESSON
+TEST = LeaderboardEntry.TEST
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_LEADERBOARD', {})}
+
+
+def compute_entries(user_ids, test_ids=None):
+    """
+    Считает места пользователей по их результатам и достижениям.
+
+    Параметры:
+    test_ids: вернуть из рейтингов тестов и уроков только места этих
+              тестов и их уроков (общий рейтинг возвращается всегда).
+
+    Возвращает:
+    Словарь (рейтинг, ID урока или теста, ID пользователя) -> (балл, достижения).
+    """
+    entries = {}
+    lesson_ids = set()
+    best_scores = list(TestResult.objects.filter(user_id__in=user_ids)
+                       .values_list('user_id', 'test_id', 'test__lesson_id')
+                       .annotate(best=Max('score')).order_by())
+    if test_ids is not None:
+        lesson_ids = {lesson_id for user_id, test_id, lesson_id, best in best_scores
+                      if test_id in test_ids}
+    for user_id, test_id, lesson_id, best in best_scores:
+        if test_ids is None or test_id in test_ids:
+            entries[(TEST, test_id, user_id)] = (best, 0)
+        if test_ids is None or lesson_id in lesson_ids:
+            lesson_score = entries.get((LESSON, lesson_id, user_id), (0, 0))[0]
+            entries[(LESSON, lesson_id, user_id)] = (lesson_score + best, 0)
+        total = entries.get((GLOBAL, 0, user_id), (0, 0))[0]
+        entries[(GLOBAL, 0, user_id)] = (total + best, 0)
+    achievement_counts = (UserAchievement.objects.filter(user_id__in=user_ids)
+                          .values_list('user_id').annotate(count=Count('id')).order_by())
+    for user_id, count in achievement_counts:
+        total = entries.get((GLOBAL, 0, user_id), (0, 0))[0]
+        entries[(GLOBAL, 0, user_id)] = (total, count)
+    return entries
+
+
+def _save_entries(entries):
+    LeaderboardEntry.objects.bulk_create(
+        [LeaderboardEntry(scope=scope, object_id=object_id, user_id=user_id,
+                          score=score, achievements=achievements)
+         for (scope, object_id, user_id), (score, achievements) in entries.items()],
+        update_conflicts=True, unique_fields=['scope', 'object_id', 'user'],
+        update_fields=['score', 'achievements'],
+    )
+
+
+def refresh_entries(user_ids, test_ids=None):
+    """
+    Пересчитывает места пользователей.
+
+    Параметры:
+    user_ids: ID пользователей.
+    test_ids: ID тестов с новыми результатами: обновляются рейтинги этих
+              тестов, их уроков и общий. По умолчанию пересчитываются все
+              места пользователей, а лишние удаляются.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    entries = compute_entries(user_ids, None if test_ids is None else set(test_ids))
+    # Внутри транзакции вызывающего кода (save_results) без точки сохранения.
+    with transaction.atomic(savepoint=False):
+        if test_ids is None:
+            LeaderboardEntry.objects.filter(user_id__in=user_ids).delete()
+        _save_entries(entries)
+
+
+def refresh_entries_on_commit(user_ids):
+    """
+    Пересчитывает места после фиксации транзакции, пропуская удалённых
+    пользователей (результаты удаляются и вместе с пользователем).
+    """
+    user_ids = set(user_ids)
+
+    def refresh():
+        refresh_entries(CustomUser.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+
+    transaction.on_commit(refresh)
+
+
+def _cache_key(scope, object_id):
+    return f'kyberapp:leaderboard:{get_version("leaderboards")}:{scope}:{object_id}'
+
+
+def get_board(scope=GLOBAL, object_id=0):
+    """
+    Снимок рейтинга из кеша (при отсутствии строится двумя запросами по
+    индексу ``leaderboard_rank_idx``).
+
+    Возвращает:
+    Словарь: ``total`` — число участников, ``top`` — первые места: словари
+    с ``rank``, ``user_id``, ``username``, ``score``, ``achievements``.
+    """
+    key = _cache_key(scope, object_id)
+    board = cache.get(key)
+    if board is not None:
+        return board
+    config = get_config()
+    entries = LeaderboardEntry.objects.filter(scope=scope, object_id=object_id)
+    # Снимок кешируется под текущей версией — читаем с основной базы.
+    with primary():
+        total = entries.count()
+        rows = list(entries.order_by('-score', '-achievements', 'user_id')
+                    .values_list('user_id', 'user__username', 'score', 'achievements')
+                    [:config['TOP_K']])
+    top = []
+    for position, (user_id, username, score, achievements) in enumerate(rows, 1):
+        # Все лучшие строки стоят выше в том же списке: равный ключ — то же место.
+        rank = position
+        if top and (top[-1]['score'], top[-1]['achievements']) == (score, achievements):
+            rank = top[-1]['rank']
+        top.append({'rank': rank, 'user_id': user_id, 'username': username,
+                    'score': score, 'achievements': achievements})
+    board = {'total': total, 'top': top}
+    cache.set(key, board, config['TIMEOUT'])
+    return board
+
+
+def rank_of(scope, object_id, key):
+    """
+    Место ключа (балл, достижения): 1 плюс количество строго лучших строк
+    рейтинга (два COUNT по диапазонам индекса ``leaderboard_rank_idx``).
+    """
+    score, achievements = key
+    entries = LeaderboardEntry.objects.filter(scope=scope, object_id=object_id)
+    return (entries.filter(score__gt=score).count()
+            + entries.filter(score=score, achievements__gt=achievements).count() + 1)
+
+
+def get_rank(user, scope=GLOBAL, object_id=0, board=None):
+    """
+    Место пользователя в рейтинге.
+
+    Параметры:
+    board: уже полученный снимок ``get_board`` (для числа участников).
+
+    Возвращает:
+    Словарь с ``rank``, ``total`` (участников), ``score`` и ``achievements``
+    или ``None``, если пользователя в рейтинге нет.
+    """
+    key = (LeaderboardEntry.objects.filter(scope=scope, object_id=object_id,
+                                           user_id=getattr(user, 'pk', user))
+           .values_list('score', 'achievements').first())
+    if key is None:
+        return None
+    rank = rank_of(scope, object_id, key)
+    total = (board or get_board(scope, object_id))['total']
+    # Пользователь мог появиться в рейтинге после построения снимка.
+    return {'rank': rank, 'total': max(total, rank), 'score': key[0], 'achievements': key[1]}
+
+
+def invalidate_boards():
+    """
+    Делает устаревшими снимки всех рейтингов.
+    """
+    bump_version('leaderboards')
+
+
+def rebuild_all(batch_size=1000):
+    """
+    Пересчитывает места всех пользователей пачками по ``batch_size``
+    и сбрасывает снимки рейтингов.
+
+    Возвращает:
+    Количество обработанных пользователей.
+    """
+    total = 0
+    user_ids = CustomUser.objects.order_by('pk').values_list('pk', flat=True)
+    with transaction.atomic():
+        # Места удалённых тестов и уроков удаляются вместе со всеми остальными.
+        LeaderboardEntry.objects.all().delete()
+        batch = []
+        for user_id in user_ids.iterator(chunk_size=batch_size):
+            batch.append(user_id)
+            if len(batch) >= batch_size:
+                _save_entries(compute_entries(batch))
+                total += len(batch)
+                batch = []
+        if batch:
+            _save_entries(compute_entries(batch))
+            total += len(batch)
+    invalidate_boards()
+    return total
+
+
+def find_stale_entries(batch_size=1000):
+    """
+    Сравнивает сохранённые места с результатами и достижениями.
+
+    Возвращает:
+    Список (ключ места, сохранённое значение, ожидаемое значение); отсутствующее
+    значение — ``None``.
+    """
+    stale = []
+    user_ids = list(CustomUser.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        expected = compute_entries(batch)
+        stored = {(scope, object_id, user_id): (score, achievements)
+                  for scope, object_id, user_id, score, achievements in
+                  LeaderboardEntry.objects.filter(user_id__in=batch).values_list(
+                      'scope', 'object_id', 'user_id', 'score', 'achievements')}
+        for key in sorted(set(expected) | set(stored)):
+            if expected.get(key) != stored.get(key):
+                stale.append((key, stored.get(key), expected.get(key)))
+    return stale
@@ -0,0 +1,79 @@
+"""
+Загрузка контента тестов для отображения.
+
+Дерево Test -> Question -> Answer собирается фиксированным числом запросов
+(независимо от количества вопросов), сериализуется без признаков правильности
+ответов и кешируется по ID теста и версии его содержимого. Дерево для кеша
+читается с основной базы (``routers.primary``).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .models import Answer, Question, Test
+from .routers import primary
+from .versions import get_version
+
+TEST_TREE_TIMEOUT = getattr(settings, 'KYBERAPP_TEST_TREE_TIMEOUT', 60 * 60)
+
+
+def build_test_tree(test):
+    """
+    Собирает дерево теста из базы данных тремя запросами: тест, его вопросы
+    и все ответы на них.
+
+    Параметры:
+    test: объект Test или его ID.
+
+    Возвращает:
+    Словарь с ID и названием теста и списком вопросов; у каждого вопроса
+    список вариантов ответа (только ID и текст).
+    """
+    test = Test.objects.prefetch_related(
+        Prefetch(
+            'questions',
+            queryset=Question.objects.order_by('id').prefetch_related(
+                Prefetch('answers',
+                         queryset=Answer.objects.only('id', 'question_id', 'answer_text')
+                         .order_by('id'))
+            ),
+            to_attr='prefetched_questions',
+        ),
+    ).get(pk=getattr(test, 'pk', test))
+    return {
+        'id': test.pk,
+        'title': test.title,
+        'questions': [
+            {
+                'id': question.pk,
+                'question_text': question.question_text,
+                'question_type': question.question_type,
+                'answers': [
+                    {'id': answer.pk, 'answer_text': answer.answer_text}
+                    for answer in question.answers.all()
+                ],
+            }
+            for question in test.prefetched_questions
+        ],
+    }
+
+
+def test_tree_cache_key(test_id):
+    return f'kyberapp:test_tree:{test_id}:{get_version("test", test_id)}'
+
+
+def load_test_tree(test):
+    """
+    Возвращает дерево теста из кеша, при необходимости собирая его.
+
+    Параметры:
+    test: объект Test или его ID.
+    """
+    test_id = getattr(test, 'pk', test)
+    cache_key = test_tree_cache_key(test_id)
+    tree = cache.get(cache_key)
+    if tree is None:
+        with primary():
+            tree = build_test_tree(test)
+        cache.set(cache_key, tree, TEST_TREE_TIMEOUT)
+    return tree
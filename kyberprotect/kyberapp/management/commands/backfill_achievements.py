@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from kyberapp.achievement_rules import backfill
+
+
+class Command(BaseCommand):
+    help = ('Проверяет условия всех достижений для всех пользователей '
+            'и выдаёт недостающие достижения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Размер пачки при чтении и записи (по умолчанию 1000).')
+
+    def handle(self, *args, **options):
+        total = backfill(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено выполненных условий: {total}'))
@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kyberapp.analytics import LOW_DISCRIMINATION, item_statistics, load_columns, pass_statistics
+from kyberapp.exports import DATASETS, FORMATS, export, get_config
+
+
+class Command(BaseCommand):
+    help = ('Выгружает результаты тестов, историю прохождений и правильность ответов на вопросы '
+            'в CSV, Parquet или Arrow; с --stats выводит статистику тестов и вопросов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Каталог для файлов (<набор>.<формат>).')
+        parser.add_argument('--format', choices=FORMATS, default='csv',
+                            help='Формат файлов (по умолчанию csv; parquet и arrow требуют pyarrow).')
+        parser.add_argument('--dataset', action='append', choices=sorted(DATASETS),
+                            dest='datasets',
+                            help='Выгрузить только этот набор (можно указать несколько раз).')
+        parser.add_argument('--test', action='append', type=int, dest='test_ids',
+                            help='Выгрузить только результаты этого теста (можно указать '
+                                 'несколько раз).')
+        parser.add_argument('--chunk-size', type=int, default=get_config()['CHUNK_SIZE'],
+                            help='Строк в одной выборке и пачке файла '
+                                 f'(по умолчанию {get_config()["CHUNK_SIZE"]}).')
+        parser.add_argument('--stats', action='store_true',
+                            help='Вывести статистику тестов и вопросов по выгруженным файлам '
+                                 '(требуется numpy).')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            exported = export(options['output'], datasets=options['datasets'],
+                              file_format=options['format'], chunk_size=options['chunk_size'],
+                              test_ids=options['test_ids'])
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+        for dataset, (path, count) in exported.items():
+            self.stdout.write(f'{dataset}: {count} строк -> {path}')
+        self.stdout.write(self.style.SUCCESS(f'Выгрузка завершена за {time.monotonic() - started:.1f} с'))
+
+        if options['stats']:
+            try:
+                self.write_statistics(exported)
+            except ValueError as error:
+                raise CommandError(str(error))
+
+    def write_statistics(self, exported):
+        if 'results' in exported:
+            columns = load_columns(exported['results'][0], ['test_id', 'score', 'passed'])
+            stats = pass_statistics(columns['test_id'], columns['score'], columns['passed'])
+            self.stdout.write(f'\n{"Тест":>8} {"Результатов":>12} {"Пройдено %":>11} {"Средний балл":>13}')
+            for test_id, results, pass_rate, mean_score in zip(
+                    stats['test_id'], stats['results'], stats['pass_rate'], stats['mean_score']):
+                self.stdout.write(f'{test_id:>8} {results:>12} {pass_rate * 100:>11.1f} '
+                                  f'{mean_score:>13.2f}')
+
+        if 'answers' in exported:
+            columns = load_columns(exported['answers'][0],
+                                   ['result_id', 'test_id', 'question_id', 'correct'])
+            stats = item_statistics(columns['result_id'], columns['test_id'],
+                                    columns['question_id'], columns['correct'])
+            self.stdout.write(f'\n{"Тест":>8} {"Вопрос":>8} {"Ответов":>8} {"p":>6} '
+                              f'{"D":>6} {"r_pb":>6}')
+            for test_id, question_id, responses, p_value, discrimination, point_biserial in zip(
+                    stats['test_id'], stats['question_id'], stats['responses'],
+                    stats['p_value'], stats['discrimination'], stats['point_biserial']):
+                mark = ' !' if discrimination < LOW_DISCRIMINATION else ''
+                self.stdout.write(f'{test_id:>8} {question_id:>8} {responses:>8} {p_value:>6.2f} '
+                                  f'{discrimination:>6.2f} {point_biserial:>6.2f}{mark}')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from kyberapp.images import generate_variants, image_fields
+from kyberapp.page_cache import invalidate_pages
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии (WebP/JPEG) уже загруженных аватаров, '
+            'картинок уроков и новостей и иконок достижений.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать копии, даже если они уже есть.')
+
+    def handle(self, *args, **options):
+        created = failed = 0
+        for queryset, field, kind in image_fields():
+            names = set(queryset.values_list(field, flat=True))
+            for name in sorted(names):
+                if generate_variants(name, kind, force=options['force']):
+                    created += 1
+                else:
+                    failed += 1
+        invalidate_pages('lessons', 'news_list')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {created}, не удалось прочитать: {failed}'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from kyberapp.submission_queue import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Проверяет отправленные тесты из очереди (Submission) пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help='Сколько отправок брать за раз '
+                                 '(по умолчанию KYBERAPP_SUBMISSION_QUEUE["BATCH_SIZE"]).')
+        parser.add_argument('--poll-interval', type=float,
+                            help='Пауза при пустой очереди, секунды.')
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать очередь и завершиться, когда она опустеет.')
+
+    def handle(self, *args, **options):
+        try:
+            processed = run_worker(batch_size=options['batch_size'],
+                                   poll_interval=options['poll_interval'],
+                                   once=options['once'])
+        except KeyboardInterrupt:
+            self.stdout.write('Обработчик остановлен.')
+            return
+        self.stdout.write(self.style.SUCCESS(f'Проверено отправок: {processed}'))
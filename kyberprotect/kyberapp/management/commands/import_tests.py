@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kyberapp.importers import FORMATS, import_tests, read_records
+
+
+class Command(BaseCommand):
+    help = 'Импортирует тесты с вопросами и ответами из файлов JSON, JSON Lines, YAML или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы для импорта.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Формат файлов (по умолчанию определяется по расширению).')
+        parser.add_argument('--upsert', action='store_true',
+                            help='Обновлять тесты, вопросы и ответы с теми же external_id '
+                                 'вместо создания новых.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Количество строк в одном bulk_create (по умолчанию 500).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только проверить файлы, ничего не сохраняя.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        totals = {'tests': 0, 'questions': 0, 'answers': 0, 'errors': []}
+        for path in options['paths']:
+            try:
+                stats = import_tests(read_records(path, options['format']),
+                                     upsert=options['upsert'],
+                                     batch_size=options['batch_size'],
+                                     dry_run=options['dry_run'])
+            except (OSError, ValueError) as error:
+                raise CommandError(f'{path}: {error}')
+            for key in ('tests', 'questions', 'answers', 'errors'):
+                totals[key] += stats[key]
+
+        for location, message in totals['errors']:
+            self.stderr.write(f'{location}: {message}')
+        verb = 'Проверено' if options['dry_run'] else 'Импортировано'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} тестов: {totals["tests"]}, вопросов: {totals["questions"]}, '
+            f'ответов: {totals["answers"]} за {time.monotonic() - started:.1f} с'))
+        if totals['errors']:
+            raise CommandError(f'Пропущено тестов с ошибками: {len(totals["errors"])}')
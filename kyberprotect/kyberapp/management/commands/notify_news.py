@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kyberapp.models import News
+from kyberapp.notifications import notify_news_published, notify_pending_news
+
+
+class Command(BaseCommand):
+    help = ('Рассылает уведомления об опубликованных новостях, которые их ждут '
+            '(или об одной новости, продолжая прерванную рассылку).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('news_id', type=int, nargs='?',
+                            help='ID новости (по умолчанию все ждущие рассылки).')
+        parser.add_argument('--again', action='store_true',
+                            help='Разослать повторно, даже если рассылка уже выполнена '
+                                 '(только с ID новости).')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Проверять новости каждые N секунд (по умолчанию один раз).')
+
+    def handle(self, *args, **options):
+        if options['news_id'] is not None:
+            self.notify_one(options['news_id'], options['again'])
+            return
+        if options['again']:
+            raise CommandError('--again указывается вместе с ID новости')
+        try:
+            while True:
+                for news_id, stats in notify_pending_news().items():
+                    self.stdout.write(f'Новость {news_id}: создано уведомлений '
+                                      f'{stats["notifications"]}, отправлено писем {stats["emails"]}')
+                if not options['interval']:
+                    return
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Рассылка остановлена.')
+
+    def notify_one(self, news_id, again):
+        news = News.objects.filter(pk=news_id).first()
+        if news is None:
+            raise CommandError(f'Новость {news_id} не найдена')
+        if not news.is_published:
+            raise CommandError('Новость не опубликована')
+        if again:
+            News.objects.filter(pk=news.pk).update(notified_at=None, notification_started_at=None)
+        stats = notify_news_published(news.pk, resume=not again)
+        if stats is None:
+            self.stdout.write('Уведомления о новости уже разосланы или рассылаются.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано уведомлений: {stats["notifications"]}, отправлено писем: {stats["emails"]}'))
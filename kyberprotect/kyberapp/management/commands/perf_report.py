@@ -0,0 +1,63 @@
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kyberapp.perf import get_config, parse_metrics
+
+SORT_KEYS = {
+    'p95': lambda metrics: metrics.duration.quantile(0.95),
+    'count': lambda metrics: metrics.duration.count,
+    'total': lambda metrics: metrics.duration.total,
+    'queries': lambda metrics: metrics.queries.total / max(metrics.queries.count, 1),
+}
+
+
+def mean_ms(histogram):
+    return histogram.total / histogram.count * 1000 if histogram.count else 0.0
+
+
+class Command(BaseCommand):
+    help = ('Таблица замеров производительности по представлениям: перцентили времени, '
+            'SQL-запросы, отрисовка шаблонов, N+1 (данные из /metrics/).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Адрес /metrics/ (по умолчанию METRICS_URL из настроек).')
+        parser.add_argument('--file', help='Прочитать сохранённый вывод /metrics/ из файла.')
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='p95',
+                            help='Порядок строк (по умолчанию p95).')
+
+    def read_metrics(self, options):
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as file:
+                return file.read()
+        config = get_config()
+        request = Request(options['url'] or config['METRICS_URL'])
+        if config['METRICS_TOKEN']:
+            request.add_header('Authorization', f'Bearer {config["METRICS_TOKEN"]}')
+        try:
+            with urlopen(request, timeout=10) as response:
+                return response.read().decode('utf-8')
+        except (URLError, OSError) as error:
+            raise CommandError(f'Не удалось получить {request.full_url}: {error}')
+
+    def handle(self, *args, **options):
+        snapshot = parse_metrics(self.read_metrics(options))
+        if not snapshot:
+            self.stdout.write('Замеров пока нет.')
+            return
+        header = (f'{"Представление":<40} {"Запросов":>9} {"p50 мс":>8} {"p95 мс":>8} '
+                  f'{"p99 мс":>8} {"SQL":>6} {"SQL мс":>8} {"Шаблон мс":>10} {"N+1":>5}')
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for view, metrics in sorted(snapshot.items(), key=lambda item: SORT_KEYS[options['sort']](item[1]),
+                                    reverse=True):
+            duration = metrics.duration
+            self.stdout.write(
+                f'{view[:40]:<40} {duration.count:>9} '
+                f'{duration.quantile(0.5) * 1000:>8.1f} {duration.quantile(0.95) * 1000:>8.1f} '
+                f'{duration.quantile(0.99) * 1000:>8.1f} '
+                f'{metrics.queries.total / max(metrics.queries.count, 1):>6.1f} '
+                f'{mean_ms(metrics.db_duration):>8.1f} {mean_ms(metrics.template_duration):>10.1f} '
+                f'{metrics.n_plus_one_requests:>5}'
+            )
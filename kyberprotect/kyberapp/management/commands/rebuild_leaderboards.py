@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kyberapp.leaderboards import find_stale_entries, rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги (LeaderboardEntry) всех пользователей по результатам и достижениям.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество пользователей в пачке (по умолчанию 1000).')
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить места, ничего не изменяя. '
+                 'Завершается с ошибкой, если найдены расхождения.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            stale = find_stale_entries(batch_size=options['batch_size'])
+            for (scope, object_id, user_id), stored, expected in stale:
+                self.stdout.write(f'{scope}:{object_id}, пользователь {user_id}: '
+                                  f'сохранено {stored}, ожидается {expected}')
+            if stale:
+                raise CommandError(f'Найдено расхождений: {len(stale)}')
+            self.stdout.write(self.style.SUCCESS('Все рейтинги актуальны.'))
+            return
+
+        total = rebuild_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитаны рейтинги пользователей: {total}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from kyberapp.progress import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводки прогресса (UserProgress) всех пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество пользователей в пачке (по умолчанию 1000).')
+
+    def handle(self, *args, **options):
+        total = rebuild_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано сводок: {total}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from kyberapp.search import is_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс уроков, новостей и вопросов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество объектов в пачке (по умолчанию 1000).')
+
+    def handle(self, *args, **options):
+        if not is_available():
+            self.stdout.write(self.style.WARNING(
+                'Полнотекстовый индекс доступен только на SQLite; поиск использует icontains.'))
+            return
+        total = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано объектов: {total}'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kyberapp.aggregates import find_stale_test_totals, refresh_test_totals
+
+
+class Command(BaseCommand):
+    help = 'Проверяет и пересчитывает сохранённые суммы баллов тестов (Test.total_points).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить значения, ничего не изменяя. '
+                 'Завершается с ошибкой, если найдены расхождения.',
+        )
+
+    def handle(self, *args, **options):
+        stale = find_stale_test_totals()
+        for test_id, stored, expected in stale:
+            self.stdout.write(f'Тест {test_id}: сохранено {stored}, ожидается {expected}')
+
+        if options['check']:
+            if stale:
+                raise CommandError(f'Найдено расхождений: {len(stale)}')
+            self.stdout.write(self.style.SUCCESS('Все суммы баллов актуальны.'))
+            return
+
+        updated = refresh_test_totals()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано тестов: {updated}, исправлено расхождений: {len(stale)}'))
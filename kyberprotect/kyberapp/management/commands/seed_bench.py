@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kyberapp.models import CustomUser
+from kyberapp.seeding import VOLUMES, seed
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими данными для нагрузочных замеров: пользователи, '
+            'уроки, задачи, тесты с вопросами и ответами, новости, результаты, достижения.')
+
+    def add_arguments(self, parser):
+        for name, default in VOLUMES.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default,
+                                help=f'По умолчанию {default}.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Начальное значение генератора (по умолчанию 0).')
+        parser.add_argument('--prefix', default='bench',
+                            help='Префикс имён пользователей (по умолчанию bench).')
+        parser.add_argument('--password', default='bench-password',
+                            help='Пароль всех созданных пользователей.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Размер пачки при записи (по умолчанию 1000).')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if CustomUser.objects.filter(username=f'{prefix}0').exists():
+            raise CommandError(f'Пользователи с префиксом «{prefix}» уже есть, укажите другой --prefix.')
+        created = seed(seed=options['seed'], prefix=prefix, password=options['password'],
+                       batch_size=options['batch_size'],
+                       **{name: options[name] for name in VOLUMES})
+        for model_name, count in created.items():
+            self.stdout.write(f'{model_name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Вход: {prefix}0 (сотрудник) … {prefix}{created["customuser"] - 1}, '
+            f'пароль {options["password"]}'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kyberapp.routers import copy_database
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файл реплики (KYBERAPP_REPLICA_DB) — '
+            'замена реплики для локальной проверки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять копирование каждые N секунд, как реплика '
+                                 'с задержкой (по умолчанию один раз).')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            try:
+                copy_database()
+            except ValueError as error:
+                raise CommandError(str(error))
+            self.stdout.write(f'Реплика обновлена за {time.perf_counter() - started:.2f} с')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
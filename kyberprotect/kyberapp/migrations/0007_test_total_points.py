@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+def fill_total_points(apps, schema_editor):
+    Test = apps.get_model('kyberapp', 'Test')
+    Task = apps.get_model('kyberapp', 'Task')
+    totals = {}
+    for lesson_id, points in Task.objects.values_list('lesson_id', 'points'):
+        totals[lesson_id] = totals.get(lesson_id, 0) + points
+    for test in Test.objects.all():
+        test.total_points = totals.get(test.lesson_id, 0)
+        test.save(update_fields=['total_points'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0006_remove_task_correct_answer_remove_task_hint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='total_points',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Сумма баллов'),
+        ),
+        migrations.RunPython(fill_total_points, migrations.RunPython.noop),
+    ]
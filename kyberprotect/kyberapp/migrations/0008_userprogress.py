@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0007_test_total_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('earned_achievements', models.PositiveIntegerField(default=0, verbose_name='Получено достижений')),
+                ('progress_percent', models.PositiveSmallIntegerField(default=0, verbose_name='Процент достижений')),
+                ('passed_tests', models.PositiveIntegerField(default=0, verbose_name='Пройдено тестов')),
+                ('completed_task_ids', models.JSONField(default=list, verbose_name='Выполненные задачи')),
+                ('lesson_completion', models.JSONField(default=dict, verbose_name='Выполнение уроков')),
+                ('catalog_version', models.BigIntegerField(default=0, verbose_name='Версия каталога')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='progress_summary', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Прогресс пользователя',
+                'verbose_name_plural': 'Прогресс пользователей',
+            },
+        ),
+    ]
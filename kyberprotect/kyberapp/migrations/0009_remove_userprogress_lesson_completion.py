@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0008_userprogress'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userprogress',
+            name='lesson_completion',
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0009_remove_userprogress_lesson_completion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['created_at', 'id'], name='lesson_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['created_at', 'id'], name='news_published_created_idx'),
+        ),
+    ]
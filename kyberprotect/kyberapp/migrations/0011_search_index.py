@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-17 13:50
+
+from django.db import migrations
+
+# rowid записи индекса = id объекта * 4 + код типа (см. kyberapp/search.py).
+POPULATE = [
+    "INSERT INTO kyberapp_search (rowid, title, body, parent_id, is_public) "
+    "SELECT id * 4 + 1, title, description, NULL, 1 FROM kyberapp_lesson",
+    "INSERT INTO kyberapp_search (rowid, title, body, parent_id, is_public) "
+    "SELECT id * 4 + 2, title, content, NULL, is_published FROM kyberapp_news",
+    "INSERT INTO kyberapp_search (rowid, title, body, parent_id, is_public) "
+    "SELECT id * 4 + 3, question_text, '', test_id, 1 FROM kyberapp_question",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS kyberapp_search USING fts5("
+        "title, body, parent_id UNINDEXED, is_public UNINDEXED, "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    for statement in POPULATE:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS kyberapp_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0010_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
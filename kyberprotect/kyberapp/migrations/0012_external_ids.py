@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-17 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Внешний ID'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Внешний ID'),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='Внешний ID'),
+        ),
+        migrations.AddConstraint(
+            model_name='answer',
+            constraint=models.UniqueConstraint(fields=('question', 'external_id'), name='answer_external_id_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='question',
+            constraint=models.UniqueConstraint(fields=('test', 'external_id'), name='question_external_id_unique'),
+        ),
+    ]
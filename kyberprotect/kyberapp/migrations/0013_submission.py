@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-17 14:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('kyberapp', '0012_external_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', models.JSONField(default=dict, verbose_name='Ответы')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает проверки'), ('processing', 'Проверяется'), ('done', 'Проверен'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Обработчик')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата отправки')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало проверки')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата проверки')),
+                ('result', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='kyberapp.testresult', verbose_name='Результат')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='kyberapp.test', verbose_name='Тест')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Отправка теста',
+                'verbose_name_plural': 'Отправки тестов',
+                'indexes': [models.Index(fields=['status', 'id'], name='submission_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0013_submission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Дата рассылки уведомлений'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0015_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Исходный файл')),
+                ('digest', models.CharField(max_length=40, verbose_name='Хеш содержимого')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+                ('variants', models.JSONField(default=list, verbose_name='Варианты')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Копии изображения',
+                'verbose_name_plural': 'Копии изображений',
+            },
+        ),
+    ]
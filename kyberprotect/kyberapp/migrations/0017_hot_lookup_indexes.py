@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0016_imagederivative'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notification_unread_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', 'created_at'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(condition=models.Q(('is_correct', True)), fields=['question'], name='answer_correct_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testresult',
+            index=models.Index(fields=['user', 'test', 'passed'], name='testresult_user_test_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usertest',
+            index=models.Index(fields=['user', 'completed_at'], name='usertest_user_completed_idx'),
+        ),
+    ]
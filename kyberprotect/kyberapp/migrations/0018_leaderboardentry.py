@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0017_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('global', 'Общий'), ('lesson', 'Урок'), ('test', 'Тест')], max_length=10, verbose_name='Рейтинг')),
+                ('object_id', models.PositiveIntegerField(default=0, verbose_name='ID урока или теста')),
+                ('score', models.PositiveIntegerField(default=0, verbose_name='Баллы')),
+                ('achievements', models.PositiveIntegerField(default=0, verbose_name='Достижения')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Место в рейтинге',
+                'verbose_name_plural': 'Места в рейтингах',
+                'indexes': [models.Index(fields=['scope', 'object_id', '-score', '-achievements', 'user'], name='leaderboard_rank_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('scope', 'object_id', 'user'), name='leaderboard_entry_unique'),
+        ),
+    ]
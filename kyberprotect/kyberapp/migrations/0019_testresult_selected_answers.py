@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+
+# Копия кодирования из kyberapp/selections.py на момент миграции: формат
+# записи зафиксирован здесь и не зависит от последующих изменений модуля.
+def _write_varint(value, output):
+    while value >= 0x80:
+        output.append(value & 0x7f | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def _encode_selection(answer_ids, first_id, last_id):
+    answer_ids = sorted(set(answer_ids))
+    if not answer_ids:
+        return b''
+    encoded = bytearray([0])
+    previous = 0
+    for answer_id in answer_ids:
+        _write_varint(answer_id - previous, encoded)
+        previous = answer_id
+    if first_id is not None and first_id <= answer_ids[0] and answer_ids[-1] <= last_id:
+        bitmap = bytearray([1])
+        _write_varint(first_id, bitmap)
+        mask = bytearray((last_id - first_id) // 8 + 1)
+        for answer_id in answer_ids:
+            offset = answer_id - first_id
+            mask[offset // 8] |= 1 << offset % 8
+        if len(bitmap) + len(mask) <= len(encoded):
+            return bytes(bitmap + mask)
+    return bytes(encoded)
+
+
+def fill_selected_answers(apps, schema_editor):
+    """
+    Заполняет выбор ответов результатов, проверенных через очередь,
+    по ответам их отправок. Тесты обрабатываются по одному, результаты —
+    пачками.
+    """
+    Answer = apps.get_model('kyberapp', 'Answer')
+    Submission = apps.get_model('kyberapp', 'Submission')
+    TestResult = apps.get_model('kyberapp', 'TestResult')
+    submissions = Submission.objects.filter(result__isnull=False)
+    for test_id in set(submissions.values_list('test_id', flat=True)):
+        questions = dict(Answer.objects.filter(question__test_id=test_id)
+                         .values_list('id', 'question_id'))
+        batch = []
+        for result_id, answers in (submissions.filter(test_id=test_id)
+                                   .values_list('result_id', 'answers').iterator(chunk_size=500)):
+            selected = [int(value) for key, values in answers.items() for value in values
+                        if str(value).isdigit()
+                        and f'question_{questions.get(int(value))}' == key]
+            batch.append(TestResult(pk=result_id, selected_answers=_encode_selection(
+                selected, min(questions, default=None), max(questions, default=None))))
+            if len(batch) >= 500:
+                TestResult.objects.bulk_update(batch, ['selected_answers'])
+                batch = []
+        TestResult.objects.bulk_update(batch, ['selected_answers'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0018_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testresult',
+            name='selected_answers',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Выбранные ответы'),
+        ),
+        migrations.RunPython(fill_selected_answers, migrations.RunPython.noop),
+    ]
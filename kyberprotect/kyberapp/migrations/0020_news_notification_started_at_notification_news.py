@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0019_testresult_selected_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='notification_started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Начало рассылки уведомлений'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='news',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='kyberapp.news', verbose_name='Новость'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:20
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+
+
+def mark_published_news_notified(apps, schema_editor):
+    """
+    Отмечает уже опубликованные новости разосланными: о них пользователи
+    узнали до появления рассылки, и обработчик не должен присылать их снова.
+    """
+    News = apps.get_model('kyberapp', 'News')
+    News.objects.filter(is_published=True, notified_at__isnull=True).update(
+        notified_at=timezone.now(), notification_started_at=None)
+
+
+def remove_duplicate_notifications(apps, schema_editor):
+    """
+    Оставляет одно (первое) уведомление о новости на пользователя перед
+    добавлением ограничения уникальности.
+    """
+    Notification = apps.get_model('kyberapp', 'Notification')
+    keep = (Notification.objects.filter(news__isnull=False)
+            .values('news_id', 'user_id').annotate(first_id=Min('id')).values('first_id'))
+    Notification.objects.filter(news__isnull=False).exclude(pk__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyberapp', '0020_news_notification_started_at_notification_news'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_published_news_notified, migrations.RunPython.noop),
+        migrations.RunPython(remove_duplicate_notifications, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('news', 'user'), name='notification_news_user_uniq'),
+        ),
+    ]
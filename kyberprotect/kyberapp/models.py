@@ -45,6 +45,10 @@ class Lesson(models.Model):
     class Meta:
         verbose_name = "Урок"
         verbose_name_plural = "Уроки"
+        indexes = [
+            # Постраничный вывод каталога по ключу (created_at, id).
+            models.Index(fields=['created_at', 'id'], name='lesson_created_idx'),
+        ]
 
 
 class Achievement(models.Model):
@@ -117,6 +121,9 @@ class Notification(models.Model):
     message = models.TextField(_('Сообщение'))
     is_read = models.BooleanField(_('Прочитано'), default=False)
     created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+    # Новость, о публикации которой уведомление (см. notifications.py).
+    news = models.ForeignKey('kyberapp.News', null=True, blank=True, on_delete=models.SET_NULL,
+                             related_name='notifications', verbose_name='Новость')
 
     def __str__(self):
         return f"Для: {self.user.username} — {self.title}"
@@ -124,6 +131,21 @@ class Notification(models.Model):
     class Meta:
         verbose_name = "Уведомление"
         verbose_name_plural = "Уведомления"
+        indexes = [
+            # Счётчик и список непрочитанных уведомлений пользователя.
+            # Частичный индекс: условие "NOT is_read" SQLite не сопоставляет
+            # с булевым полем внутри составного индекса.
+            models.Index(fields=['user', 'created_at'], name='notification_unread_idx',
+                         condition=models.Q(is_read=False)),
+            # Лента всех уведомлений пользователя по ключу (created_at, id).
+            models.Index(fields=['user', 'created_at', 'id'],
+                         name='notification_inbox_idx'),
+        ]
+        constraints = [
+            # Одно уведомление о новости на пользователя, даже если рассылку
+            # одновременно выполняют два обработчика.
+            models.UniqueConstraint(fields=['news', 'user'], name='notification_news_user_uniq'),
+        ]
 
 
 class News(models.Model):
@@ -136,6 +158,12 @@ class News(models.Model):
                               blank=True)
     created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
     is_published = models.BooleanField(_('Опубликована'), default=False)
+    # Когда пользователям разосланы уведомления о публикации (см. notifications.py).
+    notified_at = models.DateTimeField(_('Дата рассылки уведомлений'), null=True,
+                                       blank=True, editable=False)
+    # Когда рассылку начал обработчик; устаревшая отметка — рассылка прервана.
+    notification_started_at = models.DateTimeField(_('Начало рассылки уведомлений'), null=True,
+                                                   blank=True, editable=False)
 
     def __str__(self):
         return self.title
@@ -143,6 +171,13 @@ class News(models.Model):
     class Meta:
         verbose_name = "Новость"
         verbose_name_plural = "Новости"
+        indexes = [
+            # Лента опубликованных новостей по ключу (created_at, id).
+            # Частичный индекс: SQLite не использует составной индекс
+            # с булевым полем для условия WHERE "is_published".
+            models.Index(fields=['created_at', 'id'], name='news_published_created_idx',
+                         condition=models.Q(is_published=True)),
+        ]
 
 
 class Test(models.Model):
@@ -154,17 +189,17 @@ class Test(models.Model):
     title = models.CharField(_('Название теста'), max_length=255)
     is_active = models.BooleanField(_('Активен'), default=True)
     created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+    # Сумма всех баллов за задачи урока, к которому привязан тест.
+    # Поддерживается сигналами при изменении задач (см. aggregates.py).
+    total_points = models.PositiveIntegerField(_('Сумма баллов'), default=0,
+                                               db_index=True, editable=False)
+    # Идентификатор во внешнем источнике (для повторного импорта, см. importers.py).
+    external_id = models.CharField(_('Внешний ID'), max_length=100, unique=True,
+                                   null=True, blank=True)
 
     def __str__(self):
         return self.title
 
-    @property
-    def total_points(self):
-        """
-        Сумма всех баллов за задачи урока, к которому привязан тест.
-        """
-        return sum(task.points for task in self.lesson.tasks.all())
-
     class Meta:
         verbose_name = "Тест"
         verbose_name_plural = "Тесты"
@@ -185,6 +220,8 @@ class Question(models.Model):
             ('multiple', 'Несколько правильных ответов')
         ]
     )
+    external_id = models.CharField(_('Внешний ID'), max_length=100,
+                                   null=True, blank=True)
 
     def __str__(self):
         return self.question_text
@@ -192,6 +229,10 @@ class Question(models.Model):
     class Meta:
         verbose_name = "Вопрос"
         verbose_name_plural = "Вопросы"
+        constraints = [
+            models.UniqueConstraint(fields=['test', 'external_id'],
+                                    name='question_external_id_unique'),
+        ]
 
 
 class Answer(models.Model):
@@ -203,6 +244,8 @@ class Answer(models.Model):
                                  verbose_name='Вопрос')
     answer_text = models.CharField(_('Текст ответа'), max_length=255)
     is_correct = models.BooleanField(_('Правильный'), default=False)
+    external_id = models.CharField(_('Внешний ID'), max_length=100,
+                                   null=True, blank=True)
 
     def __str__(self):
         return self.answer_text
@@ -210,6 +253,15 @@ class Answer(models.Model):
     class Meta:
         verbose_name = "Ответ"
         verbose_name_plural = "Ответы"
+        indexes = [
+            # Ключ ответов теста (grading.py) читает только правильные ответы.
+            models.Index(fields=['question'], name='answer_correct_idx',
+                         condition=models.Q(is_correct=True)),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'external_id'],
+                                    name='answer_external_id_unique'),
+        ]
 
 
 class TestResult(models.Model):
@@ -229,6 +281,8 @@ class TestResult(models.Model):
         on_delete=models.SET_NULL,
         verbose_name='Полученное достижение'
     )
+    # Упакованные ID выбранных ответов (см. selections.py); NULL — не сохранялись.
+    selected_answers = models.BinaryField(_('Выбранные ответы'), null=True, blank=True)
 
     def __str__(self):
         return f"Результат {self.user.username} — {self.test.title}"
@@ -236,6 +290,11 @@ class TestResult(models.Model):
     class Meta:
         verbose_name = "Результат теста"
         verbose_name_plural = "Результаты тестов"
+        indexes = [
+            # Результаты пользователя по тесту и пройденные тесты для прогресса
+            # и правил достижений: запросы отвечаются по одному индексу.
+            models.Index(fields=['user', 'test', 'passed'], name='testresult_user_test_idx'),
+        ]
 
 
 class UserTest(models.Model):
@@ -256,3 +315,141 @@ class UserTest(models.Model):
     class Meta:
         verbose_name = "Прохождение теста"
         verbose_name_plural = "Прохождения тестов"
+        indexes = [
+            # История прохождений пользователя, новые сверху.
+            models.Index(fields=['user', 'completed_at'], name='usertest_user_completed_idx'),
+        ]
+
+
+class UserProgress(models.Model):
+    """
+    Сводка прогресса пользователя, которую показывает страница профиля.
+    Обновляется при записи полученных достижений и результатов тестов
+    (см. progress.py). Прогресс по урокам хранится в CustomUser.progress.
+    """
+    user = models.OneToOneField('kyberapp.CustomUser', on_delete=models.CASCADE,
+                                related_name='progress_summary',
+                                verbose_name='Пользователь')
+    earned_achievements = models.PositiveIntegerField(_('Получено достижений'),
+                                                      default=0)
+    progress_percent = models.PositiveSmallIntegerField(_('Процент достижений'),
+                                                        default=0)
+    passed_tests = models.PositiveIntegerField(_('Пройдено тестов'), default=0)
+    completed_task_ids = models.JSONField(_('Выполненные задачи'),
+                                          default=list)  # Пример: [1, 5, 7]
+    catalog_version = models.BigIntegerField(_('Версия каталога'), default=0)
+    updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
+
+    def __str__(self):
+        return f"Прогресс {self.user.username}"
+
+    class Meta:
+        verbose_name = "Прогресс пользователя"
+        verbose_name_plural = "Прогресс пользователей"
+
+
+class Submission(models.Model):
+    """
+    Отправленные ответы на тест, ожидающие проверки фоновым обработчиком
+    (см. submission_queue.py и команду grade_worker).
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает проверки'),
+        (PROCESSING, 'Проверяется'),
+        (DONE, 'Проверен'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    user = models.ForeignKey('kyberapp.CustomUser', on_delete=models.CASCADE,
+                             verbose_name='Пользователь')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE,
+                             verbose_name='Тест')
+    answers = models.JSONField(_('Ответы'), default=dict)  # Пример: {"question_3": ["7"]}
+    status = models.CharField(_('Статус'), max_length=20,
+                              choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(_('Попытки'), default=0)
+    error = models.TextField(_('Ошибка'), blank=True)
+    worker = models.CharField(_('Обработчик'), max_length=100, blank=True)
+    result = models.OneToOneField(TestResult, null=True, blank=True,
+                                  on_delete=models.SET_NULL,
+                                  verbose_name='Результат')
+    created_at = models.DateTimeField(_('Дата отправки'), auto_now_add=True)
+    started_at = models.DateTimeField(_('Начало проверки'), null=True, blank=True)
+    processed_at = models.DateTimeField(_('Дата проверки'), null=True, blank=True)
+
+    def __str__(self):
+        return f"Отправка {self.pk} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Отправка теста"
+        verbose_name_plural = "Отправки тестов"
+        indexes = [
+            models.Index(fields=['status', 'id'], name='submission_status_idx'),
+        ]
+
+
+class ImageDerivative(models.Model):
+    """
+    Уменьшенные копии загруженного изображения (см. images.py). Файлы копий
+    названы по хешу содержимого исходника, поэтому их можно кешировать
+    в браузере навсегда.
+    """
+    source = models.CharField(_('Исходный файл'), max_length=255, unique=True)
+    digest = models.CharField(_('Хеш содержимого'), max_length=40)
+    width = models.PositiveIntegerField(_('Ширина'))
+    height = models.PositiveIntegerField(_('Высота'))
+    # Пример: [{"format": "webp", "width": 360, "height": 240, "name": "variants/..."}]
+    variants = models.JSONField(_('Варианты'), default=list)
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+
+    def __str__(self):
+        return self.source
+
+    class Meta:
+        verbose_name = "Копии изображения"
+        verbose_name_plural = "Копии изображений"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Место пользователя в рейтинге (см. leaderboards.py): лучший балл
+    за тест, сумма лучших баллов по тестам урока или общий рейтинг
+    (сумма лучших баллов и количество достижений). Строки пересчитываются
+    для пользователя при записи его результатов и достижений.
+    """
+    GLOBAL = 'global'
+    LESSON = 'lesson'
+    TEST = 'test'
+    SCOPE_CHOICES = [
+        (GLOBAL, 'Общий'),
+        (LESSON, 'Урок'),
+        (TEST, 'Тест'),
+    ]
+
+    scope = models.CharField(_('Рейтинг'), max_length=10, choices=SCOPE_CHOICES)
+    object_id = models.PositiveIntegerField(_('ID урока или теста'), default=0)  # 0 для общего
+    user = models.ForeignKey('kyberapp.CustomUser', on_delete=models.CASCADE,
+                             verbose_name='Пользователь')
+    score = models.PositiveIntegerField(_('Баллы'), default=0)
+    achievements = models.PositiveIntegerField(_('Достижения'), default=0)
+
+    def __str__(self):
+        return f"{self.scope}:{self.object_id} {self.user_id} — {self.score}"
+
+    class Meta:
+        verbose_name = "Место в рейтинге"
+        verbose_name_plural = "Места в рейтингах"
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'object_id', 'user'],
+                                    name='leaderboard_entry_unique'),
+        ]
+        indexes = [
+            # Порядок рейтинга: первые места читаются по индексу без сортировки,
+            # ключи для поиска места — обратным проходом по нему же.
+            models.Index(fields=['scope', 'object_id', '-score', '-achievements', 'user'],
+                         name='leaderboard_rank_idx'),
+        ]
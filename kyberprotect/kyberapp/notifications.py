@@ -0,0 +1,246 @@
+"""
+Рассылка уведомлений пользователям.
+
+Опубликованная новость без отметки ``News.notified_at`` ждёт рассылки:
+сохранение новости (в том числе в админке) уведомлений не создаёт и писем
+не отправляет. Рассылку выполняет отдельный процесс —
+``manage.py notify_news --interval 30`` (``notify_pending_news``): каждому
+активному пользователю создаётся ``Notification``, а тем, кто включил
+``notify_by_email``, отправляется письмо. Получатели читаются
+потоком (``iterator()``), уведомления создаются ``bulk_create`` пачками,
+письма каждой пачки отправляются через одно SMTP-соединение, которое
+открывается один раз на всю рассылку. В памяти одновременно находится
+только одна пачка, поэтому число пользователей не ограничено памятью.
+
+Рассылку новости «забирает» один обработчик: UPDATE поля
+``News.notification_started_at``; по окончании ставится ``notified_at``,
+поэтому повторная публикация уведомления не дублирует. Отметка
+обновляется после записи каждой пачки, до отправки её писем; если её уже
+забрал другой обработчик, рассылка останавливается. Если обработчик упал
+или завис, через ``PROCESSING_TIMEOUT`` секунд рассылку забирает
+следующий проход и продолжает её: пользователи, у которых уже есть
+уведомление об этой новости (``Notification.news``), пропускаются.
+Уникальность (новость, пользователь) в базе не даёт создать уведомление
+дважды, даже если обработчики всё же пересеклись.
+
+Новости, опубликованные до появления рассылки, отмечены разосланными
+миграцией 0021.
+
+Настройки (``settings.KYBERAPP_NOTIFICATIONS``):
+- ``ENABLED`` — рассылать уведомления о публикации новостей (``True``);
+- ``CHUNK_SIZE`` — размер пачки получателей (1000);
+- ``EMAIL`` — отправлять письма (``True``);
+- ``PROCESSING_TIMEOUT`` — через сколько секунд без обновления отметки
+  рассылку можно забрать заново (600); должен превышать время обработки
+  одной пачки.
+"""
+import logging
+import smtplib
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from .inbox import reset_unread_counts
+from .models import CustomUser, News, Notification
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CHUNK_SIZE': 1000,
+    'EMAIL': True,
+    'PROCESSING_TIMEOUT': 600,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_NOTIFICATIONS', {})}
+
+
+class ClaimLost(Exception):
+    """
+    Рассылку новости забрал другой обработчик.
+    """
+
+
+class MailSender:
+    """
+    Отправляет письма пачками через одно соединение почтового бэкенда.
+    При обрыве SMTP-соединения переподключается и повторяет пачку один раз.
+    """
+
+    def __init__(self, connection=None):
+        self.connection = connection or get_connection()
+        self.sent = 0
+
+    def __enter__(self):
+        self.connection.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.close()
+
+    def send(self, messages):
+        if not messages:
+            return 0
+        try:
+            sent = self.connection.send_messages(messages)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, OSError) as error:
+            logger.warning('SMTP-соединение оборвалось (%s), переподключаемся', error)
+            self.connection.close()
+            self.connection.open()
+            sent = self.connection.send_messages(messages)
+        self.sent += sent or 0
+        return sent
+
+
+def news_notification(news):
+    """
+    Возвращает заголовок и текст уведомления о новости.
+    """
+    title = Truncator(f'Новая новость: {news.title}').chars(255)
+    message = Truncator(news.content).chars(500)
+    return title, message
+
+
+def fan_out(recipients, title, message, chunk_size=1000, send_email=True, connection=None,
+            news_id=None, heartbeat=None):
+    """
+    Создаёт уведомления и отправляет письма получателям пачками.
+
+    Параметры:
+    recipients: QuerySet пользователей.
+    title, message: заголовок и текст уведомления (и письма).
+    chunk_size: размер пачки получателей.
+    send_email: отправлять письма пользователям с ``notify_by_email``.
+    connection: соединение почтового бэкенда (по умолчанию ``get_connection()``).
+    news_id: ID новости, о которой уведомления; уже существующие уведомления
+             о ней пропускаются без ошибки.
+    heartbeat: функция без аргументов, вызывается после записи каждой пачки
+               уведомлений, до отправки её писем (исключение прерывает рассылку).
+
+    Возвращает:
+    Словарь с количеством записанных уведомлений и отправленных писем.
+    """
+    rows = (recipients.order_by('pk')
+            .values_list('pk', 'email', 'notify_by_email')
+            .iterator(chunk_size=chunk_size))
+    created = 0
+    with MailSender(connection) if send_email else nullcontext() as sender:
+        batch, messages = [], []
+        for user_id, email, notify_by_email in rows:
+            batch.append(Notification(user_id=user_id, title=title, message=message,
+                                      news_id=news_id))
+            if sender and notify_by_email and email:
+                messages.append(EmailMessage(title, message, to=[email]))
+            if len(batch) >= chunk_size:
+                created += _flush(batch, messages, sender, heartbeat)
+                batch, messages = [], []
+        created += _flush(batch, messages, sender, heartbeat)
+    return {'notifications': created, 'emails': sender.sent if sender else 0}
+
+
+def _flush(batch, messages, sender, heartbeat):
+    if not batch:
+        return 0
+    Notification.objects.bulk_create(batch, ignore_conflicts=True)
+    # bulk_create не вызывает сигналов — счётчики непрочитанных сбрасываем сами.
+    reset_unread_counts([notification.user_id for notification in batch])
+    if heartbeat:
+        heartbeat()
+    if sender:
+        sender.send(messages)
+    return len(batch)
+
+
+def _claimable_news(now, timeout):
+    """
+    Опубликованные новости, рассылку которых можно забрать: она не
+    выполнялась или прервана (отметка начала старше ``timeout`` секунд).
+    """
+    return (News.objects.filter(is_published=True, notified_at__isnull=True)
+            .filter(Q(notification_started_at__isnull=True)
+                    | Q(notification_started_at__lt=now - timedelta(seconds=timeout))))
+
+
+def notify_news_published(news_id, resume=True):
+    """
+    Рассылает уведомления о публикации новости, если этого ещё не делали.
+
+    Параметры:
+    resume: пропустить пользователей, которые уже получили уведомление
+            об этой новости (продолжение прерванной рассылки).
+
+    Возвращает:
+    Результат ``fan_out`` или ``None``, если новость не опубликована,
+    рассылка уже выполнена или её выполняет другой обработчик.
+    """
+    config = get_config()
+    claimed_at = timezone.now()
+    claimed = (_claimable_news(claimed_at, config['PROCESSING_TIMEOUT']).filter(pk=news_id)
+               .update(notification_started_at=claimed_at))
+    if not claimed:
+        return None
+
+    def heartbeat():
+        # Продлеваем отметку, только если рассылка всё ещё наша.
+        nonlocal claimed_at
+        now = timezone.now()
+        if not (News.objects.filter(pk=news_id, notification_started_at=claimed_at)
+                .update(notification_started_at=now)):
+            raise ClaimLost(news_id)
+        claimed_at = now
+
+    news = News.objects.get(pk=news_id)
+    title, message = news_notification(news)
+    recipients = CustomUser.objects.filter(is_active=True)
+    if resume:
+        recipients = recipients.exclude(pk__in=Notification.objects.filter(news_id=news_id)
+                                        .values('user_id'))
+    try:
+        stats = fan_out(recipients, title, message, chunk_size=config['CHUNK_SIZE'],
+                        send_email=config['EMAIL'], news_id=news_id, heartbeat=heartbeat)
+    except ClaimLost:
+        logger.warning('Рассылку уведомлений о новости %s забрал другой обработчик', news_id)
+        return None
+    except Exception:
+        # Снимаем отметку, чтобы следующий проход продолжил рассылку сразу.
+        News.objects.filter(pk=news_id, notification_started_at=claimed_at).update(
+            notification_started_at=None)
+        logger.exception('Рассылка уведомлений о новости %s прервана', news_id)
+        raise
+    News.objects.filter(pk=news_id, notification_started_at=claimed_at).update(
+        notified_at=timezone.now(), notification_started_at=None)
+    logger.info('Новость %s: создано уведомлений %s, отправлено писем %s',
+                news_id, stats['notifications'], stats['emails'])
+    return stats
+
+
+def notify_pending_news():
+    """
+    Рассылает уведомления обо всех опубликованных новостях, которые их
+    ждут. Ошибка рассылки одной новости записывается в журнал и не мешает
+    остальным; новость будет забрана следующим проходом.
+
+    Возвращает:
+    Словарь: ID новости -> результат ``fan_out``.
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return {}
+    pending = (_claimable_news(timezone.now(), config['PROCESSING_TIMEOUT'])
+               .order_by('pk').values_list('pk', flat=True))
+    sent = {}
+    for news_id in list(pending):
+        try:
+            stats = notify_news_published(news_id)
+        except Exception:
+            continue
+        if stats is not None:
+            sent[news_id] = stats
+    return sent
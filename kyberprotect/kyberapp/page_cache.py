@@ -0,0 +1,237 @@
+"""
+Кеш публичных страниц для анонимных посетителей.
+
+Страницы, одинаковые для всех анонимных посетителей (главная, список уроков,
+новость), кешируются целиком. Ключ страницы включает путь, номер страницы
+и версии контента, от которого она зависит, поэтому сохранение или удаление
+новости или урока сразу делает устаревшими только связанные страницы
+(см. ``signals.py``).
+
+После истечения ``TIMEOUT`` страницу перестраивает один запрос, остальные
+в это время получают устаревшую копию. Если копии нет совсем, остальные
+запросы недолго ждут, пока её построит первый.
+
+Настройки (``settings.KYBERAPP_PAGE_CACHE``):
+- ``ENABLED`` — включить кеш (по умолчанию ``True``);
+- ``ALIAS`` — алиас кеша из ``settings.CACHES`` (по умолчанию ``'default'``);
+- ``TIMEOUT`` — сколько секунд страница считается свежей (60);
+- ``STALE_TIMEOUT`` — сколько секунд после этого можно отдавать устаревшую копию (600);
+- ``LOCK_TIMEOUT`` — максимальное время перестроения страницы (30);
+- ``WAIT_TIMEOUT`` — сколько ждать чужого перестроения, если копии нет (2).
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from . import async_support
+from .routers import primary
+from .versions import aget_version, bump_version, get_version
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+    'STALE_TIMEOUT': 600,
+    'LOCK_TIMEOUT': 30,
+    'WAIT_TIMEOUT': 2,
+}
+
+_stats = {'hit': 0, 'stale': 0, 'miss': 0, 'bypass': 0}
+_stats_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_PAGE_CACHE', {})}
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def get_stats():
+    """
+    Счётчики кеша страниц текущего процесса: ``hit`` — свежая копия,
+    ``stale`` — устаревшая копия, пока страницу перестраивает другой запрос,
+    ``miss`` — страница построена заново, ``bypass`` — запрос не кешируется.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for outcome in _stats:
+            _stats[outcome] = 0
+
+
+def _is_cacheable(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # Страницы с сообщениями (django.contrib.messages) не кешируем,
+    # иначе сообщение попадёт в кеш или не будет показано.
+    return not len(get_messages(request))
+
+
+def _page_key(request, view_name, params, versions):
+    query = '&'.join(f'{param}={request.GET.get(param, "")}' for param in params)
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'kyberapp:page:{view_name}:{digest}:{":".join(map(str, versions))}'
+
+
+def _cache_entry(response, config):
+    if response.status_code != 200 or response.cookies or getattr(response, 'streaming', False):
+        return None
+    return {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'status': response.status_code,
+        'fresh_until': time.time() + config['TIMEOUT'],
+    }
+
+
+def _response_from_entry(entry, outcome):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'],
+                            status=entry['status'])
+    response['X-Page-Cache'] = outcome
+    return response
+
+
+def cache_public_page(*dependencies, params=('page',)):
+    """
+    Кеширует страницу для анонимных посетителей.
+
+    Параметры:
+    dependencies: имена контента, от которого зависит страница. Могут
+                  содержать параметры представления, например ``'news:{pk}'``.
+    params: GET-параметры, от которых зависит страница (по умолчанию номер
+            страницы).
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_wrapper(view, dependencies, params)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            config = get_config()
+            if not config['ENABLED'] or not _is_cacheable(request):
+                _count('bypass')
+                return view(request, *args, **kwargs)
+
+            cache = caches[config['ALIAS']]
+            versions = [get_version('page', dependency.format(**kwargs))
+                        for dependency in dependencies]
+            key = _page_key(request, view.__name__, params, versions)
+            lock_key = f'{key}:lock'
+            entry = cache.get(key)
+            now = time.time()
+
+            if entry is not None and entry['fresh_until'] > now:
+                _count('hit')
+                return _response_from_entry(entry, 'hit')
+
+            locked = cache.add(lock_key, 1, config['LOCK_TIMEOUT'])
+            if not locked:
+                if entry is not None:
+                    # Страницу уже перестраивает другой запрос.
+                    _count('stale')
+                    return _response_from_entry(entry, 'stale')
+                deadline = now + config['WAIT_TIMEOUT']
+                while time.time() < deadline:
+                    time.sleep(0.05)
+                    entry = cache.get(key)
+                    if entry is not None:
+                        _count('hit')
+                        return _response_from_entry(entry, 'hit')
+
+            try:
+                # Страница кешируется под текущими версиями — собираем её
+                # по основной базе, а не по отстающей реплике.
+                with primary():
+                    response = view(request, *args, **kwargs)
+                entry = _cache_entry(response, config)
+                if entry is not None:
+                    cache.set(key, entry, config['TIMEOUT'] + config['STALE_TIMEOUT'])
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            _count('miss')
+            response['X-Page-Cache'] = 'miss'
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _async_wrapper(view, dependencies, params):
+    """
+    Та же логика кеша для асинхронного представления. Свежая копия
+    отдаётся без перехода в поток (см. async_support.py).
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        config = get_config()
+        await async_support.aload_user(request)
+        if not config['ENABLED'] or not _is_cacheable(request):
+            _count('bypass')
+            return await view(request, *args, **kwargs)
+
+        cache = caches[config['ALIAS']]
+        versions = [await aget_version('page', dependency.format(**kwargs))
+                    for dependency in dependencies]
+        key = _page_key(request, view.__name__, params, versions)
+        lock_key = f'{key}:lock'
+        entry = await async_support.aget(key, cache=cache)
+        now = time.time()
+
+        if entry is not None and entry['fresh_until'] > now:
+            _count('hit')
+            return _response_from_entry(entry, 'hit')
+
+        locked = await async_support.aadd(lock_key, 1, config['LOCK_TIMEOUT'], cache=cache)
+        if not locked:
+            if entry is not None:
+                _count('stale')
+                return _response_from_entry(entry, 'stale')
+            deadline = now + config['WAIT_TIMEOUT']
+            while time.time() < deadline:
+                await asyncio.sleep(0.05)
+                entry = await async_support.aget(key, cache=cache)
+                if entry is not None:
+                    _count('hit')
+                    return _response_from_entry(entry, 'hit')
+
+        try:
+            with primary():
+                response = await view(request, *args, **kwargs)
+            entry = _cache_entry(response, config)
+            if entry is not None:
+                await async_support.aset(key, entry, config['TIMEOUT'] + config['STALE_TIMEOUT'],
+                                         cache=cache)
+        finally:
+            if locked:
+                await async_support.adelete(lock_key, cache=cache)
+        _count('miss')
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    return wrapper
+
+
+def invalidate_pages(*dependencies):
+    """
+    Делает устаревшими страницы, зависящие от указанного контента.
+    """
+    for dependency in dependencies:
+        bump_version('page', dependency)
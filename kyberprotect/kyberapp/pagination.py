@@ -0,0 +1,222 @@
+"""
+Постраничный вывод по ключу (keyset/cursor pagination).
+
+В отличие от ``django.core.paginator.Paginator`` не выполняет ``COUNT(*)``
+и не использует OFFSET: следующая страница выбирается условием «после
+последней записи текущей страницы» по упорядоченным полям (например,
+``(created_at, id)``), поэтому стоимость страницы не зависит от её глубины
+при наличии составного индекса по этим полям.
+
+Курсор — строка для GET-параметра ``cursor``: значения полей последней
+(или первой) записи страницы и направление. Специальный курсор ``last``
+открывает последнюю страницу.
+"""
+import base64
+import datetime
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from . import async_support
+
+NEXT = 'next'
+PREVIOUS = 'prev'
+LAST = 'last'
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Кодирует даты с микросекундами: ``DjangoJSONEncoder`` обрезает их
+    до миллисекунд, и курсор перестал бы совпадать с записью.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    """
+    Страница результатов. Поддерживает итерацию, как ``Page`` из Django.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], NEXT)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], PREVIOUS)
+
+
+class KeysetPaginator:
+    """
+    Разбивает упорядоченный QuerySet на страницы по курсору.
+
+    Параметры:
+    queryset: исходный QuerySet.
+    per_page: количество записей на странице.
+    ordering: поля сортировки; последнее поле должно быть уникальным
+              (например, ``('-created_at', '-id')``).
+    count_cache_key: ключ кеша для приблизительного количества записей.
+    count_timeout: сколько секунд хранить приблизительное количество.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'),
+                 count_cache_key=None, count_timeout=300):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.count_cache_key = count_cache_key
+        self.count_timeout = count_timeout
+        self._fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+        self._approximate_count = None
+
+    @property
+    def approximate_count(self):
+        """
+        Количество записей из кеша (пересчитывается не чаще раза
+        в ``count_timeout`` секунд). Без ``count_cache_key`` — ``None``.
+        """
+        if self.count_cache_key is None:
+            return None
+        if self._approximate_count is None:
+            count = cache.get(self.count_cache_key)
+            if count is None:
+                count = self.queryset.count()
+                cache.set(self.count_cache_key, count, self.count_timeout)
+            self._approximate_count = count
+        return self._approximate_count
+
+    async def aget_approximate_count(self):
+        """
+        Асинхронно вычисляет ``approximate_count``, чтобы шаблон потом
+        не обращался к базе.
+        """
+        if self.count_cache_key is not None and self._approximate_count is None:
+            count = await async_support.aget(self.count_cache_key)
+            if count is None:
+                count = await self.queryset.acount()
+                await async_support.aset(self.count_cache_key, count, self.count_timeout)
+            self._approximate_count = count
+        return self._approximate_count
+
+    def encode_cursor(self, obj, direction):
+        values = [getattr(obj, name) for name, descending in self._fields]
+        payload = json.dumps([direction, values], cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Возвращает (направление, значения полей) или ``None`` для
+        некорректного курсора.
+        """
+        if cursor == LAST:
+            return LAST, None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if direction not in (NEXT, PREVIOUS) or len(raw_values) != len(self._fields):
+                return None
+            model = self.queryset.model
+            values = [model._meta.get_field(name).to_python(value)
+                      for (name, descending), value in zip(self._fields, raw_values)]
+        except (TypeError, ValueError, LookupError, ValidationError):
+            return None
+        return direction, values
+
+    def _after(self, values, forward):
+        """
+        Условие «строго после записи с такими значениями полей» в порядке
+        сортировки (или перед ней, если ``forward`` ложно).
+        """
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self._fields, values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        # Нестрогая граница по первому полю позволяет базе начать обход
+        # индекса сразу с нужного места, а не фильтровать его с начала.
+        first_name, first_descending = self._fields[0]
+        bound = 'lte' if first_descending == forward else 'gte'
+        return Q(**{f'{first_name}__{bound}': values[0]}) & condition
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def _plan_page(self, cursor):
+        """
+        Возвращает запрос страницы (на одну запись больше, чтобы узнать,
+        есть ли следующая) и функцию, собирающую страницу из его строк.
+        """
+        decoded = self.decode_cursor(cursor) if cursor else None
+        limit = self.per_page + 1
+
+        if decoded is None:
+            def build(rows):
+                return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, False)
+            return self.queryset.order_by(*self.ordering)[:limit], build
+
+        direction, values = decoded
+        if direction == NEXT:
+            def build(rows):
+                return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, True)
+            return (self.queryset.filter(self._after(values, forward=True))
+                    .order_by(*self.ordering)[:limit]), build
+
+        # Предыдущая или последняя страница: идём в обратном порядке и разворачиваем.
+        queryset = self.queryset
+        if direction == PREVIOUS:
+            queryset = queryset.filter(self._after(values, forward=False))
+
+        def build(rows):
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            return KeysetPage(rows, self, direction == PREVIOUS, has_previous)
+        return queryset.order_by(*self._reversed_ordering())[:limit], build
+
+    def get_page(self, cursor=None):
+        """
+        Возвращает страницу по курсору. Пустой или некорректный курсор
+        открывает первую страницу.
+        """
+        queryset, build = self._plan_page(cursor)
+        return build(list(queryset))
+
+    async def aget_page(self, cursor=None):
+        """
+        Асинхронная версия ``get_page``.
+        """
+        queryset, build = self._plan_page(cursor)
+        return build([obj async for obj in queryset])
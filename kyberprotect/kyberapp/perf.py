@@ -0,0 +1,378 @@
+"""
+Замеры производительности запросов по представлениям.
+
+Для каждого запроса ``PerfMiddleware`` записывает общее время, время
+SQL-запросов, их количество, повторы одного и того же запроса (признак
+N+1) и время отрисовки шаблона. Замеры складываются в гистограммы
+в памяти процесса по имени маршрута (``home``, ``profile``,
+``test_detail``...; для админки — ``admin:...``).
+
+- SQL считает обёртка ``execute_wrapper``, которая ставится на каждое
+  соединение при его открытии (сигнал ``connection_created``, см. apps.py).
+  Вне запроса она только проверяет контекстную переменную.
+- Шаблоны замеряет бэкенд ``TimedTemplates`` (``settings.TEMPLATES``):
+  учитывается отрисовка шаблона верхнего уровня вместе с вложенными
+  и с запросами, выполненными из шаблона.
+- Повтором считается запрос с одинаковым SQL (параметры не учитываются),
+  выполненный в одном запросе не меньше ``DUPLICATE_THRESHOLD`` раз.
+  О каждом таком месте один раз пишется предупреждение в журнал.
+
+Гистограммы отдаёт представление ``/metrics/`` в текстовом формате
+Prometheus, а команда ``manage.py perf_report`` читает его и выводит
+таблицу с перцентилями. Гистограммы свои у каждого процесса сервера.
+
+Настройки (``settings.KYBERAPP_PERF``):
+- ``ENABLED`` — собирать замеры (``False``); обёртка SQL ставится
+  только на соединения, открытые при включённых замерах;
+- ``DUPLICATE_THRESHOLD`` — с какого числа повторов запрос считается N+1 (5);
+- ``METRICS_TOKEN`` — токен, с которым ``/metrics/`` доступен без входа
+  (заголовок ``Authorization: Bearer <токен>``); пустой — только
+  сотрудникам;
+- ``METRICS_URL`` — адрес ``/metrics/`` для ``perf_report`` по умолчанию.
+"""
+import hmac
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'DUPLICATE_THRESHOLD': 5,
+    'METRICS_TOKEN': '',
+    'METRICS_URL': 'http://127.0.0.1:8000/metrics/',
+}
+
+# Границы корзин: время в секундах и количество SQL-запросов.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Сколько мест N+1 запоминать, чтобы не повторять предупреждение.
+MAX_REPORTED_DUPLICATES = 1000
+
+_current = ContextVar('kyberapp_perf_request', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_PERF', {})}
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин (как в Prometheus:
+    значение попадает в первую корзину с границей не меньше него).
+    """
+
+    def __init__(self, bounds, counts=None, total=0.0):
+        self.bounds = tuple(bounds)
+        # Последняя корзина — значения больше всех границ (+Inf).
+        self.counts = list(counts) if counts is not None else [0] * (len(self.bounds) + 1)
+        self.total = total
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def quantile(self, q):
+        """
+        Оценка квантиля ``q`` (0–1) с линейной интерполяцией внутри корзины.
+        """
+        rank = q * self.count
+        if not rank:
+            return 0.0
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if index == len(self.bounds):
+                    return float(self.bounds[-1])
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return float(self.bounds[-1])
+
+    def copy(self):
+        return Histogram(self.bounds, self.counts, self.total)
+
+
+class ViewMetrics:
+    """
+    Замеры одного представления.
+    """
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_duration = Histogram(DURATION_BUCKETS)
+        self.template_duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.duplicate_queries = 0
+        self.n_plus_one_requests = 0
+
+    def copy(self):
+        metrics = ViewMetrics()
+        for name in ('duration', 'db_duration', 'template_duration', 'queries'):
+            setattr(metrics, name, getattr(self, name).copy())
+        metrics.duplicate_queries = self.duplicate_queries
+        metrics.n_plus_one_requests = self.n_plus_one_requests
+        return metrics
+
+
+class Registry:
+    """
+    Гистограммы всех представлений процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, stats, duration, duplicates):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics()
+            metrics.duration.observe(duration)
+            metrics.db_duration.observe(stats.db_time)
+            metrics.template_duration.observe(stats.render_time)
+            metrics.queries.observe(stats.queries)
+            if duplicates:
+                metrics.duplicate_queries += sum(count - 1 for count in duplicates.values())
+                metrics.n_plus_one_requests += 1
+
+    def snapshot(self):
+        """
+        Возвращает копию замеров: словарь имя представления -> ``ViewMetrics``.
+        """
+        with self._lock:
+            return {view: metrics.copy() for view, metrics in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = Registry()
+_reported_duplicates = set()
+
+
+class RequestStats:
+    """
+    Замеры текущего запроса.
+    """
+    __slots__ = ('queries', 'db_time', 'render_time', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statements = {}
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+        stats.statements[sql] = stats.statements.get(sql, 0) + 1
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """
+    Обработчик ``connection_created``: ставит обёртку замера SQL.
+    """
+    if get_config()['ENABLED'] and execute_wrapper not in connection.execute_wrappers:
+        # В начало списка: connection.execute_wrapper() снимает свою обёртку
+        # с конца, даже если соединение открылось внутри его блока.
+        connection.execute_wrappers.insert(0, execute_wrapper)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None and match.view_name else 'unresolved'
+
+
+def record_request(request, stats, duration, threshold):
+    view = view_name(request)
+    duplicates = {sql: count for sql, count in stats.statements.items() if count >= threshold}
+    registry.record(view, stats, duration, duplicates)
+    for sql, count in duplicates.items():
+        key = (view, sql)
+        if key in _reported_duplicates or len(_reported_duplicates) >= MAX_REPORTED_DUPLICATES:
+            continue
+        _reported_duplicates.add(key)
+        logger.warning('Возможный N+1 в %s: запрос выполнен %s раз: %s', view, count, sql[:300])
+
+
+class PerfMiddleware:
+    """
+    Замеряет запрос и записывает его в гистограммы представления.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        record_request(request, stats, time.perf_counter() - started,
+                       config['DUPLICATE_THRESHOLD'])
+        return response
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        record_request(request, stats, time.perf_counter() - started,
+                       config['DUPLICATE_THRESHOLD'])
+        return response
+
+
+class TimedTemplate:
+    """
+    Шаблон, время отрисовки которого добавляется к замерам запроса.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.render_time += time.perf_counter() - started
+
+
+class TimedTemplates(DjangoTemplates):
+    """
+    Бэкенд шаблонов Django с замером времени отрисовки.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def metrics_allowed(request):
+    """
+    ``/metrics/`` доступен сотрудникам и запросам с ``METRICS_TOKEN``.
+    """
+    token = get_config()['METRICS_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+        return True
+    return request.user.is_staff
+
+
+# Метрики в формате Prometheus: имя -> (атрибут ViewMetrics, тип, описание).
+METRICS = {
+    'kyberapp_request_duration_seconds': ('duration', 'histogram', 'Время обработки запроса'),
+    'kyberapp_db_duration_seconds': ('db_duration', 'histogram', 'Время SQL-запросов'),
+    'kyberapp_template_duration_seconds': ('template_duration', 'histogram',
+                                           'Время отрисовки шаблонов'),
+    'kyberapp_db_queries': ('queries', 'histogram', 'Количество SQL-запросов'),
+    'kyberapp_duplicate_queries_total': ('duplicate_queries', 'counter',
+                                         'Повторные выполнения одного SQL (N+1)'),
+    'kyberapp_n_plus_one_requests_total': ('n_plus_one_requests', 'counter',
+                                           'Запросы с повторами SQL (N+1)'),
+}
+
+METRIC_LINE = re.compile(r'^(?P<name>\w+)\{view="(?P<view>[^"]*)"(?:,le="(?P<le>[^"]+)")?\} '
+                         r'(?P<value>\S+)$')
+
+
+def render_metrics(snapshot=None):
+    """
+    Замеры в текстовом формате Prometheus.
+    """
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    lines = []
+    for name, (attribute, kind, description) in METRICS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        for view, metrics in sorted(snapshot.items()):
+            value = getattr(metrics, attribute)
+            if kind == 'counter':
+                lines.append(f'{name}{{view="{view}"}} {value}')
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(value.bounds, value.counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{view="{view}",le="{bound:g}"}} '
+                             f'{cumulative}')
+            lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {value.count}')
+            lines.append(f'{name}_sum{{view="{view}"}} {value.total:.6f}')
+            lines.append(f'{name}_count{{view="{view}"}} {value.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def parse_metrics(text):
+    """
+    Разбирает вывод ``render_metrics`` обратно в словарь
+    имя представления -> ``ViewMetrics``.
+    """
+    attributes = {name: attribute for name, (attribute, kind, description) in METRICS.items()}
+    cumulative = {}
+    snapshot = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, view, value = match['name'], match['view'], float(match['value'])
+        metrics = snapshot.setdefault(view, ViewMetrics())
+        if name in attributes:
+            setattr(metrics, attributes[name], int(value))
+        elif name.endswith('_bucket'):
+            # Значения корзин накопительные, последняя — +Inf.
+            cumulative.setdefault((view, name[:-len('_bucket')]), []).append(int(value))
+        elif name.endswith('_sum'):
+            getattr(metrics, attributes[name[:-len('_sum')]]).total = value
+    for (view, name), counts in cumulative.items():
+        histogram = getattr(snapshot[view], attributes[name])
+        histogram.counts = [count - previous for count, previous in zip(counts, [0] + counts[:-1])]
+    return snapshot
@@ -0,0 +1,265 @@
+"""
+Прогресс пользователей.
+
+Сводка (``UserProgress``) пересчитывается для конкретных пользователей при
+записи их достижений и результатов тестов, поэтому страница профиля читает
+одну строку вместо обхода всех задач и достижений. Изменения каталога
+(достижений и задач) увеличивают версию каталога; устаревшие сводки
+пересчитываются при следующем чтении.
+
+Прогресс по урокам хранится в ``CustomUser.progress`` (например,
+``{"1": 75, "2": 100}``): урок пройден на 100%, если пройден его тест,
+иначе — на долю выполненных задач урока. При событиях проценты только
+повышаются одним атомарным UPDATE, поэтому одновременные отправки тестов
+не теряют записи друг друга; полный пересчёт перезаписывает значения под
+блокировкой строк.
+"""
+import json
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import (Achievement, CustomUser, Task, TestResult, UserAchievement,
+                     UserProgress)
+from .routers import primary
+from .versions import get_version
+
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+
+def get_catalog():
+    """
+    Возвращает сведения о каталоге, нужные для расчёта прогресса:
+    версию, количество достижений и список задач (ID, урок, достижение).
+    Кешируется по версии каталога и читается с основной базы.
+    """
+    version = get_version('catalog')
+    cache_key = f'kyberapp:progress_catalog:{version}'
+    catalog = cache.get(cache_key)
+    if catalog is None:
+        with primary():
+            catalog = {
+                'version': version,
+                'total_achievements': Achievement.objects.count(),
+                'tasks': list(Task.objects.order_by('id')
+                              .values_list('id', 'lesson_id', 'achievement_id')),
+            }
+        cache.set(cache_key, catalog, CATALOG_CACHE_TIMEOUT)
+    return catalog
+
+
+def get_task_list():
+    """
+    Возвращает задачи для страницы профиля по порядку ID: словари с ключами
+    ``id``, ``lesson_title`` и ``question``. Кешируется по версиям каталога
+    и уроков отдельно от ``get_catalog``, чтобы тексты задач не читались
+    из кеша при каждой проверке прогресса.
+    """
+    cache_key = f'kyberapp:progress_tasks:{get_version("catalog")}:{get_version("lessons")}'
+    tasks = cache.get(cache_key)
+    if tasks is None:
+        with primary():
+            tasks = [{'id': task_id, 'lesson_title': lesson_title, 'question': question}
+                     for task_id, lesson_title, question in Task.objects.order_by('id')
+                     .values_list('id', 'lesson__title', 'question')]
+        cache.set(cache_key, tasks, CATALOG_CACHE_TIMEOUT)
+    return tasks
+
+
+def compute_progress(user_ids, catalog=None):
+    """
+    Считает сводку прогресса для нескольких пользователей двумя запросами.
+
+    Возвращает:
+    Словарь ID пользователя -> значения полей ``UserProgress`` и прогресс
+    по урокам (ключ ``lessons``).
+    """
+    catalog = catalog or get_catalog()
+    user_ids = list(user_ids)
+
+    earned = {user_id: set() for user_id in user_ids}
+    for user_id, achievement_id in (UserAchievement.objects.filter(user_id__in=user_ids)
+                                    .values_list('user_id', 'achievement_id')):
+        earned[user_id].add(achievement_id)
+
+    passed_tests = {user_id: set() for user_id in user_ids}
+    passed_lessons = {user_id: set() for user_id in user_ids}
+    for user_id, test_id, lesson_id in (TestResult.objects.filter(user_id__in=user_ids,
+                                                                  passed=True)
+                                        .order_by()
+                                        .values_list('user_id', 'test_id', 'test__lesson_id')
+                                        .distinct()):
+        passed_tests[user_id].add(test_id)
+        passed_lessons[user_id].add(lesson_id)
+
+    lesson_tasks = {}
+    for task_id, lesson_id, achievement_id in catalog['tasks']:
+        lesson_tasks[lesson_id] = lesson_tasks.get(lesson_id, 0) + 1
+
+    total = catalog['total_achievements']
+    summaries = {}
+    for user_id in user_ids:
+        achievement_ids = earned[user_id]
+        # Задача выполнена, если пользователь получил достижение за неё.
+        completed_tasks = []
+        completed_by_lesson = {}
+        for task_id, lesson_id, achievement_id in catalog['tasks']:
+            if achievement_id in achievement_ids:
+                completed_tasks.append(task_id)
+                completed_by_lesson[lesson_id] = completed_by_lesson.get(lesson_id, 0) + 1
+
+        summaries[user_id] = {
+            'earned_achievements': len(achievement_ids),
+            'progress_percent': int(len(achievement_ids) / total * 100) if total else 0,
+            'passed_tests': len(passed_tests[user_id]),
+            'completed_task_ids': completed_tasks,
+            'catalog_version': catalog['version'],
+            'lessons': lesson_percents(completed_by_lesson, lesson_tasks,
+                                       passed_lessons[user_id]),
+        }
+    return summaries
+
+
+def lesson_percents(completed_by_lesson, lesson_tasks, passed_lessons):
+    """
+    Проценты прохождения уроков: 100 для уроков с пройденным тестом,
+    иначе доля выполненных задач. Уроки без прогресса не включаются.
+    """
+    percents = {}
+    for lesson_id, count in lesson_tasks.items():
+        percent = int(completed_by_lesson.get(lesson_id, 0) / count * 100)
+        if percent:
+            percents[str(lesson_id)] = percent
+    for lesson_id in passed_lessons:
+        percents[str(lesson_id)] = 100
+    return percents
+
+
+def raise_lesson_progress(user, percents):
+    """
+    Атомарно повышает проценты прохождения уроков в ``CustomUser.progress``.
+    Значения, которые уже выше переданных, не меняются.
+
+    Параметры:
+    user: пользователь или его ID.
+    percents: словарь ID урока -> процент.
+    """
+    user_id = getattr(user, 'pk', user)
+    percents = {str(int(lesson_id)): int(percent) for lesson_id, percent in percents.items()}
+    if not percents:
+        return
+
+    if connection.vendor == 'sqlite':
+        # Слияние выполняется самой базой в одном UPDATE (JSON1). Новые
+        # проценты передаются одним JSON-параметром: вызов json_set на каждый
+        # урок упирается в лимиты SQLite на глубину выражения и число
+        # аргументов функции уже на нескольких десятках уроков.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {connection.ops.quote_name(CustomUser._meta.db_table)} '
+                f'SET progress = json_patch(progress, ('
+                f'SELECT json_group_object(new.key, MAX(new.value, COALESCE('
+                f"json_extract(progress, '$.' || json_quote(new.key)), 0))) "
+                f'FROM json_each(%s) AS new)) WHERE id = %s',
+                [json.dumps(percents), user_id],
+            )
+    else:
+        with transaction.atomic():
+            locked = CustomUser.objects.select_for_update().only('progress').get(pk=user_id)
+            progress = dict(locked.progress or {})
+            for lesson_id, percent in percents.items():
+                progress[lesson_id] = max(progress.get(lesson_id, 0), percent)
+            CustomUser.objects.filter(pk=user_id).update(progress=progress)
+
+    if isinstance(user, CustomUser):
+        # Обновляем и объект в памяти, чтобы он не расходился с базой.
+        progress = dict(user.progress or {})
+        for lesson_id, percent in percents.items():
+            progress[lesson_id] = max(progress.get(lesson_id, 0), percent)
+        user.progress = progress
+
+
+def recompute_lesson_progress(user_ids, catalog=None, summaries=None):
+    """
+    Пересчитывает ``CustomUser.progress`` для нескольких пользователей
+    и перезаписывает значения под блокировкой строк.
+    """
+    summaries = summaries or compute_progress(user_ids, catalog)
+    with transaction.atomic():
+        users = list(CustomUser.objects.select_for_update()
+                     .filter(pk__in=list(summaries)).only('pk'))
+        for user in users:
+            user.progress = summaries[user.pk]['lessons']
+        CustomUser.objects.bulk_update(users, ['progress'])
+
+
+def refresh_progress(user_ids, catalog=None, overwrite=False):
+    """
+    Пересчитывает и сохраняет сводки указанных пользователей одним
+    ``bulk_create`` с обновлением при конфликте и обновляет их прогресс
+    по урокам.
+
+    Параметры:
+    overwrite: перезаписать прогресс по урокам целиком (полный пересчёт);
+               по умолчанию проценты только повышаются.
+    """
+    summaries = compute_progress(user_ids, catalog)
+    fields = ['earned_achievements', 'progress_percent', 'passed_tests',
+              'completed_task_ids', 'catalog_version']
+    UserProgress.objects.bulk_create(
+        [UserProgress(user_id=user_id, **{field: values[field] for field in fields})
+         for user_id, values in summaries.items()],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=fields + ['updated_at'],
+    )
+    if overwrite:
+        recompute_lesson_progress(user_ids, summaries=summaries)
+    else:
+        for user_id, values in summaries.items():
+            raise_lesson_progress(user_id, values['lessons'])
+
+
+def mark_progress_stale(user_ids):
+    """
+    Помечает сводки пользователей устаревшими одним UPDATE.
+    """
+    UserProgress.objects.filter(user_id__in=user_ids).update(catalog_version=0)
+
+
+def get_progress(user):
+    """
+    Возвращает сводку прогресса пользователя, пересчитывая её, если сводки
+    ещё нет или каталог изменился с момента расчёта.
+    """
+    catalog = get_catalog()
+    progress = UserProgress.objects.filter(user_id=user.pk).first()
+    if progress is None or progress.catalog_version != catalog['version']:
+        refresh_progress([user.pk], catalog, overwrite=True)
+        progress = UserProgress.objects.get(user_id=user.pk)
+        user.refresh_from_db(fields=['progress'])
+    return progress
+
+
+def rebuild_all(batch_size=1000):
+    """
+    Пересчитывает сводки и прогресс по урокам всех пользователей пачками
+    по ``batch_size``.
+
+    Возвращает:
+    Количество обработанных пользователей.
+    """
+    catalog = get_catalog()
+    total = 0
+    batch = []
+    for user_id in CustomUser.objects.order_by('pk').values_list('pk', flat=True).iterator(
+            chunk_size=batch_size):
+        batch.append(user_id)
+        if len(batch) >= batch_size:
+            refresh_progress(batch, catalog, overwrite=True)
+            total += len(batch)
+            batch = []
+    if batch:
+        refresh_progress(batch, catalog, overwrite=True)
+        total += len(batch)
+    return total
@@ -0,0 +1,206 @@
+"""
+Чтение с реплики базы данных.
+
+``ReplicaRouter`` (``settings.DATABASE_ROUTERS``) отправляет чтение
+публичного контента — новостей, уроков, тестов с вопросами и ответами,
+задач, достижений и рейтингов — на реплику, а запись всегда на основную базу.
+Отчёты (списки истории и прогресса в админке, выгрузки) читают с реплики
+все модели внутри ``with reporting():``. Пользователи, сессии,
+результаты и очередь отправок читаются с основной базы.
+
+Чтобы пользователь сразу видел свои изменения, запрос целиком
+закрепляется за основной базой (``ReplicaMiddleware``):
+- если это не GET/HEAD/OPTIONS (отправка теста, вход, сохранение в админке);
+- после первой записи в этом запросе;
+- в течение ``STICKY_SECONDS`` после запроса с записью: время хранится
+  в cookie браузера, поэтому базу для проверки читать не нужно.
+Вне запросов (команды, ``grade_worker``) чтение идёт с основной базы,
+кроме блоков ``reporting()``.
+
+Кеши с версией контента (дерево теста, ключ ответов, каталог задач,
+индекс правил достижений, снимки рейтингов, страницы) перестраиваются
+внутри ``with primary():``. Запись увеличивает версию на основной базе,
+и следующий запрос любого посетителя промахивается мимо кеша; прочитай он
+данные с отстающей реплики, устаревшие данные легли бы в кеш под новой
+версией на всё время его жизни.
+
+Локально реплику заменяет копия файла SQLite: задайте путь к ней
+в переменной окружения ``KYBERAPP_REPLICA_DB`` и обновляйте её командой
+``manage.py sync_replica`` (с ``--interval`` — периодически, как реплику
+с задержкой).
+
+Настройки (``settings.KYBERAPP_REPLICA``):
+- ``ENABLED`` — читать с реплики (``False``);
+- ``ALIAS`` — псевдоним реплики в ``DATABASES`` (``'replica'``);
+- ``READ_MODELS`` — модели (``app_label.model``), читаемые с реплики;
+- ``STICKY_SECONDS`` — сколько секунд после записи читать с основной
+  базы (10);
+- ``COOKIE_NAME`` — cookie с временем окончания этого окна.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULTS = {
+    'ENABLED': False,
+    'ALIAS': 'replica',
+    'READ_MODELS': (
+        'kyberapp.news', 'kyberapp.lesson', 'kyberapp.test', 'kyberapp.question',
+        'kyberapp.answer', 'kyberapp.task', 'kyberapp.achievement',
+        'kyberapp.imagederivative', 'kyberapp.leaderboardentry',
+    ),
+    'STICKY_SECONDS': 10,
+    'COOKIE_NAME': 'kyberapp_primary_until',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Состояние текущего запроса: {'primary': bool, 'wrote': bool}; None вне запроса.
+_request_state = ContextVar('kyberapp_replica_request', default=None)
+_reporting = ContextVar('kyberapp_replica_reporting', default=False)
+_primary = ContextVar('kyberapp_replica_primary', default=False)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_REPLICA', {})}
+
+
+@contextmanager
+def reporting():
+    """
+    Внутри блока чтение всех моделей идёт с реплики (если запрос
+    не закреплён за основной базой).
+    """
+    token = _reporting.set(True)
+    try:
+        yield
+    finally:
+        _reporting.reset(token)
+
+
+@contextmanager
+def primary():
+    """
+    Внутри блока чтение всех моделей идёт с основной базы — и внутри
+    ``reporting()``.
+    """
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+def copy_database(source=None, target=None):
+    """
+    Копирует основную базу SQLite в реплику через backup API SQLite:
+    копия согласована на момент начала, писатели (в режиме WAL) не ждут.
+
+    Параметры:
+    source, target: соединения Django; по умолчанию основная база
+                    и реплика из настроек.
+    """
+    source = source or connections[DEFAULT_DB_ALIAS]
+    target = target or connections[get_config()['ALIAS']]
+    if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise ValueError('Копирование реплики поддерживается только для SQLite')
+    if str(source.settings_dict['NAME']) == str(target.settings_dict['NAME']):
+        raise ValueError('Реплика указывает на файл основной базы, задайте KYBERAPP_REPLICA_DB')
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        config = get_config()
+        if not config['ENABLED']:
+            return None
+        state = _request_state.get()
+        if _primary.get() or state is not None and state['primary']:
+            return DEFAULT_DB_ALIAS
+        if _reporting.get():
+            return config['ALIAS']
+        if state is not None and model._meta.label_lower in config['READ_MODELS']:
+            return config['ALIAS']
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            # Дальше в этом запросе читаем свои изменения с основной базы.
+            state['primary'] = state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, get_config()['ALIAS']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика — копия основной базы, миграции применяются только к ней.
+        if db == get_config()['ALIAS']:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Закрепляет запрос за основной базой (см. описание модуля) и после
+    запроса с записью выставляет cookie окна чтения с основной базы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request, config):
+        try:
+            sticky_until = float(request.COOKIES.get(config['COOKIE_NAME'], 0))
+        except ValueError:
+            sticky_until = 0
+        primary = request.method not in SAFE_METHODS or sticky_until > time.time()
+        return _request_state.set({'primary': primary, 'wrote': False})
+
+    def _finish(self, response, token, config):
+        state = _request_state.get()
+        _request_state.reset(token)
+        if state['wrote']:
+            response.set_cookie(config['COOKIE_NAME'], f'{time.time() + config["STICKY_SECONDS"]:.0f}',
+                                max_age=config['STICKY_SECONDS'], httponly=True,
+                                samesite='Lax', secure=settings.SESSION_COOKIE_SECURE)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        token = self._start(request, config)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            _request_state.reset(token)
+            raise
+        return self._finish(response, token, config)
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+        token = self._start(request, config)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            _request_state.reset(token)
+            raise
+        return self._finish(response, token, config)
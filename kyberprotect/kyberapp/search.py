@@ -0,0 +1,241 @@
+"""
+Полнотекстовый поиск по урокам, новостям и вопросам тестов.
+
+На SQLite используется виртуальная таблица FTS5 ``kyberapp_search``
+(создаётся миграцией 0011), которая обновляется сигналами при сохранении
+и удалении объектов (см. ``signals.py``). Идентификатор строки индекса
+кодирует тип и ID объекта: ``rowid = id * 4 + код типа``, поэтому
+обновление и удаление записи не требуют обхода индекса.
+
+Публичны уроки, опубликованные новости и вопросы активных тестов; при
+смене ``Test.is_active`` вопросы теста переиндексируются.
+
+Для других СУБД поиск выполняется обычным ``icontains`` без ранжирования.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import Lesson, News, Question
+
+TABLE = 'kyberapp_search'
+
+LESSON = 'lesson'
+NEWS = 'news'
+QUESTION = 'question'
+
+# Тип объекта -> (код в rowid, модель)
+KINDS = {
+    LESSON: (1, Lesson),
+    NEWS: (2, News),
+    QUESTION: (3, Question),
+}
+CODES = {code: kind for kind, (code, model) in KINDS.items()}
+
+# Вес совпадений в заголовке и в тексте для ранжирования bm25.
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+MAX_TERMS = 10
+
+# Служебные символы для подсветки совпадений в отрывке; заменяются на <mark>
+# после экранирования текста.
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def kind_of(obj_or_model):
+    """
+    Возвращает тип объекта (или модели) для индекса.
+    """
+    for kind, (code, model) in KINDS.items():
+        if obj_or_model is model or isinstance(obj_or_model, model):
+            return kind
+    raise TypeError(f'{obj_or_model!r} не индексируется поиском')
+
+
+def document(obj):
+    """
+    Возвращает поля записи индекса: (заголовок, текст, ID родителя, публичность).
+
+    Для вопроса читается его тест — при индексации многих вопросов
+    загружайте их с ``select_related('test')``.
+    """
+    if isinstance(obj, Lesson):
+        return obj.title, obj.description, None, True
+    if isinstance(obj, News):
+        return obj.title, obj.content, None, obj.is_published
+    if isinstance(obj, Question):
+        return obj.question_text, '', obj.test_id, obj.test.is_active
+    raise TypeError(f'Объект {obj!r} не индексируется поиском')
+
+
+def _rowid(kind, pk):
+    return pk * 4 + KINDS[kind][0]
+
+
+def index_objects(objects):
+    """
+    Добавляет или обновляет объекты в индексе (одним executemany на операцию).
+    """
+    if not is_available():
+        return
+    rows = []
+    for obj in objects:
+        title, body, parent_id, is_public = document(obj)
+        rows.append((_rowid(kind_of(obj), obj.pk), title, body, parent_id, int(is_public)))
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, title, body, parent_id, is_public) '
+            f'VALUES (%s, %s, %s, %s, %s)',
+            rows,
+        )
+
+
+def remove_objects(kind, pks):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s',
+                           [(_rowid(kind, pk),) for pk in pks])
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Полностью перестраивает индекс по всем урокам, новостям и вопросам.
+
+    Возвращает:
+    Количество проиндексированных объектов.
+    """
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    total = 0
+    for code, model in KINDS.values():
+        objects = model.objects.order_by('pk')
+        if model is Question:
+            objects = objects.select_related('test')
+        batch = []
+        for obj in objects.iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                index_objects(batch)
+                total += len(batch)
+                batch = []
+        index_objects(batch)
+        total += len(batch)
+    return total
+
+
+def build_match(query):
+    """
+    Превращает строку пользователя в безопасное выражение MATCH: каждое
+    слово ищется как префикс, все слова должны встретиться.
+    Возвращает пустую строку, если слов нет.
+    """
+    terms = re.findall(r'\w+', query or '')[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _snippet_html(text):
+    return (escape(text)
+            .replace(_MARK_START, '<mark>')
+            .replace(_MARK_END, '</mark>'))
+
+
+def search(query, kinds=None, public_only=True, limit=20):
+    """
+    Ищет объекты по запросу и возвращает результаты по убыванию релевантности.
+
+    Параметры:
+    query: строка запроса пользователя.
+    kinds: типы объектов (``LESSON``, ``NEWS``, ``QUESTION``); по умолчанию все.
+    public_only: не показывать неопубликованные новости и вопросы неактивных тестов.
+    limit: максимальное количество результатов.
+
+    Возвращает:
+    Список словарей с ключами ``kind``, ``object_id``, ``parent_id``,
+    ``title`` и ``snippet`` (HTML с подсвеченными совпадениями).
+    """
+    match = build_match(query)
+    if not match:
+        return []
+    kinds = list(kinds or KINDS)
+    if not is_available():
+        return _fallback_search(query, kinds, public_only, limit)
+
+    codes = ', '.join(str(KINDS[kind][0]) for kind in kinds)
+    sql = (
+        f"SELECT rowid, title, parent_id, "
+        f"snippet({TABLE}, 1, %s, %s, '…', 16) "
+        f"FROM {TABLE} WHERE {TABLE} MATCH %s AND rowid %% 4 IN ({codes})"
+    )
+    params = [_MARK_START, _MARK_END, match]
+    if public_only:
+        sql += ' AND is_public = 1'
+    sql += f' ORDER BY bm25({TABLE}, %s, %s) LIMIT %s'
+    params += [TITLE_WEIGHT, BODY_WEIGHT, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [
+        {
+            'kind': CODES[rowid % 4],
+            'object_id': rowid // 4,
+            'parent_id': parent_id,
+            'title': title,
+            'snippet': _snippet_html(snippet),
+        }
+        for rowid, title, parent_id, snippet in rows
+    ]
+
+
+def _fallback_search(query, kinds, public_only, limit):
+    results = []
+    terms = re.findall(r'\w+', query)[:MAX_TERMS]
+    for kind in kinds:
+        code, model = KINDS[kind]
+        queryset = model.objects.all()
+        if kind == NEWS and public_only:
+            queryset = queryset.filter(is_published=True)
+        if kind == QUESTION:
+            queryset = queryset.select_related('test')
+            if public_only:
+                queryset = queryset.filter(test__is_active=True)
+        for term in terms:
+            field = 'question_text' if kind == QUESTION else 'title'
+            queryset = queryset.filter(**{f'{field}__icontains': term})
+        for obj in queryset[:limit]:
+            title, body, parent_id, is_public = document(obj)
+            results.append({'kind': kind, 'object_id': obj.pk, 'parent_id': parent_id,
+                             'title': title, 'snippet': escape(body[:200])})
+    return results[:limit]
+
+
+def filter_queryset(queryset, query):
+    """
+    Ограничивает QuerySet модели объектами, найденными по запросу
+    (для поиска в админке). Выполняется одним запросом с подзапросом к индексу.
+    """
+    kind = kind_of(queryset.model)
+    match = build_match(query)
+    if not match:
+        return queryset
+    if not is_available():
+        return queryset.filter(pk__in=[result['object_id']
+                                       for result in _fallback_search(query, [kind], False, 1000)])
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid / 4 FROM {TABLE} WHERE {TABLE} MATCH %s AND rowid %% 4 = %s',
+        [match, KINDS[kind][0]],
+    ))
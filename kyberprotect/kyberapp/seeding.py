@@ -0,0 +1,228 @@
+"""
+Генератор синтетических данных для нагрузочных замеров.
+
+``seed`` создаёт пользователей, уроки с задачами и тестами (вопросы
+и ответы), новости, достижения, результаты тестов с историей
+прохождений и отправками, а также уведомления. Все строки пишутся
+пачками через ``bulk_create``, а данные, которые обычно поддерживают
+сигналы (суммы баллов тестов, полнотекстовый индекс, выданные
+достижения, сводки прогресса, рейтинги, версии кеша), пересчитываются
+один раз в конце. Данные определяются параметром ``seed``: при одинаковых
+объёмах и ``seed`` получается одинаковый набор.
+
+Используется командой ``manage.py seed_bench`` и скриптом
+``benchmarks/bench_suite.py``.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import leaderboards, search
+from .achievement_rules import backfill
+from .aggregates import refresh_test_totals
+from .inbox import reset_unread_counts
+from .models import (Achievement, Answer, CustomUser, Lesson, News, Notification, Question,
+                     Submission, Task, Test, TestResult, UserTest)
+from .page_cache import invalidate_pages
+from .progress import rebuild_all
+from .selections import encode_selection
+from .versions import bump_version
+
+# Объёмы по умолчанию: имя параметра -> количество.
+VOLUMES = {
+    'users': 200,
+    'lessons': 30,
+    'tasks_per_lesson': 2,
+    'questions_per_test': 10,
+    'answers_per_question': 4,
+    'news': 100,
+    'achievements': 20,
+    'results_per_user': 5,
+    'notifications_per_user': 10,
+}
+
+# Доля правильно отвеченных вопросов у синтетических пользователей.
+CORRECT_RATE = 0.8
+
+WORDS = ('защита', 'пароль', 'фишинг', 'шифрование', 'сеть', 'атака', 'вирус',
+         'резервная', 'копия', 'обновление', 'доступ', 'данные', 'почта', 'браузер')
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _conditions(rng, count, tests):
+    """
+    Условия достижений в форматах achievement_rules.py.
+    """
+    conditions = []
+    for number in range(count):
+        kind = number % 4
+        if kind == 0:
+            conditions.append(f'pass_{number // 4 + 1}_tests')
+        elif kind == 1:
+            conditions.append(f'finish_{number // 4 + 1}_lessons')
+        elif kind == 2:
+            conditions.append(f'pass_test_{rng.choice(tests).pk}')
+        else:
+            conditions.append(f'complete_{number // 4 + 1}_tasks')
+    return conditions
+
+
+def _choose_answers(rng, question, answers):
+    """
+    Выбирает ответы синтетического пользователя.
+
+    Возвращает:
+    Пару (список ID выбранных ответов, ответ правильный).
+    """
+    correct = [answer.pk for answer in answers if answer.is_correct]
+    wrong = [answer.pk for answer in answers if not answer.is_correct]
+    if rng.random() < CORRECT_RATE or not wrong:
+        return correct, True
+    if question.question_type == 'one':
+        return [rng.choice(wrong)], False
+    return correct[:-1] + [rng.choice(wrong)], False
+
+
+def seed(seed=0, prefix='bench', password='bench-password', batch_size=1000, **volumes):
+    """
+    Заполняет базу синтетическими данными.
+
+    Параметры:
+    seed: начальное значение генератора случайных чисел.
+    prefix: префикс имён пользователей (``<prefix>0``, ``<prefix>1``...);
+            первый пользователь — сотрудник.
+    password: пароль всех пользователей.
+    batch_size: размер пачки ``bulk_create``.
+    volumes: объёмы (``users=1000``...), остальные берутся из ``VOLUMES``;
+             у каждого урока один тест.
+
+    Возвращает:
+    Словарь: имя модели -> количество созданных строк.
+    """
+    unknown = set(volumes) - set(VOLUMES)
+    if unknown:
+        raise TypeError(f'Неизвестные объёмы: {", ".join(sorted(unknown))}')
+    volumes = {**VOLUMES, **volumes}
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Хеш пароля считается один раз: PBKDF2 на каждого пользователя занял бы минуты.
+        password_hash = make_password(password)
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'{prefix}{number}', email=f'{prefix}{number}@example.com',
+                       password=password_hash, is_staff=number == 0)
+            for number in range(volumes['users'])], batch_size=batch_size)
+
+        lessons = Lesson.objects.bulk_create([
+            Lesson(title=f'Урок {number}: {_text(rng, 3)}', description=_text(rng, 60))
+            for number in range(volumes['lessons'])], batch_size=batch_size)
+        tests = Test.objects.bulk_create([Test(lesson=lesson, title=f'Тест: {lesson.title}')
+                                          for lesson in lessons], batch_size=batch_size)
+        questions = Question.objects.bulk_create([
+            Question(test=test, question_text=f'{_text(rng, 8)}?',
+                     question_type='multiple' if number % 3 == 2 else 'one')
+            for test in tests for number in range(volumes['questions_per_test'])],
+            batch_size=batch_size)
+        answers = Answer.objects.bulk_create([
+            Answer(question=question, answer_text=_text(rng, 4),
+                   is_correct=number == 0 or (question.question_type == 'multiple' and number == 1))
+            for question in questions for number in range(volumes['answers_per_question'])],
+            batch_size=batch_size)
+
+        achievements = Achievement.objects.bulk_create([
+            Achievement(title=f'Достижение {number}', description=_text(rng, 10),
+                        icon='achievements/bench.png', condition=condition)
+            for number, condition in enumerate(
+                _conditions(rng, volumes['achievements'], tests))], batch_size=batch_size)
+        # Сумма баллов задач урока — порог прохождения теста; задачи дают
+        # около 80% вопросов, чтобы часть результатов была непройденной.
+        points = max(1, volumes['questions_per_test'] * 8 // 10
+                     // max(volumes['tasks_per_lesson'], 1))
+        tasks = Task.objects.bulk_create([
+            Task(lesson=lesson, question=f'{_text(rng, 6)}?', points=points,
+                 achievement=rng.choice(achievements) if achievements and number == 0 else None)
+            for lesson in lessons for number in range(volumes['tasks_per_lesson'])],
+            batch_size=batch_size)
+        refresh_test_totals()
+
+        news = News.objects.bulk_create([
+            News(title=f'Новость {number}: {_text(rng, 4)}', content=_text(rng, 80),
+                 is_published=number % 10 != 9, notified_at=now)
+            for number in range(volumes['news'])], batch_size=batch_size)
+
+        # Результаты: ответы выбираются случайно, балл и прохождение
+        # считаются так же, как при проверке (по числу верных вопросов).
+        answers_by_question = {}
+        for answer in answers:
+            answers_by_question.setdefault(answer.question_id, []).append(answer)
+        questions_by_test = {}
+        questions_by_id = {question.pk: question for question in questions}
+        for question in questions:
+            questions_by_test.setdefault(question.test_id, []).append(question)
+        total_points = dict(Test.objects.values_list('pk', 'total_points'))
+        answer_ranges = {}
+        for answer in answers:
+            test_id = questions_by_id[answer.question_id].test_id
+            first_id, last_id = answer_ranges.get(test_id, (answer.pk, answer.pk))
+            answer_ranges[test_id] = (min(first_id, answer.pk), max(last_id, answer.pk))
+        results, history, submissions = [], [], []
+        for user in users:
+            for test in rng.sample(tests, min(volumes['results_per_user'], len(tests))):
+                selection, selected_ids, score = {}, [], 0
+                for question in questions_by_test.get(test.pk, ()):
+                    chosen, is_correct = _choose_answers(rng, question,
+                                                         answers_by_question.get(question.pk, []))
+                    selection[f'question_{question.pk}'] = [str(answer_id) for answer_id in chosen]
+                    selected_ids.extend(chosen)
+                    score += is_correct
+                results.append(TestResult(user=user, test=test, score=score,
+                                          passed=score >= total_points[test.pk],
+                                          selected_answers=encode_selection(
+                                              selected_ids, *answer_ranges.get(test.pk, (None, None)))))
+                history.append(UserTest(user=user, test=test, score=score))
+                submissions.append(Submission(user=user, test=test, answers=selection,
+                                              status=Submission.DONE, attempts=1,
+                                              processed_at=now))
+        results = TestResult.objects.bulk_create(results, batch_size=batch_size)
+        UserTest.objects.bulk_create(history, batch_size=batch_size)
+        for submission, result in zip(submissions, results):
+            submission.result = result
+        Submission.objects.bulk_create(submissions, batch_size=batch_size)
+
+        notifications = Notification.objects.bulk_create([
+            Notification(user=user, title=f'Уведомление {number}', message=_text(rng, 12),
+                         is_read=rng.random() < 0.5)
+            for user in users for number in range(volumes['notifications_per_user'])],
+            batch_size=batch_size)
+        # auto_now_add ставит одинаковое время всей пачке; ленты сортируются по
+        # времени, поэтому разносим его, как у настоящих данных.
+        for model, objects in ((News, news), (Notification, notifications)):
+            for number, obj in enumerate(objects):
+                obj.created_at = now - timedelta(minutes=len(objects) - number)
+            model.objects.bulk_update(objects, ['created_at'], batch_size=batch_size)
+
+    # bulk_create не вызывает сигналов: пересчитываем то, что они поддерживают.
+    if search.is_available():
+        search.rebuild_index(batch_size=batch_size)
+    bump_version('achievements')
+    bump_version('catalog')
+    invalidate_pages('news_list', 'lessons')
+    reset_unread_counts([user.pk for user in users])
+    backfill(batch_size=batch_size)
+    rebuild_all(batch_size=batch_size)
+    leaderboards.rebuild_all(batch_size=batch_size)
+
+    created = {}
+    for model, objects in ((CustomUser, users), (Lesson, lessons), (Task, tasks), (Test, tests),
+                           (Question, questions), (Answer, answers), (Achievement, achievements),
+                           (News, news), (TestResult, results), (Submission, submissions),
+                           (Notification, notifications)):
+        created[model._meta.model_name] = len(objects)
+    return created
@@ -0,0 +1,157 @@
+"""
+Компактное хранение выбранных ответов (``TestResult.selected_answers``).
+
+Выбор пользователя — множество ID ответов теста — хранится в одном
+из двух видов, какой короче:
+- битовая маска: байт ``0x01``, varint первого ID ответа теста, затем
+  маска по всем ответам теста (бит ``k`` байта ``k // 8``, начиная
+  с младшего, — ответ ``первый ID + k``). Ответы теста обычно создаются
+  подряд, поэтому тест из 10 вопросов по 4 ответа занимает 9 байт;
+- список: байт ``0x00``, varint первого выбранного ID, затем varint
+  разностей соседних ID (по возрастанию) — для тестов, ответы которых
+  разбросаны по таблице.
+Пустая строка — ничего не выбрано, ``NULL`` — выбор не сохранялся
+(результаты до появления поля без отправки в очереди).
+
+ID в записи абсолютные, поэтому декодирование не зависит от текущего
+состояния теста. Проверка ответов по выбору — ``AnswerKey.question_results``.
+
+``selection_counts`` считает, сколько раз выбран каждый ответ, не создавая
+объектов моделей: записи читаются из базы пачками, а маски с одинаковым
+диапазоном ответов (результаты одного теста) складываются в матрицу
+и суммируются NumPy (``np.unpackbits``), если пакет установлен.
+"""
+from collections import Counter
+
+from .models import TestResult
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy необязателен
+    np = None
+
+LIST = 0
+BITMAP = 1
+
+
+def _write_varint(value, output):
+    while value >= 0x80:
+        output.append(value & 0x7f | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_selection(answer_ids, first_id=None, last_id=None):
+    """
+    Упаковывает ID выбранных ответов.
+
+    Параметры:
+    answer_ids: ID выбранных ответов (порядок и повторы не важны).
+    first_id, last_id: наименьший и наибольший ID ответов теста — диапазон
+                       битовой маски; без них ответы хранятся списком.
+
+    Возвращает:
+    Байтовую строку.
+    """
+    answer_ids = sorted(set(answer_ids))
+    if not answer_ids:
+        return b''
+    encoded = bytearray([LIST])
+    previous = 0
+    for answer_id in answer_ids:
+        _write_varint(answer_id - previous, encoded)
+        previous = answer_id
+    if first_id is not None and first_id <= answer_ids[0] and answer_ids[-1] <= last_id:
+        bitmap = bytearray([BITMAP])
+        _write_varint(first_id, bitmap)
+        mask = bytearray((last_id - first_id) // 8 + 1)
+        for answer_id in answer_ids:
+            offset = answer_id - first_id
+            mask[offset // 8] |= 1 << offset % 8
+        if len(bitmap) + len(mask) <= len(encoded):
+            return bytes(bitmap + mask)
+    return bytes(encoded)
+
+
+def decode_selection(data):
+    """
+    Распаковывает ID выбранных ответов.
+
+    Возвращает:
+    Список ID по возрастанию или ``None``, если выбор не сохранялся.
+    """
+    if data is None:
+        return None
+    data = bytes(data)  # PostgreSQL возвращает memoryview
+    if not data:
+        return []
+    answer_ids = []
+    if data[0] == BITMAP:
+        first_id, offset = _read_varint(data, 1)
+        for number, byte in enumerate(data[offset:]):
+            while byte:
+                bit = (byte & -byte).bit_length() - 1
+                answer_ids.append(first_id + number * 8 + bit)
+                byte &= byte - 1
+        return answer_ids
+    offset, previous = 1, 0
+    while offset < len(data):
+        delta, offset = _read_varint(data, offset)
+        previous += delta
+        answer_ids.append(previous)
+    return answer_ids
+
+
+def _count_chunk(chunk):
+    counts = Counter()
+    masks = {}  # (первый ID, длина маски) -> маски
+    for data in chunk:
+        data = bytes(data)
+        if np is not None and data[:1] == bytes([BITMAP]):
+            first_id, offset = _read_varint(data, 1)
+            masks.setdefault((first_id, len(data) - offset), []).append(data[offset:])
+        else:
+            counts.update(decode_selection(data))
+    for (first_id, length), rows in masks.items():
+        matrix = np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(len(rows), length)
+        totals = np.unpackbits(matrix, axis=1, bitorder='little').sum(axis=0)
+        for offset in np.flatnonzero(totals):
+            counts[first_id + int(offset)] += int(totals[offset])
+    return counts
+
+
+def selection_counts(results=None, chunk_size=2000):
+    """
+    Сколько раз выбран каждый ответ.
+
+    Параметры:
+    results: QuerySet результатов (по умолчанию все); результаты без
+             сохранённого выбора пропускаются.
+    chunk_size: записей в одной выборке из базы.
+
+    Возвращает:
+    Словарь: ID ответа -> количество выборов.
+    """
+    results = TestResult.objects.all() if results is None else results
+    rows = (results.filter(selected_answers__isnull=False).order_by()
+            .values_list('selected_answers', flat=True).iterator(chunk_size=chunk_size))
+    counts = Counter()
+    chunk = []
+    for data in rows:
+        chunk.append(data)
+        if len(chunk) >= chunk_size:
+            counts.update(_count_chunk(chunk))
+            chunk = []
+    counts.update(_count_chunk(chunk))
+    return dict(counts)
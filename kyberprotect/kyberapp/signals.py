@@ -0,0 +1,240 @@
+"""
+Обработчики сигналов моделей приложения.
+
+Следят за изменениями контента и сбрасывают связанные с ним кеши.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .aggregates import compute_lesson_points, refresh_test_totals
+from .grading import invalidate_answer_key
+from .images import schedule_variants
+from .inbox import reset_unread_counts, unread_added, unread_removed
+from .leaderboards import refresh_entries, refresh_entries_on_commit
+from .models import (Achievement, Answer, CustomUser, Lesson, News, Notification, Question,
+                     Task, Test, TestResult, UserAchievement)
+from .page_cache import invalidate_pages
+from .progress import mark_progress_stale, refresh_progress
+from .search import index_objects, kind_of, remove_objects
+from .versions import bump_version
+
+
+def _invalidate_tests(test_ids):
+    """
+    Сбрасывает ключи тестов сразу и ещё раз после фиксации транзакции,
+    чтобы параллельный запрос не закешировал незафиксированное состояние.
+    """
+    test_ids = {test_id for test_id in test_ids if test_id is not None}
+
+    def invalidate():
+        for test_id in test_ids:
+            bump_version('test', test_id)
+            invalidate_answer_key(test_id)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def _test_ids_for_questions(question_ids):
+    return set(Question.objects.filter(pk__in=question_ids)
+               .values_list('test_id', flat=True))
+
+
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def test_changed(sender, instance, **kwargs):
+    _invalidate_tests([instance.pk])
+
+
+@receiver(post_save, sender=Test)
+def test_visibility_changed(sender, instance, raw=False, **kwargs):
+    # Публичность вопросов в индексе поиска зависит от активности теста.
+    previous = getattr(instance, '_previous_is_active', None)
+    if not raw and previous is not None and previous != instance.is_active:
+        index_objects(instance.questions.all())
+
+
+@receiver(pre_save, sender=Question)
+def question_pre_save(sender, instance, **kwargs):
+    # Вопрос могли перенести в другой тест — сбрасываем и старый тест.
+    if instance.pk:
+        _invalidate_tests(_test_ids_for_questions([instance.pk]))
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, **kwargs):
+    _invalidate_tests([instance.test_id])
+
+
+@receiver(pre_save, sender=Answer)
+def answer_pre_save(sender, instance, **kwargs):
+    # Ответ могли перенести к вопросу другого теста.
+    if instance.pk:
+        old_question_ids = (Answer.objects.filter(pk=instance.pk)
+                            .values_list('question_id', flat=True))
+        _invalidate_tests(_test_ids_for_questions(old_question_ids))
+
+
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def answer_changed(sender, instance, **kwargs):
+    _invalidate_tests(_test_ids_for_questions([instance.question_id]))
+
+
+@receiver(pre_save, sender=Test)
+def test_pre_save(sender, instance, **kwargs):
+    # Сумма баллов считается при сохранении теста (урок мог смениться).
+    instance.total_points = compute_lesson_points(instance.lesson_id)
+    # Запоминаем прежнюю активность, чтобы переиндексировать вопросы.
+    instance._previous_is_active = None
+    if instance.pk:
+        instance._previous_is_active = (Test.objects.filter(pk=instance.pk)
+                                        .values_list('is_active', flat=True).first())
+
+
+@receiver(pre_save, sender=Task)
+def task_pre_save(sender, instance, **kwargs):
+    # Запоминаем прежний урок задачи, чтобы пересчитать и его тесты.
+    instance._previous_lesson_id = None
+    if instance.pk:
+        instance._previous_lesson_id = (Task.objects.filter(pk=instance.pk)
+                                        .values_list('lesson_id', flat=True)
+                                        .first())
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_changed(sender, instance, **kwargs):
+    refresh_test_totals({instance.lesson_id,
+                         getattr(instance, '_previous_lesson_id', None)})
+    bump_version('catalog')
+
+
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def achievement_changed(sender, instance, **kwargs):
+    # Индекс правил достижений собирается заново при следующей проверке,
+    # сводки прогресса пересчитываются при следующем чтении.
+    bump_version('achievements')
+    bump_version('catalog')
+
+
+@receiver(post_save, sender=UserAchievement)
+@receiver(post_save, sender=TestResult)
+def user_progress_changed(sender, instance, **kwargs):
+    # bulk_create сигналов не вызывает — achievement_rules и submissions
+    # обновляют сводку сами.
+    refresh_progress([instance.user_id])
+
+
+@receiver(post_delete, sender=UserAchievement)
+@receiver(post_delete, sender=TestResult)
+def user_progress_deleted(sender, instance, **kwargs):
+    # Строки могут удаляться вместе с пользователем, поэтому сводку не
+    # пересчитываем, а помечаем устаревшей — она обновится при чтении.
+    mark_progress_stale([instance.user_id])
+
+
+@receiver(post_save, sender=TestResult)
+def test_result_ranked(sender, instance, **kwargs):
+    refresh_entries([instance.user_id], test_ids=[instance.test_id])
+
+
+@receiver(post_save, sender=UserAchievement)
+def achievement_ranked(sender, instance, **kwargs):
+    refresh_entries([instance.user_id], test_ids=())
+
+
+@receiver(post_delete, sender=UserAchievement)
+@receiver(post_delete, sender=TestResult)
+def ranked_row_deleted(sender, instance, **kwargs):
+    refresh_entries_on_commit([instance.user_id])
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+def news_changed(sender, instance, **kwargs):
+    invalidate_pages('news_list', f'news:{instance.pk}')
+
+
+@receiver(pre_save, sender=News)
+def news_pre_save(sender, instance, **kwargs):
+    # Отметки о рассылке берём из базы: их ставит обработчик рассылки
+    # (notifications.py), а не форма, — сохранение не должно их затирать.
+    # Опубликованная новость без notified_at сама ждёт рассылки.
+    if instance.pk:
+        previous = (News.objects.filter(pk=instance.pk)
+                    .values_list('notified_at', 'notification_started_at').first())
+        if previous:
+            instance.notified_at, instance.notification_started_at = previous
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def lesson_changed(sender, instance, **kwargs):
+    invalidate_pages('lessons')
+    # Название урока показывается в списке задач профиля (get_task_list);
+    # версию каталога не трогаем, чтобы не устаревали сводки прогресса.
+    bump_version('lessons')
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=News)
+@receiver(post_save, sender=Question)
+def search_document_saved(sender, instance, raw=False, **kwargs):
+    # При загрузке фикстур (raw) индекс перестраивается командой
+    # rebuild_search_index.
+    if not raw:
+        index_objects([instance])
+
+
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=News)
+@receiver(post_delete, sender=Question)
+def search_document_deleted(sender, instance, **kwargs):
+    remove_objects(kind_of(instance), [instance.pk])
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    if created:
+        if not instance.is_read:
+            unread_added(instance.user_id)
+    else:
+        # Уведомление изменили (например, в админке) — счётчик пересчитается.
+        reset_unread_counts([instance.user_id])
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        unread_removed(instance.user_id)
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_image_saved(sender, instance, raw=False, **kwargs):
+    # Страница уроков закеширована с исходными картинками — сбрасываем её,
+    # когда копии готовы.
+    if not raw:
+        schedule_variants(instance.image, 'lesson', lambda: invalidate_pages('lessons'))
+
+
+@receiver(post_save, sender=News)
+def news_image_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        dependencies = ('news_list', f'news:{instance.pk}')
+        schedule_variants(instance.image, 'news', lambda: invalidate_pages(*dependencies))
+
+
+@receiver(post_save, sender=Achievement)
+def achievement_icon_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(instance.icon, 'achievement')
+
+
+@receiver(post_save, sender=CustomUser)
+def avatar_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(instance.avatar, 'avatar')
@@ -0,0 +1,195 @@
+"""
+Очередь отправленных тестов в базе данных.
+
+При включённой очереди ``take_test`` только сохраняет ответы в таблицу
+``Submission`` и сразу перенаправляет на страницу ожидания результата.
+Проверяет и сохраняет результаты команда ``manage.py grade_worker``: она
+забирает пачку отправок одним UPDATE (поэтому несколько обработчиков
+не возьмут одну отправку дважды) и записывает результаты всей пачки одной
+транзакцией (см. ``submissions.save_results``). Внешний брокер не нужен.
+
+Настройки (``settings.KYBERAPP_SUBMISSION_QUEUE``):
+- ``ENABLED`` — принимать отправки через очередь (по умолчанию ``False``);
+- ``BATCH_SIZE`` — сколько отправок обработчик берёт за раз (50);
+- ``POLL_INTERVAL`` — пауза обработчика при пустой очереди, секунды (0.5);
+- ``MAX_ATTEMPTS`` — попыток проверки до статуса «Ошибка» (3);
+- ``PROCESSING_TIMEOUT`` — через сколько секунд зависшая отправка
+  возвращается в очередь (300);
+- ``REFRESH_SECONDS`` — как часто страница ожидания обновляется (2).
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+
+from .database import retry_on_locked
+from .grading import invalidate_answer_key
+from .models import Submission
+from .submissions import build_result, save_results
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'BATCH_SIZE': 50,
+    'POLL_INTERVAL': 0.5,
+    'MAX_ATTEMPTS': 3,
+    'PROCESSING_TIMEOUT': 300,
+    'REFRESH_SECONDS': 2,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'KYBERAPP_SUBMISSION_QUEUE', {})}
+
+
+def is_enabled():
+    return get_config()['ENABLED']
+
+
+@retry_on_locked
+def enqueue(user, test, data):
+    """
+    Сохраняет ответы пользователя в очередь.
+
+    Параметры:
+    data: ``request.POST``; сохраняются только поля ``question_<id>``.
+
+    Возвращает:
+    Объект ``Submission``.
+    """
+    answers = {key: data.getlist(key) for key in data if key.startswith('question_')}
+    return Submission.objects.create(user=user, test=test, answers=answers)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+@retry_on_locked
+def claim_batch(batch_size, worker=None):
+    """
+    Забирает из очереди до ``batch_size`` самых старых отправок одним UPDATE.
+
+    Возвращает:
+    Список отправок (со связанными пользователем и тестом) в статусе
+    «Проверяется».
+    """
+    token = f'{worker or worker_name()}:{uuid.uuid4().hex[:12]}'
+    pending = (Submission.objects.filter(status=Submission.PENDING)
+               .order_by('id').values('pk')[:batch_size])
+    claimed = Submission.objects.filter(pk__in=pending, status=Submission.PENDING).update(
+        status=Submission.PROCESSING, worker=token, started_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    )
+    if not claimed:
+        return []
+    return list(Submission.objects.filter(status=Submission.PROCESSING, worker=token)
+                .select_related('user', 'test').order_by('id'))
+
+
+def requeue_stale(timeout=None, max_attempts=None):
+    """
+    Возвращает в очередь отправки, которые проверяются дольше ``timeout``
+    секунд (обработчик завершился аварийно). Отправки, исчерпавшие попытки,
+    получают статус «Ошибка».
+
+    Возвращает:
+    Количество изменённых отправок.
+    """
+    config = get_config()
+    timeout = config['PROCESSING_TIMEOUT'] if timeout is None else timeout
+    max_attempts = max_attempts or config['MAX_ATTEMPTS']
+    now = timezone.now()
+    stale = Submission.objects.filter(status=Submission.PROCESSING,
+                                      started_at__lt=now - timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=Submission.FAILED, error='Превышено время проверки', processed_at=now)
+    requeued = stale.filter(attempts__lt=max_attempts).update(
+        status=Submission.PENDING, worker='')
+    return failed + requeued
+
+
+@retry_on_locked
+def _save_batch(submissions):
+    """
+    Проверяет отправки и одной транзакцией сохраняет результаты и статусы.
+    """
+    with transaction.atomic():
+        results = [build_result(submission.user, submission.test,
+                                MultiValueDict(submission.answers))
+                   for submission in submissions]
+        save_results(results)
+        now = timezone.now()
+        for submission, test_result in zip(submissions, results):
+            submission.status = Submission.DONE
+            submission.result = test_result
+            submission.processed_at = now
+            submission.error = ''
+        Submission.objects.bulk_update(submissions,
+                                       ['status', 'result', 'processed_at', 'error'])
+
+
+def process_batch(submissions, max_attempts=None):
+    """
+    Проверяет отправки и сохраняет результаты одной транзакцией. Если
+    пачка не сохранилась, отправки обрабатываются по одной, чтобы ошибка
+    в одной из них не задерживала остальные.
+
+    Возвращает:
+    Количество успешно проверенных отправок.
+    """
+    if not submissions:
+        return 0
+    max_attempts = max_attempts or get_config()['MAX_ATTEMPTS']
+    try:
+        _save_batch(submissions)
+        return len(submissions)
+    except Exception as error:
+        if len(submissions) > 1:
+            logger.warning('Пачка из %s отправок не сохранена (%s), проверяем по одной',
+                           len(submissions), error)
+            return sum(process_batch([submission], max_attempts) for submission in submissions)
+        submission = submissions[0]
+        logger.exception('Не удалось проверить отправку %s', submission.pk)
+        status = Submission.FAILED if submission.attempts >= max_attempts else Submission.PENDING
+        Submission.objects.filter(pk=submission.pk).update(
+            status=status, error=str(error), worker='',
+            processed_at=timezone.now() if status == Submission.FAILED else None,
+        )
+        return 0
+
+
+def run_worker(batch_size=None, poll_interval=None, once=False, worker=None):
+    """
+    Обрабатывает очередь, пока она не опустеет (``once``) или бесконечно.
+
+    Возвращает:
+    Количество проверенных отправок.
+    """
+    config = get_config()
+    batch_size = batch_size or config['BATCH_SIZE']
+    poll_interval = config['POLL_INTERVAL'] if poll_interval is None else poll_interval
+    processed = 0
+    requeue_stale()
+    while True:
+        submissions = claim_batch(batch_size, worker)
+        if not submissions:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            requeue_stale()
+            continue
+        # Ключи ответов в памяти обработчика сбрасываем перед каждой пачкой:
+        # при кеше в памяти процесса (LocMemCache) версии тестов, изменённых
+        # в веб-процессе, сюда не доходят.
+        invalidate_answer_key()
+        processed += process_batch(submissions, config['MAX_ATTEMPTS'])
@@ -0,0 +1,104 @@
+"""
+Сохранение отправленных тестов.
+
+Результат (баллы, признак прохождения, достижение для страницы результата,
+выбранные ответы) полностью вычисляется до записи (``build_result``), поэтому ``TestResult``
+вставляется одним INSERT. Результаты, строки истории ``UserTest``, выданные
+достижения, сводки прогресса и места в рейтингах записываются в одной транзакции
+(``save_results``) — для одной отправки или сразу для пачки из очереди
+(см. ``submission_queue.py``). Всё, что можно прочитать заранее (ключ
+ответов, каталог задач, индекс правил), читается до начала транзакции,
+чтобы блокировка записи SQLite удерживалась как можно меньше.
+"""
+from django.db import transaction
+
+from .achievement_rules import get_rule_index, on_test_passed
+from .database import retry_on_locked
+from .grading import get_answer_key
+from .leaderboards import refresh_entries
+from .models import TestResult, UserTest
+from .progress import get_catalog, refresh_progress
+
+
+def build_result(user, test, data):
+    """
+    Проверяет ответы пользователя и готовит результат теста без записи в базу.
+
+    Параметры:
+    user: пользователь, отправивший тест.
+    test: объект Test.
+    data: ответы (``request.POST`` или любой объект с методом ``getlist``).
+
+    Возвращает:
+    Несохранённый объект ``TestResult`` с упакованными выбранными ответами
+    (``selections.py``); ID задач урока доступны в атрибуте ``task_ids``.
+    """
+    answer_key = get_answer_key(test.pk)
+    score = answer_key.grade(data)
+    passed = score >= test.total_points
+
+    # Задачи урока берём из закешированного каталога; на странице результата
+    # показываем достижение последней задачи урока.
+    task_ids, achievement_id = [], None
+    for task_id, lesson_id, task_achievement_id in get_catalog()['tasks']:
+        if lesson_id == test.lesson_id:
+            task_ids.append(task_id)
+            achievement_id = task_achievement_id or achievement_id
+
+    test_result = TestResult(user=user, test=test, score=score, passed=passed,
+                             achieved_achievement_id=achievement_id if passed else None,
+                             selected_answers=answer_key.encode_selection(data))
+    test_result.task_ids = task_ids
+    return test_result
+
+
+@retry_on_locked
+def save_results(test_results):
+    """
+    Сохраняет подготовленные результаты одной транзакцией: результаты
+    и история — по одному ``bulk_create``, достижения — пачкой на
+    пользователя, сводки прогресса — одним пересчётом для всех прошедших.
+    Если база занята другой записью, транзакция повторяется
+    (см. ``database.retry_on_locked``).
+
+    Каждому результату добавляется атрибут ``new_achievement_ids``
+    с ID впервые полученных достижений.
+    """
+    passed = [test_result for test_result in test_results if test_result.passed]
+    if passed:
+        # Индекс правил достижений собираем до начала транзакции.
+        get_rule_index()
+
+    with transaction.atomic():
+        # bulk_create не вызывает сигнал, пересчитывающий сводку после
+        # каждой вставки, — сводки пересчитываются один раз ниже.
+        TestResult.objects.bulk_create(test_results)
+        UserTest.objects.bulk_create([
+            UserTest(user_id=test_result.user_id, test_id=test_result.test_id,
+                     score=test_result.score)
+            for test_result in test_results
+        ])
+        for test_result in test_results:
+            test_result.new_achievement_ids = set()
+        for test_result in passed:
+            test_result.new_achievement_ids = on_test_passed(
+                test_result.user, test_result.test, task_ids=test_result.task_ids, refresh=False)
+        # Непройденный тест на прогресс не влияет.
+        if passed:
+            refresh_progress({test_result.user_id for test_result in passed})
+        # Рейтинги учитывают и непройденные тесты.
+        refresh_entries({test_result.user_id for test_result in test_results},
+                        test_ids={test_result.test_id for test_result in test_results})
+    return test_results
+
+
+def submit_test(user, test, data):
+    """
+    Проверяет ответы пользователя и сохраняет результат теста.
+
+    Возвращает:
+    Сохранённый объект ``TestResult``.
+    """
+    test_result = build_result(user, test, data)
+    save_results([test_result])
+    return test_result
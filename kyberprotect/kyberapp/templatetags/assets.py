@@ -0,0 +1,33 @@
+"""
+Тег ``{% bundle %}``: подключает набор статических файлов (см. assets.py).
+
+Пример::
+
+    {% load assets %}
+    {% bundle 'bundles/site.css' %}
+
+После ``collectstatic`` выводит один тег со ссылкой на файл набора
+с хешем в имени, до него — теги всех исходных файлов набора.
+"""
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from ..assets import get_config
+
+register = template.Library()
+
+
+def _tag(url):
+    if url.split('?')[0].endswith('.js'):
+        return format_html('<script src="{}" defer></script>', url)
+    return format_html('<link href="{}" rel="stylesheet" />', url)
+
+
+@register.simple_tag
+def bundle(name):
+    sources = get_config()['BUNDLES'][name]
+    if name in getattr(staticfiles_storage, 'hashed_files', {}):
+        return _tag(static(name))
+    return format_html_join('\n    ', '{}', ((_tag(static(source)),) for source in sources))
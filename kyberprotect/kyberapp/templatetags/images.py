@@ -0,0 +1,62 @@
+"""
+Тег ``{% responsive_image %}``: выводит изображение с уменьшенными копиями.
+
+Пример::
+
+    {% load images %}
+    {% responsive_image lesson.image alt=lesson.title css_class="img-responsive"
+                        sizes="(max-width: 991px) 100vw, 33vw" %}
+
+Браузер сам выбирает копию нужной ширины из ``srcset`` (WebP, если он его
+поддерживает, иначе JPEG). Если копий ещё нет, выводится обычный ``<img>``
+с исходным файлом.
+"""
+from django import template
+from django.core.files.storage import default_storage
+
+from ..images import get_variants
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ', '.join(f'{default_storage.url(variant["name"])} {variant["width"]}w'
+                     for variant in variants)
+
+
+@register.inclusion_tag('kyberapp/includes/responsive_image.html')
+def responsive_image(image, alt='', css_class='', sizes='', width=None):
+    """
+    Параметры:
+    image: значение поля ``ImageField``.
+    alt, css_class: атрибуты ``alt`` и ``class`` тега ``<img>``.
+    sizes: атрибут ``sizes``; по умолчанию ``<width>px`` или ``100vw``.
+    width: ширина изображения на странице в CSS-пикселях; по ней выбирается
+           копия для ``src``, а ``srcset`` добавляет копии для экранов
+           высокой плотности.
+    """
+    context = {'alt': alt, 'css_class': css_class, 'src': image.url if image else ''}
+    variants = getattr(image, 'prefetched_variants', None)
+    if variants is None:
+        variants = get_variants(image.name) if image else []
+    by_format = {}
+    for variant in variants:
+        by_format.setdefault(variant['format'], []).append(variant)
+    if not by_format:
+        return context
+
+    fallback = by_format.get('jpeg') or next(iter(by_format.values()))
+    # Для src берём самую узкую копию не уже отображаемой ширины.
+    chosen = next((variant for variant in fallback if width and variant['width'] >= int(width)),
+                  fallback[-1])
+    context.update(
+        src=default_storage.url(chosen['name']),
+        srcset=_srcset(fallback),
+        sizes=sizes or (f'{width}px' if width else '100vw'),
+        width=chosen['width'],
+        height=chosen['height'],
+        sources=[{'type': f'image/{image_format}', 'srcset': _srcset(format_variants)}
+                 for image_format, format_variants in by_format.items()
+                 if format_variants is not fallback],
+    )
+    return context
@@ -1,3 +1,2336 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core import mail
+from django.apps import apps
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse, QueryDict
+from django.contrib.auth.models import AnonymousUser
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from asgiref.sync import SyncToAsync, sync_to_async
+from django.utils import timezone
+from PIL import Image
+
+from . import analytics, async_views, exports, perf
+from .assets import build_css_bundle, minify_css
+from .database import retry_on_locked
+from .exports import export, iter_rows
+from .aggregates import compute_lesson_points
+from .achievement_rules import (LESSON_FINISHED, TEST_PASSED, backfill,
+                                compile_condition, evaluate, on_test_passed)
+from .images import generate_variants, get_variants
+from .grading import get_answer_key, grade_submission, invalidate_answer_key
+from .importers import JSONArrayReader, import_tests, read_records
+from .inbox import get_unread_count, mark_all_read, mark_read
+from .leaderboards import get_board, get_rank, rank_of, rebuild_all as rebuild_leaderboards
+from .loaders import build_test_tree, load_test_tree
+from .models import (Achievement, Answer, CustomUser, ImageDerivative, LeaderboardEntry, Lesson, News,
+                     Notification, Question, Task, Submission, Test, TestResult, UserAchievement, UserProgress, UserTest)
+from .page_cache import get_stats, reset_stats
+from .notifications import fan_out, notify_news_published, notify_pending_news
+from .pagination import KeysetPaginator
+from .routers import ReplicaMiddleware, ReplicaRouter, copy_database, primary, reporting
+from .progress import (get_catalog, get_progress, get_task_list, raise_lesson_progress,
+                       recompute_lesson_progress)
+from .search import NEWS, build_match, search
+from .seeding import seed
+from .selections import decode_selection, encode_selection, selection_counts
+from .urls import build_urlpatterns
+from .submission_queue import claim_batch, enqueue, process_batch, requeue_stale, run_worker
+from .submissions import build_result, submit_test
+
+
+def make_test(title='Тест', questions=()):
+    """
+    Создаёт тест с вопросами.
+    questions: список (тип вопроса, [признак правильности ответа, ...]).
+    """
+    lesson = Lesson.objects.create(title=f'Урок: {title}', description='Описание')
+    test = Test.objects.create(lesson=lesson, title=title)
+    for number, (question_type, answers) in enumerate(questions):
+        question = Question.objects.create(test=test, question_text=f'Вопрос {number}',
+                                           question_type=question_type)
+        for answer_number, is_correct in enumerate(answers):
+            Answer.objects.create(question=question, answer_text=f'Ответ {answer_number}',
+                                  is_correct=is_correct)
+    return test
+
+
+def make_achievement(condition, title=None):
+    return Achievement.objects.create(title=title or condition, description='Описание',
+                                      icon='achievements/icon.png', condition=condition)
+
+
+def legacy_score(test, data):
+    """
+    Прежняя логика проверки из take_test (запрос к базе на каждый вопрос).
+    """
+    score = 0
+    for question in test.questions.all():
+        selected_answers = data.getlist(f'question_{question.id}')
+        correct_answers_for_question = question.answers.filter(is_correct=True)
+        if question.question_type == 'one':
+            if len(selected_answers) == 1 and selected_answers[0] == str(
+                    correct_answers_for_question.first().id):
+                score += 1
+        elif question.question_type == 'multiple':
+            correct_answer_ids = [str(answer.id) for answer in correct_answers_for_question]
+            if sorted(selected_answers) == sorted(correct_answer_ids):
+                score += 1
+    return score
+
+
+def make_post(selection):
+    """
+    selection: ID вопроса -> список выбранных ID ответов.
+    """
+    data = QueryDict(mutable=True)
+    for question_id, answer_ids in selection.items():
+        data.setlist(f'question_{question_id}', [str(answer_id) for answer_id in answer_ids])
+    return data
+
+
+class GradingTests(TestCase):
+    def setUp(self):
+        invalidate_answer_key()
+        self.test = make_test(questions=[
+            ('one', [True, False, False]),
+            ('one', [False, True, True]),
+            ('multiple', [True, True, False]),
+            ('multiple', [False, False, True]),
+        ])
+
+    def test_scores_match_legacy_logic_for_all_selections(self):
+        questions = list(self.test.questions.order_by('id'))
+        options = []
+        for question in questions:
+            answer_ids = list(question.answers.order_by('id').values_list('id', flat=True))
+            subsets = [list(subset) for size in range(len(answer_ids) + 1)
+                       for subset in itertools.combinations(answer_ids, size)]
+            subsets.append(answer_ids[:1] * 2)  # повторный выбор одного ответа
+            subsets.append(['abc'])
+            options.append(subsets)
+
+        # Баллы за вопросы складываются независимо, поэтому перебираем варианты
+        # для каждого вопроса на фоне разных ответов на остальные.
+        for background in itertools.product(*(subsets[:2] for subsets in options)):
+            for index, question in enumerate(questions):
+                for subset in options[index]:
+                    combination = list(background)
+                    combination[index] = subset
+                    data = make_post(dict(zip((question.id for question in questions), combination)))
+                    self.assertEqual(grade_submission(self.test, data),
+                                     legacy_score(self.test, data))
+
+    def test_grading_does_not_query_database_when_key_is_cached(self):
+        get_answer_key(self.test.id)
+        data = make_post({question.id: [] for question in self.test.questions.all()})
+        with self.assertNumQueries(0):
+            grade_submission(self.test.id, data)
+
+    def test_key_is_invalidated_when_answers_change(self):
+        question = self.test.questions.order_by('id').first()
+        first, second = question.answers.order_by('id')[:2]
+        data = make_post({question.id: [second.id]})
+        self.assertEqual(grade_submission(self.test, data), 0)
+
+        first.is_correct = False
+        first.save()
+        second.is_correct = True
+        second.save()
+        self.assertEqual(grade_submission(self.test, data), 1)
+
+        second.delete()
+        self.assertEqual(grade_submission(self.test, data), 0)
+
+    def test_key_is_invalidated_when_questions_change(self):
+        self.assertEqual(len(get_answer_key(self.test.id).questions), 4)
+        question = Question.objects.create(test=self.test, question_text='Новый',
+                                           question_type='one')
+        self.assertEqual(len(get_answer_key(self.test.id).questions), 5)
+        question.delete()
+        self.assertEqual(len(get_answer_key(self.test.id).questions), 4)
+
+
+class TestTreeLoaderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+        self.client.force_login(self.user)
+        get_unread_count(self.user)  # Счётчик уведомлений в шапке берётся из кеша
+
+    def count_queries(self, test):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('test_detail', args=[test.id]))
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_tree_excludes_correctness_flags(self):
+        test = make_test(questions=[('one', [True, False])])
+        tree = build_test_tree(test)
+        answers = tree['questions'][0]['answers']
+        self.assertEqual(len(answers), 2)
+        for answer in answers:
+            self.assertEqual(set(answer), {'id', 'answer_text'})
+
+    def test_page_query_count_does_not_depend_on_question_count(self):
+        small = make_test('Малый', questions=[('one', [True, False, False])] * 5)
+        large = make_test('Большой', questions=[('multiple', [True, True, False])] * 50)
+        self.assertEqual(self.count_queries(small), self.count_queries(large))
+
+        # Со второго открытия дерево теста берётся из кеша.
+        cached = self.count_queries(large)
+        self.assertLessEqual(cached, self.count_queries(small))
+        response = self.client.get(reverse('test_detail', args=[large.id]))
+        self.assertContains(response, 'type="checkbox"', count=150)
+
+    def test_cached_tree_is_refreshed_when_content_changes(self):
+        test = make_test(questions=[('one', [True, False])])
+        self.assertEqual(len(load_test_tree(test)['questions']), 1)
+        with self.assertNumQueries(0):
+            load_test_tree(test.id)
+
+        question = test.questions.get()
+        Answer.objects.create(question=question, answer_text='Новый ответ')
+        self.assertEqual(len(load_test_tree(test)['questions'][0]['answers']), 3)
+
+
+class TestTotalPointsTests(TestCase):
+    def setUp(self):
+        self.lesson = Lesson.objects.create(title='Урок', description='Описание')
+        self.other_lesson = Lesson.objects.create(title='Другой урок', description='Описание')
+        Task.objects.create(lesson=self.lesson, question='Задача 1', points=10)
+        self.test = Test.objects.create(lesson=self.lesson, title='Тест')
+
+    def total(self):
+        self.test.refresh_from_db()
+        return self.test.total_points
+
+    def test_total_is_computed_on_create(self):
+        self.assertEqual(self.test.total_points, 10)
+
+    def test_total_follows_task_changes(self):
+        task = Task.objects.create(lesson=self.lesson, question='Задача 2', points=5)
+        self.assertEqual(self.total(), 15)
+
+        task.points = 7
+        task.save()
+        self.assertEqual(self.total(), 17)
+
+        task.lesson = self.other_lesson
+        task.save()
+        self.assertEqual(self.total(), 10)
+        other_test = Test.objects.create(lesson=self.other_lesson, title='Другой тест')
+        self.assertEqual(other_test.total_points, 7)
+
+        self.lesson.tasks.all().delete()
+        self.assertEqual(self.total(), 0)
+
+    def test_total_is_read_without_loading_tasks(self):
+        test = Test.objects.get(pk=self.test.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(test.total_points, 10)
+
+    def test_command_verifies_and_repairs_totals(self):
+        Test.objects.filter(pk=self.test.pk).update(total_points=3)
+        with self.assertRaises(CommandError):
+            call_command('recompute_test_totals', '--check', stdout=StringIO())
+
+        call_command('recompute_test_totals', stdout=StringIO())
+        self.assertEqual(self.total(), 10)
+        call_command('recompute_test_totals', '--check', stdout=StringIO())
+
+
+class AchievementRuleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+        self.tests = [make_test(f'Тест {number}') for number in range(3)]
+        self.task_achievement = make_achievement('', 'За задачу')
+        Task.objects.create(lesson=self.tests[0].lesson, question='Задача',
+                            achievement=self.task_achievement)
+        Task.objects.create(lesson=self.tests[0].lesson, question='Задача 2')
+
+    def pass_test(self, test, user=None):
+        TestResult.objects.create(user=user or self.user, test=test, score=1, passed=True)
+
+    def earned(self, user=None):
+        return set(UserAchievement.objects.filter(user=user or self.user)
+                   .values_list('achievement__condition', flat=True))
+
+    def test_conditions_are_parsed(self):
+        self.assertEqual(compile_condition('finish_5_lessons').events, {LESSON_FINISHED})
+        self.assertEqual(compile_condition('pass_test_3').events, {TEST_PASSED})
+        self.assertIsNone(compile_condition('something_else'))
+        self.assertIs(compile_condition('pass_2_tests'), compile_condition('pass_2_tests'))
+
+    def test_only_rules_for_the_event_are_awarded(self):
+        make_achievement('pass_1_tests')
+        make_achievement('finish_1_lessons')
+        self.pass_test(self.tests[0])
+        self.assertEqual(evaluate(self.user, [TEST_PASSED]),
+                         set(Achievement.objects.filter(condition='pass_1_tests')
+                             .values_list('id', flat=True)))
+        self.assertEqual(self.earned(), {'pass_1_tests'})
+
+    def test_test_passed_awards_rules_and_task_achievements(self):
+        make_achievement('pass_2_tests')
+        make_achievement(f'finish_lesson_{self.tests[0].lesson_id}')
+        make_achievement('complete_2_tasks')
+        make_achievement(f'pass_test_{self.tests[1].id}')
+
+        self.pass_test(self.tests[0])
+        on_test_passed(self.user, self.tests[0])
+        self.assertEqual(self.earned(), {'', f'finish_lesson_{self.tests[0].lesson_id}',
+                                         'complete_2_tasks'})
+
+        self.pass_test(self.tests[1])
+        on_test_passed(self.user, self.tests[1])
+        self.assertEqual(self.earned(), {'', f'finish_lesson_{self.tests[0].lesson_id}',
+                                         'complete_2_tasks', 'pass_2_tests',
+                                         f'pass_test_{self.tests[1].id}'})
+
+        # Повторная проверка ничего не добавляет и не падает на уже полученных.
+        self.assertEqual(on_test_passed(self.user, self.tests[1]), set())
+
+    def test_new_achievements_are_picked_up(self):
+        self.pass_test(self.tests[0])
+        on_test_passed(self.user, self.tests[0])
+        make_achievement('pass_1_tests')
+        on_test_passed(self.user, self.tests[0])
+        self.assertIn('pass_1_tests', self.earned())
+
+    def test_backfill_awards_all_users(self):
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'password')
+        make_achievement('finish_2_lessons')
+        make_achievement('pass_1_tests')
+        self.pass_test(self.tests[0])
+        self.pass_test(self.tests[1])
+        self.pass_test(self.tests[2], user=other)
+
+        backfill(batch_size=2)
+        self.assertEqual(self.earned(), {'', 'finish_2_lessons', 'pass_1_tests'})
+        self.assertEqual(self.earned(other), {'pass_1_tests'})
+
+        call_command('backfill_achievements', stdout=StringIO())
+        self.assertEqual(UserAchievement.objects.count(), 4)
+
+    def test_take_test_awards_task_achievement(self):
+        test = self.tests[0]
+        Task.objects.filter(lesson=test.lesson).update(points=0)
+        call_command('recompute_test_totals', stdout=StringIO())
+        make_achievement('pass_1_tests')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('test_detail', args=[test.id]))
+        self.assertContains(response, 'За задачу')
+        self.assertEqual(self.earned(), {'', 'pass_1_tests'})
+        self.assertTrue(TestResult.objects.get(user=self.user).passed)
+
+
+class UserProgressTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+        self.lesson = Lesson.objects.create(title='Урок', description='Описание')
+        self.achievements = [make_achievement(f'a{number}') for number in range(4)]
+        self.tasks = [Task.objects.create(lesson=self.lesson, question=f'Задача {number}',
+                                          achievement=self.achievements[number])
+                      for number in range(2)]
+
+    def test_summary_follows_earned_achievements(self):
+        progress = get_progress(self.user)
+        self.assertEqual((progress.earned_achievements, progress.progress_percent), (0, 0))
+
+        UserAchievement.objects.create(user=self.user, achievement=self.achievements[0])
+        progress = UserProgress.objects.get(user=self.user)
+        self.assertEqual(progress.earned_achievements, 1)
+        self.assertEqual(progress.progress_percent, 25)
+        self.assertEqual(progress.completed_task_ids, [self.tasks[0].id])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.progress, {str(self.lesson.id): 50})
+
+        UserAchievement.objects.filter(user=self.user).delete()
+        self.assertEqual(get_progress(self.user).earned_achievements, 0)
+
+        UserAchievement.objects.create(user=self.user, achievement=self.achievements[0])
+        self.user.delete()
+        self.assertFalse(UserProgress.objects.exists())
+
+    def test_summary_follows_test_results_and_catalog(self):
+        test = make_test()
+        TestResult.objects.create(user=self.user, test=test, score=1, passed=True)
+        self.assertEqual(get_progress(self.user).passed_tests, 1)
+
+        UserAchievement.objects.create(user=self.user, achievement=self.achievements[0])
+        make_achievement('a4')
+        self.assertEqual(get_progress(self.user).progress_percent, 20)
+
+    def test_profile_query_count_does_not_depend_on_catalogue_size(self):
+        self.client.force_login(self.user)
+
+        def count_queries():
+            self.client.get(reverse('profile'))  # прогреваем сводку и кеш каталога
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('profile'))
+            self.assertEqual(response.status_code, 200)
+            return len(context)
+
+        UserAchievement.objects.create(user=self.user, achievement=self.achievements[0])
+        small = count_queries()
+        for number in range(20):
+            achievement = make_achievement(f'b{number}')
+            Task.objects.create(lesson=self.lesson, question=f'Ещё {number}', achievement=achievement)
+            UserAchievement.objects.create(user=self.user, achievement=achievement)
+        self.assertEqual(count_queries(), small)
+
+    def test_profile_lists_tasks_from_cache(self):
+        self.client.force_login(self.user)
+        UserAchievement.objects.create(user=self.user, achievement=self.achievements[0])
+        self.client.get(reverse('profile'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('profile'))
+        self.assertFalse([query for query in context.captured_queries
+                          if 'kyberapp_task' in query['sql']])
+        self.assertEqual([(task['id'], completed) for task, completed
+                          in response.context['tasks_with_status']],
+                         [(task.id, task.id == self.tasks[0].id) for task in self.tasks])
+        self.assertContains(response, f'{self.lesson.title} — {self.tasks[0].question}')
+
+        self.lesson.title = 'Новое название'
+        self.lesson.save()
+        self.tasks[1].question = 'Новая задача'
+        self.tasks[1].save()
+        self.assertEqual([(task['lesson_title'], task['question']) for task in get_task_list()][1],
+                         ('Новое название', 'Новая задача'))
+        self.assertContains(self.client.get(reverse('profile')), 'Новое название — Новая задача')
+
+    def test_rebuild_command(self):
+        UserAchievement.objects.create(user=self.user, achievement=self.achievements[1])
+        UserProgress.objects.all().delete()
+        call_command('rebuild_progress', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(UserProgress.objects.get(user=self.user).completed_task_ids,
+                         [self.tasks[1].id])
+
+
+class LessonProgressTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+
+    def stored(self):
+        return CustomUser.objects.get(pk=self.user.pk).progress
+
+    def test_raise_merges_without_losing_concurrent_writes(self):
+        first = CustomUser.objects.get(pk=self.user.pk)
+        second = CustomUser.objects.get(pk=self.user.pk)
+        raise_lesson_progress(first, {1: 50})
+        raise_lesson_progress(second, {2: 75})
+        raise_lesson_progress(second.pk, {1: 25, 3: 10})
+        self.assertEqual(self.stored(), {'1': 50, '2': 75, '3': 10})
+        self.assertEqual(first.progress, {'1': 50})
+
+    def test_passing_a_test_completes_the_lesson(self):
+        test = make_test()
+        TestResult.objects.create(user=self.user, test=test, score=1, passed=True)
+        self.assertEqual(self.stored(), {str(test.lesson_id): 100})
+
+    def test_batch_recompute_overwrites_from_source_rows(self):
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'password')
+        test = make_test()
+        TestResult.objects.create(user=other, test=test, score=1, passed=True)
+        raise_lesson_progress(self.user, {test.lesson_id: 40})
+
+        recompute_lesson_progress([self.user.pk, other.pk])
+        self.assertEqual(self.stored(), {})
+        self.assertEqual(CustomUser.objects.get(pk=other.pk).progress,
+                         {str(test.lesson_id): 100})
+
+    def test_raise_many_lessons_in_one_update(self):
+        raise_lesson_progress(self.user, {1: 10})
+        percents = {lesson_id: lesson_id % 100 + 1 for lesson_id in range(1, 301)}
+        with self.assertNumQueries(1):
+            raise_lesson_progress(self.user.pk, percents)
+        expected = {str(lesson_id): percent for lesson_id, percent in percents.items()}
+        # Уже более высокое значение не понижается.
+        self.assertEqual(self.stored(), {**expected, '1': 10})
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_stats()
+        self.news = News.objects.create(title='Первая новость', content='Текст',
+                                        is_published=True)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        self.assertEqual(self.get(reverse('home'))['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Первая новость')
+
+        # Курсор страницы входит в ключ.
+        self.assertEqual(self.get(reverse('home') + '?cursor=last')['X-Page-Cache'], 'miss')
+        self.assertEqual(get_stats()['hit'], 1)
+        self.assertEqual(get_stats()['miss'], 2)
+
+    def test_saving_news_invalidates_related_pages_only(self):
+        lesson = Lesson.objects.create(title='Урок', description='Описание')
+        detail_url = reverse('news_detail', args=[self.news.pk])
+        self.get(reverse('home'))
+        self.get(reverse('lessons'))
+        self.get(detail_url)
+
+        self.news.title = 'Обновлённая новость'
+        self.news.save()
+        response = self.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Обновлённая новость')
+        self.assertEqual(self.get(detail_url)['X-Page-Cache'], 'miss')
+        self.assertEqual(self.get(reverse('lessons'))['X-Page-Cache'], 'hit')
+
+        lesson.delete()
+        self.assertEqual(self.get(reverse('lessons'))['X-Page-Cache'], 'miss')
+
+    def test_authenticated_users_bypass_cache(self):
+        user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+        self.client.force_login(user)
+        self.assertNotIn('X-Page-Cache', self.get(reverse('home')))
+        self.assertEqual(get_stats()['bypass'], 1)
+
+    @override_settings(KYBERAPP_PAGE_CACHE={'TIMEOUT': 0, 'STALE_TIMEOUT': 600})
+    def test_stale_copy_is_served_while_another_request_rebuilds(self):
+        url = reverse('home')
+        self.get(url)
+        # Имитируем перестроение страницы другим запросом: блокировка занята.
+        with mock.patch.object(caches['default'], 'add', return_value=False), \
+                self.assertNumQueries(0):
+            self.assertEqual(self.get(url)['X-Page-Cache'], 'stale')
+        self.assertEqual(self.get(url)['X-Page-Cache'], 'miss')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        news = [News(title=f'Новость {number}', content='Текст', is_published=number % 4 != 0)
+                for number in range(23)]
+        News.objects.bulk_create(news)
+        # Несколько новостей с одинаковым временем, чтобы проверить разбор по id.
+        for number, item in enumerate(News.objects.order_by('id')):
+            News.objects.filter(pk=item.pk).update(created_at=now - timedelta(minutes=number // 3))
+        self.queryset = News.objects.filter(is_published=True)
+        self.expected = list(self.queryset.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def walk(self, paginator):
+        ids, page = [], paginator.get_page()
+        while True:
+            ids += [item.id for item in page]
+            if not page.has_next():
+                return ids, page
+            page = paginator.get_page(page.next_cursor)
+
+    def test_forward_and_backward_walks_cover_all_rows(self):
+        paginator = KeysetPaginator(self.queryset, 5)
+        ids, last_page = self.walk(paginator)
+        self.assertEqual(ids, self.expected)
+
+        backward, page = [], last_page
+        while True:
+            backward = [item.id for item in page] + backward
+            if not page.has_previous():
+                break
+            page = paginator.get_page(page.previous_cursor)
+        self.assertEqual(backward, self.expected)
+
+    def test_last_page_and_invalid_cursor(self):
+        paginator = KeysetPaginator(self.queryset, 5)
+        last = paginator.get_page('last')
+        self.assertEqual([item.id for item in last], self.expected[-5:])
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+        self.assertEqual([item.id for item in paginator.get_page('не курсор')], self.expected[:5])
+
+    def test_ascending_ordering(self):
+        paginator = KeysetPaginator(self.queryset, 4, ordering=('created_at', 'id'))
+        self.assertEqual(self.walk(paginator)[0], list(reversed(self.expected)))
+
+    def test_home_shows_published_news_without_count_query(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('home'))
+        self.assertFalse(any('COUNT' in query['sql'] for query in context.captured_queries))
+        self.assertEqual([item.id for item in response.context['page_obj']], self.expected[:6])
+        response = self.client.get(reverse('home'), {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual([item.id for item in response.context['page_obj']], self.expected[6:12])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.in_title = Lesson.objects.create(title='Фишинг и поддельные письма',
+                                              description='Как распознать обман.')
+        self.in_body = Lesson.objects.create(title='Пароли',
+                                             description='Менеджер паролей защищает от фишинга.')
+        self.hidden = News.objects.create(title='Фишинг в мессенджерах', content='Черновик',
+                                          is_published=False)
+
+    def test_title_match_ranks_above_body_match(self):
+        results = search('фишинг')
+        self.assertEqual([(result['kind'], result['object_id']) for result in results],
+                         [('lesson', self.in_title.pk), ('lesson', self.in_body.pk)])
+        self.assertIn('<mark>', results[1]['snippet'])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.in_title.title = 'Социальная инженерия'
+        self.in_title.save()
+        self.assertEqual([result['object_id'] for result in search('социальная')], [self.in_title.pk])
+        self.in_body.delete()
+        self.assertEqual([result['object_id'] for result in search('менеджер')], [])
+
+        test = Test.objects.create(lesson=self.in_title, title='Тест')
+        question = Question.objects.create(test=test, question_text='Что такое фишинг?',
+                                           question_type='one')
+        found = search('что такое', kinds=['question'])
+        self.assertEqual([(result['object_id'], result['parent_id']) for result in found],
+                         [(question.pk, question.test_id)])
+
+    def test_questions_of_inactive_tests_are_not_public(self):
+        test = Test.objects.create(lesson=self.in_title, title='Тест', is_active=False)
+        question = Question.objects.create(test=test, question_text='Что такое фишинг?',
+                                           question_type='one')
+        self.assertEqual(search('что такое', kinds=['question']), [])
+        self.assertEqual(len(search('что такое', kinds=['question'], public_only=False)), 1)
+
+        test.is_active = True
+        test.save()
+        self.assertEqual([result['object_id'] for result in search('что такое', kinds=['question'])],
+                         [question.pk])
+        test.is_active = False
+        test.save()
+        self.assertEqual(search('что такое', kinds=['question']), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(search('что такое', kinds=['question']), [])
+
+    def test_unpublished_news_only_in_admin_search(self):
+        self.assertEqual(search('мессенджер', kinds=[NEWS]), [])
+        self.assertEqual(len(search('мессенджер', kinds=[NEWS], public_only=False)), 1)
+
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:kyberapp_news_changelist'), {'q': 'мессенджер'})
+        self.assertEqual([item.pk for item in response.context['cl'].result_list], [self.hidden.pk])
+
+    def test_query_syntax_is_sanitized(self):
+        self.assertEqual(build_match('"фишинг" OR (NEAR* -'), '"фишинг"* "OR"* "NEAR"*')
+        self.assertEqual(search('"*()^:'), [])
+        self.assertEqual(len(search('фиш* AND')), 0)
+
+    def test_search_page(self):
+        response = self.client.get(reverse('search'), {'q': 'фишинг'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('lesson_detail', args=[self.in_title.pk]))
+        self.assertNotContains(response, 'Фишинг в мессенджерах')
+        response = self.client.get(reverse('search'), {'q': '<script>'})
+        self.assertNotContains(response, '<script>')
+
+
+class ImportTestsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lesson = Lesson.objects.create(title='Урок', description='Описание')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def record(self, external_id='t1', questions=3, **extra):
+        return {
+            'external_id': external_id, 'lesson_id': self.lesson.pk, 'title': f'Тест {external_id}',
+            'questions': [
+                {'external_id': f'q{number}', 'question_text': f'Вопрос номер {number}',
+                 'question_type': 'one' if number % 2 else 'multiple',
+                 'answers': [{'external_id': f'a{answer}', 'answer_text': f'Ответ {answer}',
+                              'is_correct': answer == 0 or (number % 2 == 0 and answer == 1)}
+                             for answer in range(3)]}
+                for number in range(questions)
+            ],
+            **extra,
+        }
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def write_jsonl(self, records):
+        return self.write('tests.jsonl', ''.join(json.dumps(record) + '\n' for record in records))
+
+    def tree(self, external_id):
+        return sorted(Answer.objects.filter(question__test__external_id=external_id)
+                      .values_list('question__external_id', 'question__question_type',
+                                   'external_id', 'answer_text', 'is_correct'))
+
+    def test_jsonl_import_uses_bulk_inserts(self):
+        path = self.write_jsonl([self.record('t1', questions=50), self.record('t2')])
+        with CaptureQueriesContext(connection) as context:
+            stats = import_tests(read_records(path), batch_size=20)
+        self.assertEqual((stats['tests'], stats['questions'], stats['answers'], stats['errors']),
+                         (2, 53, 159, []))
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "kyberapp_answer"')]
+        self.assertEqual(len(inserts), 8 + 1)
+
+        test = Test.objects.get(external_id='t1')
+        self.assertEqual(len(load_test_tree(test)['questions']), 50)
+        question = test.questions.get(external_id='q1')
+        correct = question.answers.get(is_correct=True)
+        self.assertEqual(grade_submission(test, QueryDict(f'question_{question.pk}={correct.pk}')), 1)
+        self.assertEqual([result['object_id'] for result in search('номер 49', kinds=['question'])],
+                         [test.questions.get(external_id='q49').pk])
+
+    def test_upsert_is_idempotent_and_syncs_changes(self):
+        path = self.write_jsonl([self.record()])
+        import_tests(read_records(path), upsert=True)
+        before = self.tree('t1')
+        question_ids = set(Question.objects.values_list('pk', flat=True))
+        import_tests(read_records(path), upsert=True)
+        self.assertEqual(self.tree('t1'), before)
+        self.assertEqual(set(Question.objects.values_list('pk', flat=True)), question_ids)
+
+        changed = self.record(questions=2)
+        changed['questions'][0]['question_text'] = 'Новый текст'
+        changed['questions'][1]['answers'].pop()
+        test = Test.objects.get(external_id='t1')
+        load_test_tree(test)
+        stats = import_tests(read_records(self.write_jsonl([changed])), upsert=True)
+        self.assertEqual((stats['tests'], stats['questions'], stats['answers']), (1, 2, 5))
+        self.assertEqual(Question.objects.filter(test=test).count(), 2)
+        self.assertEqual(Answer.objects.filter(question__test=test).count(), 5)
+        self.assertEqual(load_test_tree(test)['questions'][0]['question_text'], 'Новый текст')
+
+    def test_upsert_query_count_does_not_depend_on_question_count(self):
+        def count_queries(questions):
+            path = self.write_jsonl([self.record(questions=questions)])
+            import_tests(read_records(path), upsert=True)
+            with CaptureQueriesContext(connection) as context:
+                import_tests(read_records(path), upsert=True)
+            return len(context)
+
+        # Индексация вопросов не читает тест для каждого вопроса.
+        self.assertEqual(count_queries(30), count_queries(3))
+
+    def test_invalid_records_are_reported_and_skipped(self):
+        broken = self.record('t2')
+        broken['questions'][1]['question_type'] = 'essay'
+        no_ids = self.record('t3')
+        del no_ids['questions'][0]['answers'][0]['external_id']
+        path = self.write('tests.jsonl', '\n'.join([
+            json.dumps(self.record('t1')), json.dumps(broken), '{не json', json.dumps(no_ids),
+        ]))
+        stats = import_tests(read_records(path), upsert=True)
+        self.assertEqual(stats['tests'], 1)
+        self.assertEqual([location for location, message in stats['errors']],
+                         [f'{path}:2', f'{path}:3', f'{path}:4'])
+        self.assertIn("'essay'", stats['errors'][0][1])
+
+        stderr = StringIO()
+        with self.assertRaisesMessage(CommandError, 'Пропущено тестов с ошибками: 3'):
+            call_command('import_tests', path, '--upsert', '--dry-run', stdout=StringIO(), stderr=stderr)
+        self.assertIn('external_id', stderr.getvalue())
+        # Без --upsert external_id ответов не обязателен, но повторно
+        # импортировать существующий тест нельзя.
+        stats = import_tests(read_records(path))
+        self.assertIn('уже импортирован', stats['errors'][0][1])
+        self.assertEqual(list(Test.objects.order_by('pk').values_list('external_id', flat=True)),
+                         ['t1', 't3'])
+
+    def test_csv_and_yaml_match_json(self):
+        record = self.record()
+        import_tests(read_records(self.write('tests.json', json.dumps({'tests': [record]}))))
+        expected = self.tree('t1')
+
+        rows = ['test_external_id,lesson_id,test_title,question_external_id,question_text,'
+                'question_type,answer_external_id,answer_text,is_correct']
+        for question in record['questions']:
+            for answer in question['answers']:
+                rows.append(f'csv,{self.lesson.pk},"Тест, CSV",{question["external_id"]},'
+                            f'{question["question_text"]},{question["question_type"]},'
+                            f'{answer["external_id"]},{answer["answer_text"]},'
+                            f'{"да" if answer["is_correct"] else ""}')
+        stats = import_tests(read_records(self.write('tests.csv', '\n'.join(rows))))
+        self.assertEqual(stats['errors'], [])
+        self.assertEqual(self.tree('csv'), expected)
+        self.assertEqual(Test.objects.get(external_id='csv').title, 'Тест, CSV')
+
+        yaml_record = dict(record, external_id='yaml')
+        import_tests(read_records(self.write('tests.yaml', json.dumps(yaml_record))))
+        self.assertEqual(self.tree('yaml'), expected)
+
+    def test_json_array_is_read_incrementally(self):
+        records = [self.record(f't{number}', number_value=12345.5e-1) for number in range(20)]
+        document = json.dumps(records, ensure_ascii=False, indent=1)
+
+        class Stream(io.StringIO):
+            def read(self, size=-1):
+                # Весь файл за один вызов не читается.
+                assert size > 0
+                return super().read(size)
+
+        stream = Stream(document)
+        with mock.patch.object(JSONArrayReader, 'CHUNK_SIZE', 7):
+            reader = iter(JSONArrayReader(stream))
+            self.assertEqual(next(reader), records[0])
+            self.assertLess(stream.tell(), len(document) // 2)
+            self.assertEqual(list(reader), records[1:])
+            self.assertEqual(list(JSONArrayReader(io.StringIO(
+                json.dumps({'version': [1, 2], 'tests': records[:2], 'note': 'x'})))), records[:2])
+            self.assertEqual(list(JSONArrayReader(io.StringIO(json.dumps(records[0])))), records[:1])
+            self.assertEqual(list(JSONArrayReader(io.StringIO(' [ ] '))), [])
+            self.assertEqual(list(JSONArrayReader(io.StringIO('[1, 22, 333]'))), [1, 22, 333])
+            for broken in ('[{"a": 1} {"b": 2}]', '[{"a": 1},', '[1] 2', '{1: 2}', '{"a" 1}', ''):
+                with self.assertRaises(ValueError, msg=broken):
+                    list(JSONArrayReader(io.StringIO(broken)))
+
+        path = self.write('tests.json', document)
+        stats = import_tests(read_records(path))
+        self.assertEqual((stats['tests'], stats['errors']), (20, []))
+
+
+class SubmissionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+        self.test = make_test('Тест', [('one', [True, False]), ('one', [False, True])])
+        self.achievement = make_achievement('', 'За задачу')
+        Task.objects.create(lesson=self.test.lesson, question='Задача', points=2,
+                            achievement=self.achievement)
+        make_achievement('pass_1_tests')
+        self.test.refresh_from_db()
+        self.correct = make_post({question.pk: [question.answers.get(is_correct=True).pk]
+                                  for question in self.test.questions.all()})
+
+    def test_passed_submission_is_written_once_in_one_transaction(self):
+        # Прогреваем кеши ключа ответов, каталога и индекса правил.
+        submit_test(self.user, self.test, QueryDict())
+        with CaptureQueriesContext(connection) as context:
+            result = submit_test(self.user, self.test, self.correct)
+        queries = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(sum(sql.startswith('INSERT INTO "kyberapp_testresult"') for sql in queries), 1)
+        self.assertFalse(any(sql.startswith('UPDATE "kyberapp_testresult"') for sql in queries))
+        # Одна транзакция (внутри TestCase — одна точка сохранения).
+        self.assertEqual(sum(sql.startswith(('SAVEPOINT', 'BEGIN')) for sql in queries), 1)
+
+        self.assertEqual((result.score, result.passed, result.achieved_achievement_id),
+                         (2, True, self.achievement.pk))
+        self.assertEqual(len(result.new_achievement_ids), 2)
+        self.assertEqual(UserTest.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(get_progress(self.user).earned_achievements, 2)
+
+    def test_failed_submission_awards_nothing(self):
+        result = submit_test(self.user, self.test, QueryDict())
+        self.assertEqual((result.score, result.passed, result.achieved_achievement_id),
+                         (0, False, None))
+        self.assertFalse(UserAchievement.objects.exists())
+        self.assertEqual(UserTest.objects.get().score, 0)
+
+    def test_failure_rolls_back_the_whole_submission(self):
+        with mock.patch('kyberapp.submissions.refresh_progress', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                submit_test(self.user, self.test, self.correct)
+        self.assertFalse(TestResult.objects.exists())
+        self.assertFalse(UserTest.objects.exists())
+        self.assertFalse(UserAchievement.objects.exists())
+
+
+@override_settings(KYBERAPP_SUBMISSION_QUEUE={'ENABLED': True, 'BATCH_SIZE': 2})
+class SubmissionQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+        self.test = make_test('Тест', [('one', [True, False]), ('multiple', [True, True, False])])
+        make_achievement('pass_1_tests')
+        Task.objects.create(lesson=self.test.lesson, question='Задача', points=2)
+        self.test.refresh_from_db()
+        self.correct = make_post({question.pk: question.answers.filter(is_correct=True)
+                                  .values_list('pk', flat=True)
+                                  for question in self.test.questions.all()})
+
+    def test_post_enqueues_and_status_page_waits_for_worker(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('test_detail', args=[self.test.id]),
+                                    dict(self.correct.lists()))
+        submission = Submission.objects.get()
+        self.assertRedirects(response, reverse('submission_status', args=[submission.pk]))
+        self.assertFalse(TestResult.objects.exists())
+
+        response = self.client.get(reverse('submission_status', args=[submission.pk]))
+        self.assertContains(response, 'http-equiv="refresh"')
+
+        call_command('grade_worker', '--once', stdout=StringIO())
+        submission.refresh_from_db()
+        self.assertEqual((submission.status, submission.result.score, submission.result.passed),
+                         (Submission.DONE, 2, True))
+        self.assertEqual(UserAchievement.objects.filter(user=self.user).count(), 1)
+        response = self.client.get(reverse('submission_status', args=[submission.pk]))
+        self.assertContains(response, 'Your score: 2')
+
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'password')
+        self.client.force_login(other)
+        response = self.client.get(reverse('submission_status', args=[submission.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_worker_claims_in_batches_and_each_submission_once(self):
+        for number in range(5):
+            enqueue(self.user, self.test, self.correct if number % 2 else QueryDict())
+        first = claim_batch(2, 'a')
+        second = claim_batch(2, 'b')
+        self.assertEqual(len({submission.pk for submission in first + second}), 4)
+        self.assertEqual(process_batch(first) + process_batch(second), 4)
+        self.assertEqual(run_worker(once=True), 1)
+        self.assertEqual(list(Submission.objects.values_list('status', flat=True).distinct()),
+                         [Submission.DONE])
+        self.assertEqual(sorted(TestResult.objects.values_list('passed', flat=True)),
+                         [False, False, False, True, True])
+        self.assertEqual(UserTest.objects.count(), 5)
+
+    def test_failed_submission_is_retried_then_marked_failed(self):
+        good = enqueue(self.user, self.test, self.correct)
+        bad = enqueue(self.user, self.test, self.correct)
+        def build(user, test, data):
+            if build.calls.pop(0):
+                raise ValueError('сбой')
+            return build_result(user, test, data)
+
+        # Пачка падает, затем по одной: первая проходит, вторая — нет.
+        build.calls = [False, True, False, True]
+        with mock.patch('kyberapp.submission_queue.build_result', side_effect=build), \
+                self.assertLogs('kyberapp.submission_queue'):
+            self.assertEqual(process_batch(claim_batch(2), max_attempts=2), 1)
+        good.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual((good.status, bad.status, bad.error), (Submission.DONE, Submission.PENDING, 'сбой'))
+
+        build.calls = [True]
+        with mock.patch('kyberapp.submission_queue.build_result', side_effect=build), \
+                self.assertLogs('kyberapp.submission_queue'):
+            self.assertEqual(process_batch(claim_batch(2), max_attempts=2), 0)
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (Submission.FAILED, 2))
+
+    def test_stale_processing_submissions_are_requeued(self):
+        submission = enqueue(self.user, self.test, self.correct)
+        claim_batch(1)
+        Submission.objects.filter(pk=submission.pk).update(
+            started_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(requeue_stale(timeout=60), 1)
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, Submission.PENDING)
+
+
+@override_settings(KYBERAPP_NOTIFICATIONS={'CHUNK_SIZE': 3})
+class NotificationFanOutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        CustomUser.objects.bulk_create(
+            [CustomUser(username=f'user{number}', email=f'user{number}@example.com',
+                        notify_by_email=number % 2 == 0, is_active=number != 7)
+             for number in range(10)])
+
+    def publish(self, news=None):
+        news = news or News(title='Важно', content='Текст новости')
+        news.is_published = True
+        with self.captureOnCommitCallbacks(execute=True):
+            news.save()
+        return news
+
+    def test_saving_news_only_leaves_it_pending(self):
+        with CaptureQueriesContext(connection) as context:
+            news = self.publish()
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(any('kyberapp_customuser' in query['sql']
+                             for query in context.captured_queries))
+        news.refresh_from_db()
+        self.assertIsNone(news.notified_at)
+
+        out = StringIO()
+        call_command('notify_news', stdout=out)
+        self.assertIn(f'Новость {news.pk}: создано уведомлений 9, отправлено писем 5', out.getvalue())
+        news.refresh_from_db()
+        self.assertIsNotNone(news.notified_at)
+        self.assertIsNone(news.notification_started_at)
+
+    def test_pending_news_fan_out_in_chunks_over_one_connection(self):
+        draft = News.objects.create(title='Черновик', content='Текст')
+        self.publish(draft)
+        News.objects.create(title='Скрытая', content='Текст')
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_connection, \
+                CaptureQueriesContext(connection) as context:
+            self.assertEqual(list(notify_pending_news()), [draft.pk])
+        self.assertEqual(open_connection.call_count, 1)
+        inserts = [query for query in context.captured_queries
+                   if re.match(r'INSERT (OR IGNORE )?INTO "kyberapp_notification"', query['sql'])]
+        self.assertEqual(len(inserts), 3)  # 9 активных пользователей пачками по 3
+
+        self.assertEqual(Notification.objects.count(), 9)
+        self.assertEqual(Notification.objects.first().title, 'Новая новость: Черновик')
+        self.assertEqual(set(Notification.objects.values_list('news_id', flat=True)), {draft.pk})
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'user{number}@example.com' for number in (0, 2, 4, 6, 8)])
+        self.assertEqual(notify_pending_news(), {})
+
+    def test_notifications_are_sent_once_per_news(self):
+        news = self.publish()
+        notify_pending_news()
+        news.title = 'Исправленный заголовок'
+        self.publish(news)
+        news.is_published = False
+        news.save()
+        self.publish(news)
+        self.assertEqual(notify_pending_news(), {})
+        self.assertEqual(Notification.objects.count(), 9)
+        self.assertIsNone(notify_news_published(news.pk))
+
+    def test_interrupted_fan_out_can_be_resumed(self):
+        # Новость с тем же заголовком уже разослана — её уведомления не мешают.
+        notify_news_published(self.publish().pk)
+        news = News.objects.create(title='Важно', content='Текст')
+        News.objects.filter(pk=news.pk).update(is_published=True)
+        with mock.patch('kyberapp.notifications.MailSender.send',
+                        side_effect=[1, ConnectionError('сбой')]):
+            with self.assertRaises(ConnectionError), self.assertLogs('kyberapp.notifications'):
+                notify_news_published(news.pk)
+        self.assertEqual(Notification.objects.filter(news=news).count(), 6)
+
+        call_command('notify_news', news.pk, stdout=StringIO())
+        self.assertEqual(Notification.objects.filter(news=news).count(), 9)
+        self.assertEqual(Notification.objects.filter(news=news).values('user').distinct().count(), 9)
+
+    def test_abandoned_fan_out_is_taken_over(self):
+        news = self.publish()
+        # Обработчик забрал рассылку и завис (или его остановили по тайм-ауту).
+        started = timezone.now() - timedelta(seconds=30)
+        News.objects.filter(pk=news.pk).update(notification_started_at=started)
+        fan_out(CustomUser.objects.filter(username='user0'), 'Новая новость: Важно', 'Текст',
+                send_email=False, news_id=news.pk)
+        self.assertEqual(notify_pending_news(), {})
+
+        with override_settings(KYBERAPP_NOTIFICATIONS={'CHUNK_SIZE': 3, 'PROCESSING_TIMEOUT': 10}):
+            self.assertEqual(notify_pending_news()[news.pk]['notifications'], 8)
+        self.assertEqual(Notification.objects.filter(news=news).count(), 9)
+
+        # Сохранение новости в админке не затирает отметки обработчика.
+        stale = News.objects.get(pk=news.pk)
+        News.objects.filter(pk=news.pk).update(notified_at=None, notification_started_at=started)
+        stale.save()
+        self.assertEqual(News.objects.get(pk=news.pk).notification_started_at, started)
+
+    def test_fan_out_stops_when_claim_is_taken_over(self):
+        news = self.publish()
+        sent = []
+
+        def send(sender, messages):
+            sent.extend(messages)
+            # Пока письма первой пачки уходят, рассылку забирает другой обработчик.
+            News.objects.filter(pk=news.pk).update(notification_started_at=timezone.now())
+            return len(messages)
+
+        with override_settings(KYBERAPP_NOTIFICATIONS={'CHUNK_SIZE': 3}), \
+                mock.patch('kyberapp.notifications.MailSender.send', autospec=True, side_effect=send), \
+                self.assertLogs('kyberapp.notifications', 'WARNING'):
+            self.assertIsNone(notify_news_published(news.pk))
+        # Вторая пачка записана, но её письма не отправлены: отметка уже чужая.
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(Notification.objects.filter(news=news).count(), 6)
+        news.refresh_from_db()
+        self.assertIsNone(news.notified_at)
+        self.assertIsNotNone(news.notification_started_at)
+
+    def test_claim_is_refreshed_after_each_chunk(self):
+        news = self.publish()
+        claims = []
+        with override_settings(KYBERAPP_NOTIFICATIONS={'CHUNK_SIZE': 4}), \
+                mock.patch('kyberapp.notifications.MailSender.send', autospec=True,
+                           side_effect=lambda sender, messages: claims.append(
+                               News.objects.get(pk=news.pk).notification_started_at)):
+            notify_news_published(news.pk)
+        self.assertEqual(len(claims), 3)
+        self.assertEqual(claims, sorted(claims))
+        self.assertEqual(len(set(claims)), 3)
+
+    def test_notification_is_unique_per_news_and_user(self):
+        news = self.publish()
+        users = CustomUser.objects.filter(username__in=['user0', 'user1'])
+        fan_out(users, 'Заголовок', 'Текст', send_email=False, news_id=news.pk)
+        fan_out(CustomUser.objects.all(), 'Заголовок', 'Текст', send_email=False, news_id=news.pk)
+        self.assertEqual(Notification.objects.filter(news=news).count(), 10)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Notification.objects.create(user=users[0], news=news, title='Ещё', message='Текст')
+        # Уведомления без новости не ограничены.
+        fan_out(users, 'Заголовок', 'Текст', send_email=False)
+        fan_out(users, 'Заголовок', 'Текст', send_email=False)
+        self.assertEqual(Notification.objects.filter(news__isnull=True).count(), 4)
+
+    def test_migration_marks_published_news_notified(self):
+        published = News.objects.create(title='Старая', content='Текст', is_published=True)
+        draft = News.objects.create(title='Черновик', content='Текст')
+        migration = importlib.import_module(
+            'kyberapp.migrations.0021_news_backfill_notified_at_notification_uniq')
+        migration.mark_published_news_notified(apps, None)
+        self.assertIsNotNone(News.objects.get(pk=published.pk).notified_at)
+        self.assertIsNone(News.objects.get(pk=draft.pk).notified_at)
+        self.assertEqual(notify_pending_news(), {})
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(mail.outbox, [])
+
+    def test_fan_out_without_email(self):
+        stats = fan_out(CustomUser.objects.all(), 'Заголовок', 'Текст', chunk_size=4,
+                        send_email=False)
+        self.assertEqual(stats, {'notifications': 10, 'emails': 0})
+        self.assertEqual(mail.outbox, [])
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+        self.other = CustomUser.objects.create_user('other', 'other@example.com', 'password')
+        self.notifications = [Notification.objects.create(user=self.user, title=f'Уведомление {number}',
+                                                          message='Текст')
+                              for number in range(25)]
+        Notification.objects.create(user=self.other, title='Чужое', message='Текст')
+
+    def test_counter_is_cached_and_updated_in_place(self):
+        self.assertEqual(get_unread_count(self.user), 25)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user), 25)
+
+        Notification.objects.create(user=self.user, title='Ещё одно', message='Текст')
+        self.assertEqual(mark_read(self.user, [self.notifications[0].pk, self.notifications[1].pk,
+                                               self.notifications[1].pk]), 2)
+        self.assertEqual(mark_read(self.other, [self.notifications[2].pk]), 0)
+        self.notifications[3].delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user), 23)
+        self.assertEqual(get_unread_count(self.user),
+                         Notification.objects.filter(user=self.user, is_read=False).count())
+
+    def test_mark_all_read_is_one_update(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(mark_all_read(self.user), 25)
+        self.assertEqual(get_unread_count(self.user), 0)
+        self.assertEqual(get_unread_count(self.other), 1)
+
+        self.client.force_login(self.other)
+        self.client.post(reverse('mark_notifications_read'))
+        self.assertEqual(self.client.get(reverse('unread_count')).json(), {'unread': 0})
+
+    def test_fan_out_resets_counters(self):
+        self.assertEqual(get_unread_count(self.user), 25)
+        fan_out(CustomUser.objects.all(), 'Новость', 'Текст', send_email=False)
+        self.assertEqual(get_unread_count(self.user), 26)
+
+    def test_header_and_inbox_pages(self):
+        get_unread_count(self.user)
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('achievements'))
+        self.assertContains(response, '<span class="badge">25</span>')
+        self.assertFalse(any('kyberapp_notification' in query['sql']
+                             for query in context.captured_queries))
+
+        response = self.client.get(reverse('inbox'))
+        titles = [notification.title for notification in response.context['page_obj']]
+        self.assertEqual(titles, [f'Уведомление {number}' for number in range(24, 4, -1)])
+        response = self.client.get(reverse('inbox'), {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(response.context['page_obj']), 5)
+
+        self.client.post(reverse('mark_notifications_read'),
+                         {'notification': [self.notifications[24].pk]})
+        response = self.client.get(reverse('inbox'), {'unread': '1'})
+        self.assertEqual(response.context['page_obj'].object_list[0].title, 'Уведомление 23')
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root,
+                                              KYBERAPP_IMAGES={'ASYNC': False})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name='cover.png', size=(800, 400)):
+        # Шум плохо сжимается в PNG — как фотография.
+        image = Image.frombytes('RGBA', size, os.urandom(size[0] * size[1] * 4))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_created_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(title='Урок', description='Описание',
+                                           image=self.upload())
+        derivative = ImageDerivative.objects.get(source=lesson.image.name)
+        self.assertEqual((derivative.width, derivative.height), (800, 400))
+        # 1080 шире исходника — вместо неё копия в исходную ширину.
+        self.assertEqual([(variant['format'], variant['width'], variant['height'])
+                          for variant in derivative.variants],
+                         [('webp', 360, 180), ('jpeg', 360, 180), ('webp', 720, 360),
+                          ('jpeg', 720, 360), ('webp', 800, 400), ('jpeg', 800, 400)])
+        original_size = default_storage.size(lesson.image.name)
+        for variant in derivative.variants:
+            self.assertIn(derivative.digest, variant['name'])
+            self.assertLess(default_storage.size(variant['name']), original_size)
+            with default_storage.open(variant['name']) as file:
+                self.assertEqual(Image.open(file).width, variant['width'])
+
+    def test_identical_images_share_variants(self):
+        upload = self.upload()
+        content = upload.read()
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(title='Урок', description='Описание', image=upload)
+            news = News.objects.create(title='Новость', content='Текст',
+                                       image=SimpleUploadedFile('copy.png', content))
+        self.assertEqual(get_variants(lesson.image.name), get_variants(news.image.name))
+        self.assertEqual(len(os.listdir(os.path.dirname(
+            default_storage.path(get_variants(news.image.name)[0]['name'])))), 6)
+
+    def test_small_icon_is_reencoded_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            achievement = Achievement.objects.create(
+                title='Иконка', description='Описание', condition='test_passed',
+                icon=self.upload('icon.png', size=(100, 100)))
+        self.assertEqual({variant['width'] for variant in get_variants(achievement.icon.name)},
+                         {64, 100})
+
+    def test_template_tag_uses_srcset_and_falls_back_to_original(self):
+        lesson = Lesson.objects.create(title='Урок', description='Описание',
+                                       image=self.upload())
+        template = Template('{% load images %}'
+                            '{% responsive_image lesson.image alt=lesson.title width=300 %}')
+        html = template.render(Context({'lesson': lesson}))
+        self.assertIn(f'src="{lesson.image.url}"', html)
+        self.assertNotIn('srcset', html)
+
+        generate_variants(lesson.image.name, 'lesson')
+        html = template.render(Context({'lesson': lesson}))
+        self.assertIn('<source type="image/webp" srcset="', html)
+        self.assertIn('-360w.webp 360w, ', html)
+        self.assertIn('-360w.jpg" srcset="', html)  # src: самая узкая копия не уже 300px
+        self.assertIn('sizes="300px"', html)
+
+    def test_command_backfills_and_refreshes_cached_listing(self):
+        Lesson.objects.create(title='Урок', description='Описание', image=self.upload())
+        self.assertNotContains(self.client.get(reverse('lessons')), 'srcset')
+
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+        self.assertIn('Обработано изображений: 1', out.getvalue())
+        self.assertContains(self.client.get(reverse('lessons')), 'srcset')
+
+    def test_unreadable_image_is_skipped(self):
+        with self.assertLogs('kyberapp.images', 'WARNING'):
+            self.assertIsNone(generate_variants('lessons/missing.png', 'lesson'))
+        self.assertFalse(ImageDerivative.objects.exists())
+
+
+class StaticAssetsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root)
+        cls.enterClassContext(override_settings(STATIC_ROOT=cls.static_root))
+        # В CSS темы есть ссылки на отсутствующие шрифты и картинки.
+        with cls().assertLogs('kyberapp.assets', 'WARNING'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        cls.bundle = staticfiles_storage.hashed_files['bundles/site.css']
+
+    def test_minify_css_keeps_strings_and_selectors(self):
+        css = """/* тема */
+        a :hover , b > i {
+            content: "  /* не комментарий */ " ;
+            color : red;
+        }
+        /*! лицензия */"""
+        self.assertEqual(minify_css(css), 'a :hover,b>i{content:"  /* не комментарий */ ";'
+                                          'color :red}/*! лицензия */')
+
+    def test_bundle_inlines_imports_and_rebases_urls(self):
+        files = {
+            'css/main.css': "@import url('http://fonts.example.com/css');\n"
+                            "@import 'parts/icons.css';\nbody { background: url(../img/bg.png) }",
+            'css/parts/icons.css': "@charset \"UTF-8\";\n"
+                                   ".icon { background: url('sprite.png?v=2'); }",
+        }
+        css = build_css_bundle('bundles/site.css', ['css/main.css'], files.__getitem__)
+        self.assertEqual(css, "@import url('http://fonts.example.com/css');"
+                              ".icon{background:url('../css/parts/sprite.png?v=2')}"
+                              "body{background:url(../img/bg.png)}")
+
+    def test_collectstatic_builds_hashed_precompressed_bundle(self):
+        self.assertRegex(self.bundle, r'^bundles/site\.[0-9a-f]{12}\.css$')
+        path = os.path.join(self.static_root, self.bundle)
+        with open(path, encoding='utf-8') as file:
+            css = file.read()
+        self.assertTrue(css.startswith("@import url('http://fonts.googleapis.com/"))
+        self.assertIn('.fa-shield', css)  # font-awesome.css из @import style.css
+        self.assertRegex(css, r'url\("\.\./img/bg_direction_nav\.[0-9a-f]{12}\.png"\)')
+        with open(path + '.gz', 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()).decode('utf-8'), css)
+
+    def test_base_template_links_single_bundle(self):
+        response = self.client.get(reverse('login'))
+        self.assertContains(response, f'href="/static/{self.bundle}"', count=1)
+        self.assertNotContains(response, 'css/bootstrap.min.css')
+
+    def test_bundle_is_served_compressed_with_etag(self):
+        url = f'/static/{self.bundle}'
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertIn(b'.fa-shield', gzip.decompress(body))
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn(b'.fa-shield', b''.join(response.streaming_content))
+
+    def test_unknown_and_unsafe_paths_fall_through(self):
+        self.assertEqual(self.client.get('/static/css/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+        response = self.client.get('/static/css/style.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+
+class AsyncUrls:
+    urlpatterns = build_urlpatterns(use_async_views=True)
+
+
+@override_settings(ROOT_URLCONF=AsyncUrls)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.news = News.objects.create(title='Асинхронная новость', content='Текст',
+                                        is_published=True)
+        self.lesson = Lesson.objects.create(title='Асинхронный урок', description='Описание')
+        self.test = Test.objects.create(lesson=self.lesson, title='Тест')
+        self.user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+        achievement = make_achievement(TEST_PASSED, title='Первый тест')
+        UserAchievement.objects.create(user=self.user, achievement=achievement)
+        Notification.objects.create(user=self.user, title='Уведомление', message='Текст')
+
+    async def test_read_pages_render_like_sync_views(self):
+        for url, text in [('/', 'Асинхронная новость'),
+                          (f'/news/{self.news.pk}/', 'Асинхронная новость'),
+                          ('/lessons/', 'Всего уроков: 1'),
+                          (f'/lessons/{self.lesson.pk}/', f'/login/?next=/test/{self.test.pk}/')]:
+            response = await self.async_client.get(url)
+            self.assertContains(response, text)
+        response = await self.async_client.get('/news/0/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_cached_page_is_served_without_thread_hops(self):
+        response = await self.async_client.get('/')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+        request = AsyncRequestFactory().get('/')
+        request.user = AnonymousUser()
+        with mock.patch.object(SyncToAsync, '__call__',
+                               side_effect=AssertionError('переход в поток')):
+            response = await async_views.home(request)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Асинхронная новость')
+
+    async def test_authenticated_pages_load_everything_before_rendering(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get('/achievements/')
+        self.assertContains(response, 'Первый тест')
+        self.assertContains(response, '<span class="badge">1</span>')
+        response = await self.async_client.get(f'/lessons/{self.lesson.pk}/')
+        self.assertContains(response, f'href="/test/{self.test.pk}/"')
+        self.assertNotIn('X-Page-Cache', await self.async_client.get('/'))
+
+
+class DatabaseTuningTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def open_file_database(self):
+        wrapper = DatabaseWrapper({**connection.settings_dict,
+                                   'NAME': os.path.join(self.directory, 'db.sqlite3')})
+        wrapper.connect()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        wrapper = self.open_file_database()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -32 * 1024)
+
+    @override_settings(KYBERAPP_SQLITE={'ENABLED': False})
+    def test_pragmas_disabled(self):
+        wrapper = self.open_file_database()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+
+    @mock.patch('kyberapp.database.time.sleep')
+    def test_retry_on_locked_repeats_until_success(self, sleep):
+        calls = []
+
+        @retry_on_locked
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        self.assertEqual(write(), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+        # Паузы растут и не превышают RETRY_MAX_DELAY.
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertTrue(0.025 <= first <= 0.05 < second <= 0.1)
+
+    @override_settings(KYBERAPP_SQLITE={'RETRY_ATTEMPTS': 2})
+    @mock.patch('kyberapp.database.time.sleep')
+    def test_retry_on_locked_gives_up(self, sleep):
+        calls = []
+
+        @retry_on_locked
+        def write():
+            calls.append(1)
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 2)
+
+    @mock.patch('kyberapp.database.time.sleep')
+    def test_retry_on_locked_ignores_other_errors_and_outer_transactions(self, sleep):
+        calls = []
+
+        @retry_on_locked
+        def write(message):
+            calls.append(message)
+            raise OperationalError(message)
+
+        with self.assertRaises(OperationalError):
+            write('no such table: missing')
+        self.assertEqual(len(calls), 1)
+
+        # Внутри внешней транзакции повторять нужно её целиком.
+        with self.assertRaises(OperationalError), transaction.atomic():
+            write('database is locked')
+        self.assertEqual(len(calls), 2)
+        sleep.assert_not_called()
+
+    @mock.patch('kyberapp.database.time.sleep')
+    def test_submit_test_retried_when_locked(self, sleep):
+        user = CustomUser.objects.create_user(username='retry', password='pass')
+        test = make_test(questions=[('one', [True, False])])
+        question = test.questions.get()
+        data = QueryDict(mutable=True)
+        data.setlist(f'question_{question.pk}', [str(question.answers.get(is_correct=True).pk)])
+        original = TestResult.objects.bulk_create
+        attempts = []
+
+        def bulk_create(*args, **kwargs):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+            return original(*args, **kwargs)
+
+        with mock.patch.object(TestResult.objects, 'bulk_create', side_effect=bulk_create):
+            submit_test(user, test, data)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(TestResult.objects.filter(user=user).count(), 1)
+        self.assertEqual(UserTest.objects.filter(user=user).count(), 1)
+
+
+@override_settings(KYBERAPP_REPLICA={'ENABLED': True, 'STICKY_SECONDS': 10})
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request, write=False):
+        """
+        Выполняет запрос через ReplicaMiddleware; ответ содержит базу для
+        чтения новостей и пользователей.
+        """
+        def view(request):
+            if write:
+                self.router.db_for_write(Notification)
+            return HttpResponse(f'{self.router.db_for_read(News)} '
+                                f'{self.router.db_for_read(CustomUser)}')
+        return ReplicaMiddleware(view)(request)
+
+    def test_content_reads_go_to_replica(self):
+        response = self.route(self.factory.get('/'))
+        self.assertEqual(response.content, b'replica default')
+        self.assertNotIn('kyberapp_primary_until', response.cookies)
+
+    def test_unsafe_requests_and_writes_pin_primary(self):
+        self.assertEqual(self.route(self.factory.post('/')).content, b'default default')
+
+        response = self.route(self.factory.get('/'), write=True)
+        self.assertEqual(response.content, b'default default')
+        cookie = response.cookies['kyberapp_primary_until']
+        self.assertEqual(cookie['max-age'], 10)
+
+        # В окне после записи чтение идёт с основной базы.
+        request = self.factory.get('/')
+        request.COOKIES['kyberapp_primary_until'] = cookie.value
+        self.assertEqual(self.route(request).content, b'default default')
+
+        request.COOKIES['kyberapp_primary_until'] = str(int(cookie.value) - 20)
+        self.assertEqual(self.route(request).content, b'replica default')
+
+    def test_outside_requests_and_reporting(self):
+        self.assertEqual(self.router.db_for_read(News), 'default')
+        with reporting():
+            self.assertEqual(self.router.db_for_read(UserTest), 'replica')
+            with primary():
+                self.assertEqual(self.router.db_for_read(UserTest), 'default')
+        self.assertEqual(self.router.db_for_write(News), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'kyberapp'))
+        self.assertIsNone(self.router.allow_migrate('default', 'kyberapp'))
+
+    @override_settings(KYBERAPP_REPLICA={'ENABLED': False})
+    def test_disabled(self):
+        self.assertEqual(self.route(self.factory.get('/')).content, b'None None')
+
+    def test_copy_database(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source, target = (DatabaseWrapper({**connection.settings_dict,
+                                           'NAME': os.path.join(directory, name)})
+                          for name in ('primary.sqlite3', 'replica.sqlite3'))
+        self.addCleanup(source.close)
+        self.addCleanup(target.close)
+        with source.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (title TEXT)')
+            cursor.execute("INSERT INTO item VALUES ('Новость')")
+        copy_database(source, target)
+        with target.cursor() as cursor:
+            cursor.execute('SELECT title FROM item')
+            self.assertEqual(cursor.fetchall(), [('Новость',)])
+
+        with self.assertRaises(ValueError):
+            copy_database(source, source)
+
+
+@override_settings(KYBERAPP_REPLICA={'ENABLED': True}, KYBERAPP_PAGE_CACHE={'ENABLED': False})
+class ReplicaRequestTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('student', 'student@example.com', 'password')
+        self.news = News.objects.create(title='Новость', content='Текст', is_published=True)
+        self.test = make_test(questions=[('one', [True, False])])
+
+    def test_reads_follow_replica_until_write(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.get(reverse('news_detail', args=[self.news.pk]))
+        self.assertTrue(any('kyberapp_news' in query['sql'] for query in replica.captured_queries))
+
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.post(reverse('test_detail', args=[self.test.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica.captured_queries, [])
+        self.assertIn('kyberapp_primary_until', response.cookies)
+
+        # Сразу после отправки теста страницы читаются с основной базы.
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.get(reverse('lessons'))
+        self.assertEqual(replica.captured_queries, [])
+
+
+@override_settings(KYBERAPP_REPLICA={'ENABLED': True, 'ALIAS': 'lagging'},
+                   KYBERAPP_PAGE_CACHE={'ENABLED': True})
+class LaggingReplicaTests(TransactionTestCase):
+    """
+    Реплика — снимок основной базы, сделанный до правок в админке.
+    """
+
+    def setUp(self):
+        cache.clear()
+        invalidate_answer_key()
+        self.test = make_test(questions=[('one', [True, False])])
+        self.question = self.test.questions.get()
+        self.news = News.objects.create(title='Новость', content='Старый текст', is_published=True)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        replica = DatabaseWrapper({**connection.settings_dict,
+                                   'NAME': os.path.join(directory, 'lagging.sqlite3')}, 'lagging')
+        copy_database(connection, replica)
+        connections['lagging'] = replica
+        self.addCleanup(replica.close)
+        self.addCleanup(delattr, connections._connections, 'lagging')
+
+    def in_request(self, read):
+        """
+        Вызывает ``read`` внутри GET-запроса без закрепления за основной базой.
+        """
+        result = []
+        ReplicaMiddleware(lambda request: result.append(read()) or HttpResponse())(
+            RequestFactory().get('/'))
+        return result[0]
+
+    def test_version_keyed_caches_are_rebuilt_from_primary(self):
+        # Прогреваем кеши до правок.
+        self.assertEqual(self.client.get(reverse('news_detail', args=[self.news.pk]))['X-Page-Cache'],
+                         'miss')
+        self.in_request(lambda: (get_catalog(), get_answer_key(self.test.pk),
+                                 load_test_tree(self.test.pk)))
+
+        # Правки в админке: версии увеличиваются на основной базе, реплика отстаёт.
+        self.news.content = 'Новый текст'
+        self.news.save()
+        self.question.question_text = 'Исправленный вопрос'
+        self.question.save()
+        for answer in self.question.answers.all():
+            answer.is_correct = False
+            answer.save()
+        correct = Answer.objects.create(question=self.question, answer_text='Новый', is_correct=True)
+        Task.objects.create(lesson=self.test.lesson, question='Задача', points=1)
+        self.assertEqual(self.in_request(lambda: Task.objects.count()), 0)
+        self.assertEqual(self.in_request(
+            lambda: News.objects.get(pk=self.news.pk).content), 'Старый текст')
+
+        response = self.client.get(reverse('news_detail', args=[self.news.pk]))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Новый текст')
+
+        catalog, answer_key, tree = self.in_request(
+            lambda: (get_catalog(), get_answer_key(self.test.pk), load_test_tree(self.test.pk)))
+        self.assertEqual(len(catalog['tasks']), 1)
+        self.assertEqual(answer_key.questions[self.question.pk].correct_ids, {correct.pk})
+        self.assertEqual(tree['questions'][0]['question_text'], 'Исправленный вопрос')
+        self.assertEqual(len(tree['questions'][0]['answers']), 3)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Горячие запросы должны идти по индексам: EXPLAIN QUERY PLAN на базе
+    с данными и статистикой (ANALYZE) не должен содержать полного просмотра
+    таблицы или сортировки во временном B-дереве.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        users = CustomUser.objects.bulk_create(
+            [CustomUser(username=f'user{number}', email=f'user{number}@example.com')
+             for number in range(60)])
+        lessons = Lesson.objects.bulk_create([Lesson(title=f'Урок {number}', description='Описание')
+                                              for number in range(20)])
+        tests = Test.objects.bulk_create([Test(lesson=lesson, title='Тест') for lesson in lessons])
+        questions = Question.objects.bulk_create([
+            Question(test=test, question_text='Вопрос', question_type='one')
+            for test in tests for _ in range(10)])
+        Answer.objects.bulk_create([Answer(question=question, answer_text='Ответ',
+                                           is_correct=number == 0)
+                                    for question in questions for number in range(4)])
+        achievements = Achievement.objects.bulk_create([
+            Achievement(title=f'Достижение {number}', description='Описание',
+                        icon='achievements/icon.png', condition=f'pass_test_{number}')
+            for number in range(20)])
+        UserAchievement.objects.bulk_create([
+            UserAchievement(user=user, achievement=achievement)
+            for number, user in enumerate(users) for achievement in achievements[number % 5::5]])
+        TestResult.objects.bulk_create([
+            TestResult(user=user, test=test, score=1, passed=(user.pk + test.pk) % 2 == 0)
+            for user in users for test in tests])
+        UserTest.objects.bulk_create([UserTest(user=user, test=test, score=1)
+                                      for user in users for test in tests])
+        News.objects.bulk_create([News(title='Новость', content='Текст', is_published=number % 3 > 0)
+                                  for number in range(100)])
+        Notification.objects.bulk_create([
+            Notification(user=user, title='Заголовок', message='Текст', is_read=number % 10 > 0)
+            for user in users for number in range(30)])
+        rebuild_leaderboards()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user, cls.test = users[0], tests[0]
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.query_plan(queryset)
+        details = '\n'.join(plan)
+        for line in plan:
+            # "SCAN таблица" без индекса — просмотр всей таблицы.
+            self.assertIsNone(re.fullmatch(r'SCAN \S+', line), details)
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', line, details)
+        # Имя индекса — регулярное выражение (у индексов внешних ключей
+        # и ограничений уникальности Django добавляет хеш).
+        self.assertRegex(details, rf'(?m)USING (COVERING )?INDEX {index}( |$)')
+
+    def test_hot_queries_use_indexes(self):
+        user_id, test_id = self.user.pk, self.test.pk
+        hot_queries = [
+            # Страницы профиля и достижений; проверка правил (achievement_rules.evaluate).
+            (UserAchievement.objects.filter(user_id=user_id).select_related('achievement'),
+             r'kyberapp_userachievement_user_id_[0-9a-f]+'),
+            (UserAchievement.objects.filter(user_id=user_id, achievement_id__in=[1, 2, 3])
+             .values_list('achievement_id', flat=True),
+             r'kyberapp_userachievement_user_id_achievement_id_[0-9a-f]+_uniq'),
+            # Прогресс (progress.compute_progress) и правила pass_test_<id>.
+            (TestResult.objects.filter(user_id__in=[user_id], passed=True).order_by()
+             .values_list('user_id', 'test_id', 'test__lesson_id').distinct(),
+             'testresult_user_test_idx'),
+            (TestResult.objects.filter(passed=True, user_id__in=[user_id], test_id=test_id)
+             .values_list('user_id', flat=True), 'testresult_user_test_idx'),
+            (TestResult.objects.filter(user_id=user_id, test_id=test_id), 'testresult_user_test_idx'),
+            # История прохождений пользователя.
+            (UserTest.objects.filter(user_id=user_id).order_by('-completed_at')[:20],
+             'usertest_user_completed_idx'),
+            # Лента новостей на главной.
+            (News.objects.filter(is_published=True).order_by('-created_at', '-id')[:6],
+             'news_published_created_idx'),
+            # Ключ ответов теста (grading.compile_answer_key).
+            (Answer.objects.filter(question__test_id=test_id, is_correct=True)
+             .values_list('question_id', 'id'), 'answer_correct_idx'),
+            # Счётчик непрочитанных и лента уведомлений (inbox.py).
+            (Notification.objects.filter(user_id=user_id, is_read=False), 'notification_unread_idx'),
+            (Notification.objects.filter(user_id=user_id).order_by('-created_at', '-id')[:20],
+             'notification_inbox_idx'),
+            # Снимок рейтинга: первые места (leaderboards.get_board).
+            (LeaderboardEntry.objects.filter(scope='global', object_id=0)
+             .order_by('-score', '-achievements', 'user_id')
+             .values_list('user_id', 'user__username', 'score', 'achievements')[:100],
+             'leaderboard_rank_idx'),
+            # Место пользователя: лучшие строки по диапазонам индекса (leaderboards.rank_of).
+            (LeaderboardEntry.objects.filter(scope='test', object_id=test_id, score__gt=3)
+             .values('pk'), r'leaderboard_rank_idx \(scope=\? AND object_id=\? AND score>\?\)'),
+            (LeaderboardEntry.objects.filter(scope='test', object_id=test_id, score=3,
+                                             achievements__gt=0).values('pk'),
+             r'leaderboard_rank_idx \(scope=\? AND object_id=\? AND score=\? AND achievements>\?\)'),
+        ]
+        for queryset, index in hot_queries:
+            with self.subTest(query=str(queryset.query)[:120]):
+                self.assertUsesIndex(queryset, index)
+
+
+def lessons_with_test_counts(request):
+    # Счётчик тестов по одному запросу на урок — N+1.
+    counts = [lesson.tests.count() for lesson in Lesson.objects.all()]
+    return HttpResponse(str(sum(counts)))
+
+
+class PerfUrls:
+    urlpatterns = build_urlpatterns() + [
+        path('n-plus-one/', lessons_with_test_counts, name='n_plus_one'),
+    ]
+
+
+@override_settings(ROOT_URLCONF=PerfUrls, KYBERAPP_PERF={'ENABLED': True, 'METRICS_TOKEN': 'secret'},
+                   KYBERAPP_PAGE_CACHE={'ENABLED': False})
+class PerfTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        perf.registry.reset()
+        perf._reported_duplicates.clear()
+        self.addCleanup(perf.registry.reset)
+        # Соединение тестовой базы могло открыться до подключения обработчика.
+        perf.install_execute_wrapper(None, connection)
+
+    def test_histogram_quantiles(self):
+        histogram = perf.Histogram((1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.total, 16.5)
+        self.assertAlmostEqual(histogram.quantile(0.2), 1.0)
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.75)
+        # Значения больше последней границы оцениваются этой границей.
+        self.assertEqual(histogram.quantile(0.99), 4.0)
+        self.assertEqual(perf.Histogram((1,)).quantile(0.5), 0.0)
+        # Значение, равное границе, попадает в её корзину.
+        histogram.observe(2)
+        self.assertEqual(histogram.counts, [1, 3, 1, 1])
+
+    def test_page_request_is_recorded_by_view_name(self):
+        News.objects.create(title='Новость', content='Текст', is_published=True)
+        self.client.get('/')
+        self.client.get('/')
+        self.client.get('/news/0/')
+
+        snapshot = perf.registry.snapshot()
+        home = snapshot['home']
+        self.assertEqual(home.duration.count, 2)
+        self.assertGreaterEqual(home.queries.total, 2)
+        self.assertGreater(home.db_duration.total, 0)
+        self.assertGreater(home.template_duration.total, 0)
+        self.assertLessEqual(home.db_duration.total + home.template_duration.total,
+                             home.duration.total)
+        self.assertEqual(home.n_plus_one_requests, 0)
+        self.assertEqual(snapshot['news_detail'].duration.count, 1)
+
+    def test_repeated_queries_are_reported_as_n_plus_one(self):
+        for number in range(6):
+            make_test(title=f'Тест {number}')
+        with self.assertLogs('kyberapp.perf', 'WARNING') as logs:
+            self.client.get('/n-plus-one/')
+            self.client.get('/n-plus-one/')
+        # О месте N+1 предупреждение пишется один раз.
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('n_plus_one', logs.output[0])
+        self.assertIn('6 раз', logs.output[0])
+        metrics = perf.registry.snapshot()['n_plus_one']
+        self.assertEqual(metrics.n_plus_one_requests, 2)
+        self.assertEqual(metrics.duplicate_queries, 10)
+
+    def test_disabled_perf_records_nothing(self):
+        with override_settings(KYBERAPP_PERF={'ENABLED': False}):
+            self.client.get('/')
+        self.assertEqual(perf.registry.snapshot(), {})
+
+    def test_metrics_round_trip(self):
+        self.client.get('/')
+        self.client.get('/lessons/')
+        snapshot = perf.registry.snapshot()
+        parsed = perf.parse_metrics(perf.render_metrics(snapshot))
+        self.assertEqual(set(parsed), set(snapshot))
+        for view, metrics in snapshot.items():
+            for name in ('duration', 'db_duration', 'template_duration', 'queries'):
+                self.assertEqual(getattr(parsed[view], name).counts, getattr(metrics, name).counts)
+                self.assertAlmostEqual(getattr(parsed[view], name).total,
+                                       getattr(metrics, name).total, places=5)
+            self.assertEqual(parsed[view].n_plus_one_requests, metrics.n_plus_one_requests)
+
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        self.client.get('/')
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                         403)
+
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('kyberapp_request_duration_seconds_count{view="home"} 1',
+                      response.content.decode())
+
+        staff = CustomUser.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+        with override_settings(KYBERAPP_PERF={'ENABLED': True}):
+            self.client.force_login(CustomUser.objects.create_user('student', 'student@example.com',
+                                                                   'password'))
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code,
+                             403)
+
+    def test_perf_report_prints_table(self):
+        for _ in range(3):
+            self.client.get('/')
+        self.client.get('/lessons/')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        metrics_file = os.path.join(directory, 'metrics.txt')
+        with open(metrics_file, 'w', encoding='utf-8') as file:
+            file.write(perf.render_metrics())
+
+        out = StringIO()
+        call_command('perf_report', file=metrics_file, sort='count', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertIn('p95 мс', lines[0])
+        self.assertTrue(lines[2].startswith('home '))
+        self.assertEqual(lines[2].split()[1], '3')
+        self.assertTrue(lines[3].startswith('lessons '))
+
+        with open(metrics_file, 'w', encoding='utf-8') as file:
+            file.write(perf.render_metrics({}))
+        out = StringIO()
+        call_command('perf_report', file=metrics_file, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Замеров пока нет.')
+
+
+class SeedingTests(TestCase):
+    volumes = {'users': 6, 'lessons': 4, 'tasks_per_lesson': 2, 'questions_per_test': 5,
+               'answers_per_question': 3, 'news': 12, 'achievements': 8, 'results_per_user': 3,
+               'notifications_per_user': 4}
+
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_creates_consistent_data(self):
+        created = seed(**self.volumes)
+        self.assertEqual(created, {
+            'customuser': 6, 'lesson': 4, 'task': 8, 'test': 4, 'question': 20, 'answer': 60,
+            'achievement': 8, 'news': 12, 'testresult': 18, 'submission': 18, 'notification': 24,
+        })
+        self.assertTrue(CustomUser.objects.get(username='bench0').is_staff)
+        self.assertTrue(self.client.login(username='bench3', password='bench-password'))
+
+        # Данные, которые обычно поддерживают сигналы, пересчитаны.
+        for test in Test.objects.all():
+            self.assertEqual(test.total_points, compute_lesson_points(test.lesson_id))
+        for result in TestResult.objects.select_related('test'):
+            self.assertEqual(result.passed, result.score >= result.test.total_points)
+            submission = result.submission
+            self.assertEqual(submission.status, Submission.DONE)
+            self.assertEqual(grade_submission(result.test, make_post(
+                {int(key.split('_')[1]): values for key, values in submission.answers.items()})),
+                result.score)
+        self.assertEqual(UserProgress.objects.count(), 6)
+        self.assertTrue(UserAchievement.objects.exists())
+        self.assertTrue(search('защита'))
+        user = CustomUser.objects.get(username='bench1')
+        self.assertEqual(get_unread_count(user),
+                         Notification.objects.filter(user=user, is_read=False).count())
+
+    def selections(self):
+        """
+        Выбранные ответы отправок как порядковые номера ответов в вопросах
+        (ID у двух наборов данных разные) и баллы результатов.
+        """
+        positions = {}
+        for question_id, answer_id in Answer.objects.order_by('pk').values_list('question_id', 'pk'):
+            positions.setdefault(question_id, []).append(answer_id)
+        selected = [
+            [[positions[int(key.split('_')[1])].index(int(value)) for value in values]
+             for key, values in answers.items()]
+            for answers in Submission.objects.order_by('pk').values_list('answers', flat=True)]
+        return selected, list(TestResult.objects.order_by('pk').values_list('score', flat=True))
+
+    def test_seed_is_deterministic(self):
+        seed(prefix='first', **self.volumes)
+        first = self.selections()
+        Lesson.objects.all().delete()
+        seed(prefix='second', **self.volumes)
+        self.assertEqual(self.selections(), first)
+        Lesson.objects.all().delete()
+        seed(seed=1, prefix='third', **self.volumes)
+        self.assertNotEqual(self.selections(), first)
+
+    def test_unknown_volume_is_rejected(self):
+        with self.assertRaises(TypeError):
+            seed(students=10)
+
+    def test_seed_bench_command(self):
+        out = StringIO()
+        call_command('seed_bench', users=3, lessons=2, news=5, achievements=4,
+                     results_per_user=1, notifications_per_user=2, stdout=out)
+        self.assertIn('customuser: 3', out.getvalue())
+        self.assertIn('Вход: bench0 (сотрудник) … bench2', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('seed_bench', users=1, stdout=StringIO())
+        call_command('seed_bench', users=1, prefix='extra', stdout=StringIO())
+        self.assertTrue(CustomUser.objects.filter(username='extra0').exists())
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.first = make_test('Первый', [('one', [True, False]), ('one', [True, False])])
+        self.second = make_test('Второй', [('one', [True, False])])
+        self.users = [CustomUser.objects.create_user(f'player{number}', f'player{number}@example.com',
+                                                     'password') for number in range(4)]
+
+    def answers(self, test, correct):
+        """
+        Ответы на первые ``correct`` вопросов теста правильные, на остальные — нет.
+        """
+        selection = {}
+        for number, question in enumerate(test.questions.order_by('pk')):
+            answer = question.answers.filter(is_correct=number < correct).first()
+            selection[question.pk] = [answer.pk]
+        return make_post(selection)
+
+    def entries(self, user):
+        return {(scope, object_id): (score, achievements)
+                for scope, object_id, score, achievements in LeaderboardEntry.objects
+                .filter(user=user).values_list('scope', 'object_id', 'score', 'achievements')}
+
+    def test_result_writes_update_all_boards(self):
+        player = self.users[0]
+        submit_test(player, self.first, self.answers(self.first, 2))
+        submit_test(player, self.first, self.answers(self.first, 1))  # хуже — лучший балл остаётся
+        submit_test(player, self.second, self.answers(self.second, 1))
+        self.assertEqual(self.entries(player), {
+            ('test', self.first.pk): (2, 0),
+            ('test', self.second.pk): (1, 0),
+            ('lesson', self.first.lesson_id): (2, 0),
+            ('lesson', self.second.lesson_id): (1, 0),
+            ('global', 0): (3, 0),
+        })
+
+        # Результат, записанный не через submit_test, и достижение учитываются сигналами.
+        TestResult.objects.create(user=player, test=self.second, score=5, passed=True)
+        UserAchievement.objects.create(user=player, achievement=make_achievement('manual'))
+        self.assertEqual(self.entries(player)[('global', 0)], (7, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TestResult.objects.filter(user=player, test=self.second).delete()
+        self.assertEqual(self.entries(player), {
+            ('test', self.first.pk): (2, 0),
+            ('lesson', self.first.lesson_id): (2, 0),
+            ('global', 0): (2, 1),
+        })
+
+    def test_rank_lookup_matches_full_sort(self):
+        scores = [(3, 1), (5, 0), (3, 1), (3, 4)]
+        for user, (score, achievements) in zip(self.users, scores):
+            TestResult.objects.create(user=user, test=self.first, score=score)
+            for number in range(achievements):
+                UserAchievement.objects.create(
+                    user=user, achievement=make_achievement(f'manual_{user.pk}_{number}'))
+
+        # Место — 1 плюс количество строго лучших участников.
+        for user, key in zip(self.users, scores):
+            expected = 1 + sum(other > key for other in scores)
+            self.assertEqual(get_rank(user)['rank'], expected)
+        self.assertEqual([(entry['rank'], entry['username']) for entry in get_board()['top']],
+                         [(1, 'player1'), (2, 'player3'), (3, 'player0'), (3, 'player2')])
+        self.assertEqual(get_rank(self.users[0], 'test', self.first.pk),
+                         {'rank': 2, 'total': 4, 'score': 3, 'achievements': 0})
+        self.assertIsNone(get_rank(self.users[0], 'test', self.second.pk))
+        self.assertEqual(rank_of('global', 0, (3, 1)), 3)
+        self.assertEqual(rank_of('global', 0, (9, 0)), 1)
+        self.assertEqual(rank_of('global', 0, (0, 0)), 5)
+
+    def test_board_is_served_from_cache(self):
+        for user, score in zip(self.users, (1, 2, 3, 4)):
+            TestResult.objects.create(user=user, test=self.first, score=score)
+        get_board()
+        with self.assertNumQueries(0):
+            board = get_board()
+        self.assertEqual(board['total'], 4)
+        # В снимке только первые места, а не ключи всех участников.
+        self.assertEqual(set(board), {'total', 'top'})
+        # Место пользователя — запрос его строки и два COUNT по индексу.
+        with self.assertNumQueries(3):
+            self.assertEqual(get_rank(self.users[0], board=board)['rank'], 4)
+
+        # Новый результат виден в месте пользователя сразу, в снимке — после TIMEOUT.
+        TestResult.objects.create(user=self.users[0], test=self.second, score=10)
+        self.assertEqual(get_rank(self.users[0])['rank'], 1)
+        self.assertEqual(get_board()['top'][0]['username'], 'player3')
+
+    def test_rebuild_command_checks_and_repairs(self):
+        for user in self.users:
+            submit_test(user, self.first, self.answers(self.first, 1))
+        call_command('rebuild_leaderboards', check=True, stdout=StringIO())
+
+        LeaderboardEntry.objects.filter(user=self.users[0], scope='global').update(score=99)
+        LeaderboardEntry.objects.filter(user=self.users[1], scope='test').delete()
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, 'Найдено расхождений: 2'):
+            call_command('rebuild_leaderboards', check=True, stdout=out)
+        self.assertIn('сохранено (99, 0), ожидается (1, 0)', out.getvalue())
+
+        get_board()
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+        self.assertIn('Пересчитаны рейтинги пользователей: 4', out.getvalue())
+        call_command('rebuild_leaderboards', check=True, stdout=StringIO())
+        # Перестройка сбрасывает снимки в кеше.
+        self.assertEqual(get_board()['top'][0]['score'], 1)
+
+    def test_leaderboard_pages(self):
+        for user, correct in zip(self.users, (2, 1, 0, 2)):
+            submit_test(user, self.first, self.answers(self.first, correct))
+        response = self.client.get('/leaderboard/')
+        self.assertContains(response, 'Общий рейтинг')
+        self.assertContains(response, 'player3')
+        self.assertNotContains(response, 'Ваше место')
+
+        self.client.force_login(self.users[1])
+        response = self.client.get(f'/leaderboard/test/{self.first.pk}/')
+        self.assertContains(response, 'Рейтинг: Первый')
+        self.assertContains(response, 'Ваше место: 3 из 4')
+        response = self.client.get(f'/leaderboard/lesson/{self.first.lesson_id}/')
+        self.assertContains(response, 'Ваше место: 3 из 4')
+        self.assertEqual(self.client.get('/leaderboard/test/0/').status_code, 404)
+
+        with override_settings(KYBERAPP_LEADERBOARD={'PAGE_SIZE': 2}):
+            cache.clear()
+            response = self.client.get('/leaderboard/?page=2')
+        self.assertEqual([entry['username'] for entry in response.context['page_obj']],
+                         ['player1', 'player2'])
+
+
+class ExportTests(TestCase):
+    volumes = {'users': 8, 'lessons': 3, 'tasks_per_lesson': 1, 'questions_per_test': 4,
+               'answers_per_question': 3, 'news': 0, 'achievements': 0, 'results_per_user': 2,
+               'notifications_per_user': 0}
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(**cls.volumes)
+
+    def setUp(self):
+        invalidate_answer_key()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def read_csv(self, path):
+        with open(path, encoding='utf-8', newline='') as stream:
+            return list(csv.DictReader(stream))
+
+    def test_csv_export(self):
+        exported = export(self.directory)
+        self.assertEqual({dataset: count for dataset, (path, count) in exported.items()},
+                         {'results': 16, 'history': 16, 'answers': 64})
+
+        results = self.read_csv(exported['results'][0])
+        result = TestResult.objects.select_related('test').order_by('pk').first()
+        self.assertEqual(results[0], {
+            'id': str(result.pk), 'user_id': str(result.user_id), 'test_id': str(result.test_id),
+            'lesson_id': str(result.test.lesson_id), 'score': str(result.score),
+            'total_points': str(result.test.total_points), 'passed': str(int(result.passed)),
+        })
+        history = self.read_csv(exported['history'][0])
+        self.assertEqual(history[0]['completed_at'],
+                         UserTest.objects.order_by('pk').first().completed_at.isoformat())
+
+        # Сумма верных ответов результата совпадает с его баллом.
+        scores = {}
+        for row in self.read_csv(exported['answers'][0]):
+            scores[int(row['result_id'])] = scores.get(int(row['result_id']), 0) + int(row['correct'])
+        self.assertEqual(scores, dict(TestResult.objects.values_list('pk', 'score')))
+
+    def test_rows_are_streamed(self):
+        test_ids = list(Test.objects.values_list('pk', flat=True))
+        rows = iter_rows('answers', chunk_size=5)
+        with CaptureQueriesContext(connection) as queries:
+            next(rows)
+        # Первая строка — выборка отправок и ключ первого теста (два запроса).
+        self.assertEqual(len(queries), 3)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(list(rows)), 63)
+        # Остальные строки: только ключи оставшихся тестов, число запросов
+        # не зависит от количества отправок.
+        self.assertEqual(len(queries), 2 * (len(test_ids) - 1))
+
+        only = test_ids[0]
+        rows = list(iter_rows('results', test_ids=[only]))
+        self.assertEqual({row[2] for row in rows}, {only})
+
+    def test_missing_pyarrow(self):
+        with mock.patch.object(exports, 'pyarrow', None):
+            with self.assertRaisesMessage(CommandError, 'требуется пакет pyarrow'):
+                call_command('export_results', self.directory, format='parquet', stdout=StringIO())
+
+    @skipUnless(exports.pyarrow, 'pyarrow не установлен')
+    @skipUnless(analytics.np, 'numpy не установлен')
+    def test_columnar_export_matches_csv(self):
+        columns = ['result_id', 'test_id', 'question_id', 'correct']
+        expected = analytics.load_columns(export(self.directory, ['answers'])['answers'][0], columns)
+        for file_format in ('parquet', 'arrow'):
+            exported = export(self.directory, ['answers', 'history'], file_format, chunk_size=7)
+            self.assertEqual(exported['answers'][1], 64)
+            loaded = analytics.load_columns(exported['answers'][0], columns)
+            for name in columns:
+                self.assertEqual(loaded[name].tolist(), expected[name].tolist())
+
+    @skipUnless(analytics.np, 'numpy не установлен')
+    def test_item_statistics(self):
+        # Два теста: в первом четыре результата, во втором один.
+        rows = [
+            # (результат, тест, вопрос, верно)
+            (1, 1, 10, 1), (1, 1, 11, 1), (1, 1, 12, 1),
+            (2, 1, 10, 1), (2, 1, 11, 0), (2, 1, 12, 1),
+            (3, 1, 10, 0), (3, 1, 11, 1), (3, 1, 12, 1),
+            (4, 1, 10, 0), (4, 1, 11, 0), (4, 1, 12, 1),
+            (5, 2, 20, 1),
+        ]
+        stats = analytics.item_statistics(*zip(*rows))
+        self.assertEqual(stats['question_id'].tolist(), [10, 11, 12, 20])
+        self.assertEqual(stats['test_id'].tolist(), [1, 1, 1, 2])
+        self.assertEqual(stats['responses'].tolist(), [4, 4, 4, 1])
+        self.assertEqual(stats['p_value'].tolist(), [0.5, 0.5, 1.0, 1.0])
+        # Верхняя группа — результат 1 (3 верных), нижняя — результат 4 (1 верный).
+        self.assertEqual(stats['discrimination'].tolist(), [1.0, 1.0, 0.0, 0.0])
+        # Остальные вопросы у вопроса 10: [2, 1, 2, 1] — корреляция 0.
+        self.assertAlmostEqual(stats['point_biserial'][0], 0.0)
+        self.assertTrue(analytics.np.isnan(stats['point_biserial'][2]))
+
+        passes = analytics.pass_statistics([1, 1, 2, 1], [3, 1, 2, 2], [1, 0, 1, 1])
+        self.assertEqual(passes['test_id'].tolist(), [1, 2])
+        self.assertEqual(passes['results'].tolist(), [3, 1])
+        self.assertEqual(passes['pass_rate'].tolist(), [2 / 3, 1.0])
+        self.assertEqual(passes['mean_score'].tolist(), [2.0, 2.0])
+
+    @skipUnless(analytics.np, 'numpy не установлен')
+    def test_item_statistics_match_loop(self):
+        columns = analytics.load_columns(export(self.directory, ['answers'])['answers'][0],
+                                         ['result_id', 'test_id', 'question_id', 'correct'])
+        stats = analytics.item_statistics(columns['result_id'], columns['test_id'],
+                                          columns['question_id'], columns['correct'])
+        np = analytics.np
+        answers = {}
+        for result_id, question_id, correct in zip(columns['result_id'], columns['question_id'],
+                                                   columns['correct']):
+            answers.setdefault(int(question_id), {})[int(result_id)] = int(correct)
+        for number, question_id in enumerate(stats['question_id']):
+            by_result = answers[int(question_id)]
+            totals = {result_id: sum(answers[other].get(result_id, 0) for other in answers)
+                      for result_id in by_result}
+            self.assertAlmostEqual(stats['p_value'][number],
+                                   sum(by_result.values()) / len(by_result))
+            item = np.array([by_result[result_id] for result_id in sorted(by_result)])
+            rest = np.array([totals[result_id] for result_id in sorted(by_result)]) - item
+            if item.std() and rest.std():
+                self.assertAlmostEqual(stats['point_biserial'][number],
+                                       np.corrcoef(item, rest)[0, 1])
+
+    @skipUnless(analytics.np, 'numpy не установлен')
+    def test_command(self):
+        out = StringIO()
+        call_command('export_results', self.directory, stats=True, stdout=out)
+        output = out.getvalue()
+        self.assertIn('answers: 64 строк', output)
+        self.assertIn('Пройдено %', output)
+        self.assertEqual(len([line for line in output.splitlines()
+                              if re.match(r'\s+\d+\s+\d+\s+\d+\s+\d\.\d\d\s', line)]), 12)
+
+
+class SelectionTests(TestCase):
+    def setUp(self):
+        invalidate_answer_key()
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='student', password='password')
+        self.test = make_test('Выбор', [('one', [True, False, False, False])] * 6
+                              + [('multiple', [True, True, False, False])] * 4)
+        self.questions = list(self.test.questions.order_by('pk').prefetch_related('answers'))
+
+    def post(self, pick):
+        """
+        pick: вопрос -> порядковые номера выбранных ответов.
+        """
+        return make_post({question.pk: [list(question.answers.order_by('pk'))[number].pk
+                                        for number in pick(question)]
+                          for question in self.questions})
+
+    def test_encoding_round_trip(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            first_id = rng.randrange(1, 10 ** 7)
+            last_id = first_id + rng.randrange(0, 200)
+            selected = rng.sample(range(first_id, last_id + 1), rng.randrange(0, last_id - first_id + 2))
+            for bounds in ((first_id, last_id), (None, None)):
+                self.assertEqual(decode_selection(encode_selection(selected, *bounds)), sorted(selected))
+        self.assertIsNone(decode_selection(None))
+        self.assertEqual(encode_selection([]), b'')
+        self.assertEqual(decode_selection(memoryview(encode_selection([5, 3], 1, 9))), [3, 5])
+        # Выбор вне диапазона маски хранится списком.
+        self.assertEqual(decode_selection(encode_selection([3, 500], 1, 9)), [3, 500])
+        # Десять вопросов по четыре ответа: маска из 5 байт, ID — трёхбайтный varint.
+        self.assertEqual(len(encode_selection(range(100000, 100040, 4), 100000, 100039)), 1 + 3 + 5)
+        # Два ответа из тысячи — списком.
+        self.assertEqual(encode_selection([100000, 100999], 100000, 100999)[0], 0)
+
+    def test_submit_stores_selection(self):
+        data = self.post(lambda question: [0, 1] if question.question_type == 'multiple' else [2])
+        # Чужой ответ и мусор не сохраняются.
+        data.appendlist(f'question_{self.questions[0].pk}', 'abc')
+        data.appendlist(f'question_{self.questions[1].pk}', str(self.questions[0].answers.first().pk))
+        result = submit_test(self.user, self.test, data)
+        self.assertEqual(result.score, 4)
+
+        result = TestResult.objects.get(pk=result.pk)
+        selected = decode_selection(result.selected_answers)
+        expected = sorted(
+            answer.pk for question in self.questions for number, answer in
+            enumerate(question.answers.order_by('pk'))
+            if number in ((0, 1) if question.question_type == 'multiple' else (2,)))
+        self.assertEqual(selected, expected)
+        self.assertEqual(len(result.selected_answers), 1 + 1 + 5)
+        correct = get_answer_key(self.test.pk).question_results(selected)
+        self.assertEqual(sum(correct.values()), 4)
+        self.assertFalse(correct[self.questions[0].pk])
+
+        enqueue(self.user, self.test, self.post(lambda question: [0]))
+        process_batch(claim_batch(1))
+        queued = Submission.objects.get().result
+        self.assertEqual(len(decode_selection(queued.selected_answers)), 10)
+        self.assertEqual(queued.score, 6)
+
+    def test_selection_counts(self):
+        rng = random.Random(2)
+        expected = {}
+        for number in range(30):
+            data = self.post(lambda question: rng.sample(range(4), rng.randrange(1, 3)))
+            submit_test(self.user, self.test, data)
+            for key in data:
+                for answer_id in data.getlist(key):
+                    expected[int(answer_id)] = expected.get(int(answer_id), 0) + 1
+        # Результат без сохранённого выбора и результат со списком вне диапазона.
+        TestResult.objects.create(user=self.user, test=self.test, score=0)
+        TestResult.objects.create(user=self.user, test=self.test, score=0,
+                                  selected_answers=encode_selection([10 ** 6]))
+        expected[10 ** 6] = 1
+
+        # Объекты моделей не создаются.
+        with mock.patch.object(TestResult, 'from_db', side_effect=AssertionError):
+            self.assertEqual(selection_counts(chunk_size=7), expected)
+            with mock.patch('kyberapp.selections.np', None):
+                self.assertEqual(selection_counts(chunk_size=7), expected)
+        self.assertEqual(selection_counts(TestResult.objects.filter(test__title='Другой')), {})
+
+    def test_migration_fills_selection_from_submissions(self):
+        enqueue(self.user, self.test, self.post(lambda question: [0, 2]))
+        process_batch(claim_batch(1))
+        result = Submission.objects.get().result
+        encoded = bytes(TestResult.objects.get(pk=result.pk).selected_answers)
+        stored = decode_selection(encoded)
+        TestResult.objects.update(selected_answers=None)
+
+        migration = importlib.import_module('kyberapp.migrations.0019_testresult_selected_answers')
+        migration.fill_selected_answers(apps, None)
+        # Миграция пишет тот же формат, что и selections.py.
+        self.assertEqual(bytes(TestResult.objects.get(pk=result.pk).selected_answers), encoded)
+        self.assertEqual(len(stored), 20)
+        self.assertFalse(hasattr(migration, 'encode_selection'))
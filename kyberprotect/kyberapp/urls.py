@@ -2,22 +2,45 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 
-from . import views
+from . import async_views, views
 
-urlpatterns = [
-    path('', views.home, name='home'),
-    path('lessons/', views.lessons, name='lessons'),
-    path('lessons/<int:lesson_id>/', views.lesson_detail,
-         name='lesson_detail'),
-    path('achievements/', views.achievements, name='achievements'),
-    path('profile/', views.profile, name='profile'),
-    path('login/', views.login_view, name='login'),
-    path('register/', views.register_view, name='register'),
-    path('logout/', views.logout_view, name='logout'),
-    path('admin-faq/', views.admin_faq, name='admin_faq'),
-    path('test/<int:test_id>/', views.take_test, name='test_detail'),
-    path('news/<int:pk>/', views.news_detail, name='news_detail'),
-]
+
+def build_urlpatterns(use_async_views=False):
+    """
+    Маршруты приложения. При ``use_async_views`` страницы для чтения
+    обслуживают асинхронные версии из async_views.py.
+    """
+    read_views = async_views if use_async_views else views
+    return [
+        path('', read_views.home, name='home'),
+        path('lessons/', read_views.lessons, name='lessons'),
+        path('lessons/<int:lesson_id>/', read_views.lesson_detail,
+             name='lesson_detail'),
+        path('achievements/', read_views.achievements, name='achievements'),
+        path('profile/', views.profile, name='profile'),
+        path('login/', views.login_view, name='login'),
+        path('register/', views.register_view, name='register'),
+        path('logout/', views.logout_view, name='logout'),
+        path('admin-faq/', views.admin_faq, name='admin_faq'),
+        path('test/<int:test_id>/', views.take_test, name='test_detail'),
+        path('submissions/<int:submission_id>/', views.submission_status,
+             name='submission_status'),
+        path('news/<int:pk>/', read_views.news_detail, name='news_detail'),
+        path('search/', views.search, name='search'),
+        path('notifications/', views.inbox, name='inbox'),
+        path('notifications/read/', views.mark_notifications_read,
+             name='mark_notifications_read'),
+        path('notifications/unread-count/', views.unread_count, name='unread_count'),
+        path('metrics/', views.metrics, name='metrics'),
+        path('leaderboard/', views.leaderboard, name='leaderboard'),
+        path('leaderboard/lesson/<int:object_id>/', views.leaderboard,
+             {'scope': 'lesson'}, name='lesson_leaderboard'),
+        path('leaderboard/test/<int:object_id>/', views.leaderboard,
+             {'scope': 'test'}, name='test_leaderboard'),
+    ]
+
+
+urlpatterns = build_urlpatterns(async_views.is_enabled())
 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
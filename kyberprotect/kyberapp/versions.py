@@ -0,0 +1,58 @@
+"""
+Версии контента для построения ключей кеша.
+
+Каждая версия хранится в кеше Django. При изменении контента версия
+увеличивается, и все записи кеша, построенные по старой версии, перестают
+использоваться без явного удаления.
+"""
+import time
+
+from django.core.cache import cache
+
+from . import async_support
+
+
+def _version_key(namespace, key):
+    return f'kyberapp:version:{namespace}:{key}'
+
+
+def _initial_version():
+    # Если версия пропала из кеша, новая не должна совпасть ни с одной из старых.
+    return int(time.time() * 1000)
+
+
+def get_version(namespace, key=''):
+    """
+    Возвращает текущую версию контента (например, ``get_version('test', 5)``).
+    """
+    cache_key = _version_key(namespace, key)
+    version = cache.get(cache_key)
+    if version is None:
+        cache.add(cache_key, _initial_version(), timeout=None)
+        version = cache.get(cache_key)
+    return version
+
+
+async def aget_version(namespace, key=''):
+    """
+    Асинхронная версия ``get_version``.
+    """
+    cache_key = _version_key(namespace, key)
+    version = await async_support.aget(cache_key)
+    if version is None:
+        await async_support.aadd(cache_key, _initial_version(), timeout=None)
+        version = await async_support.aget(cache_key)
+    return version
+
+
+def bump_version(namespace, key=''):
+    """
+    Увеличивает версию контента после его изменения.
+    """
+    cache_key = _version_key(namespace, key)
+    try:
+        return cache.incr(cache_key)
+    except ValueError:
+        version = _initial_version()
+        cache.set(cache_key, version, timeout=None)
+        return version
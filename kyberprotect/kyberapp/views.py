@@ -2,36 +2,54 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.views.decorators.http import require_POST
 from django.core.paginator import Paginator
 
+from . import leaderboards, perf, submission_queue
 from .forms import CustomUserCreationForm
+from .inbox import get_unread_count, mark_all_read, mark_read
+from .loaders import load_test_tree
+from .page_cache import cache_public_page
+from .pagination import KeysetPaginator
+from .progress import get_progress, get_task_list
+from .search import search as search_documents
+from .submissions import submit_test
 
-from .models import (Lesson, Achievement, UserAchievement, Task,
-                     News, Test, Question, Answer, TestResult)
+from .models import (Lesson, UserAchievement,
+                     News, Test, Question, Answer, Submission, Notification)
 
 
+@cache_public_page('news_list', params=('cursor',))
 def home(request):
-    news_list = News.objects.all()  # Получаем все новости
-    paginator = Paginator(news_list, 6)  # Пагинируем, 5 новостей на странице
-    page_number = request.GET.get('page')  # Получаем номер страницы из GET-параметра
-    page_obj = paginator.get_page(page_number)  # Получаем объект страницы
+    news_list = News.objects.filter(is_published=True)  # Только опубликованные новости
+    paginator = KeysetPaginator(news_list, 6, ordering=('-created_at', '-id'))  # 6 новостей на странице, новые первыми
+    page_obj = paginator.get_page(request.GET.get('cursor'))  # Получаем страницу по курсору из GET-параметра
     return render(request, "kyberapp/home.html", {"page_obj": page_obj})
 
 
+@cache_public_page('news:{pk}', params=())
 def news_detail(request, pk):
     news_item = get_object_or_404(News, pk=pk)
     return render(request, 'kyberapp/news_detail.html', {'news_item': news_item})
 
 
+@cache_public_page('lessons', params=('cursor',))
 def lessons(request):
     lessons_list = Lesson.objects.all()  # Получаем все уроки
-    paginator = Paginator(lessons_list, 10)  # 10 уроков на страницу
-    page_number = request.GET.get('page')  # Номер страницы
-    page_obj = paginator.get_page(page_number)  # Получаем объект страницы
+    paginator = KeysetPaginator(lessons_list, 10, ordering=('created_at', 'id'),
+                                count_cache_key='kyberapp:lessons_count')  # 10 уроков на страницу
+    page_obj = paginator.get_page(request.GET.get('cursor'))  # Получаем страницу по курсору
     return render(request, "kyberapp/lessons.html", {'page_obj': page_obj})
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()  # Строка поиска
+    results = search_documents(query) if query else []  # Лучшие совпадения по урокам, новостям и вопросам
+    return render(request, 'kyberapp/search.html', {'query': query, 'results': results})
+
+
 def lesson_detail(request, lesson_id):
     """
     Отображает страницу подробностей урока.
@@ -82,26 +100,24 @@ def profile(request):
     Отображение страницы профиля с достижениями и прогрессом пользователя.
     """
     user = request.user  # Получаем текущего пользователя
-    user_achievements = UserAchievement.objects.filter(user=user)  # Все достижения пользователя
-    earned_achievement_ids = user_achievements.values_list('achievement_id', flat=True)  # IDs достигнутых достижений
+    progress = get_progress(user)  # Сводка прогресса (одна строка UserProgress)
+    user_achievements = (UserAchievement.objects.filter(user=user)
+                         .select_related('achievement'))  # Все достижения пользователя
 
-    all_tasks = Task.objects.select_related('lesson', 'achievement')  # Все задачи, связанные с уроками и достижениями
-    tasks_with_status = []  # Список для хранения задач с их статусом (выполнил/не выполнил)
+    all_tasks = get_task_list()  # Все задачи из кеша каталога (без запроса к таблице задач)
+    completed_task_ids = set(progress.completed_task_ids)  # IDs выполненных задач из сводки
 
     # Для каждой задачи проверяем, выполнена ли она
-    for task in all_tasks:
-        is_completed = task.achievement_id in earned_achievement_ids if task.achievement else False
-        tasks_with_status.append((task, is_completed))
+    tasks_with_status = [(task, task['id'] in completed_task_ids) for task in all_tasks]
 
-    total_achievements = Achievement.objects.count()  # Всего достижений
-    earned_achievements = user_achievements.count()  # Достигнутые достижения
-    progress_percent = int((earned_achievements / total_achievements) * 100) if total_achievements else 0  # Процент выполненных достижений
+    progress_percent = progress.progress_percent  # Процент выполненных достижений
 
     return render(
         request,
         "kyberapp/profile.html",
         {
             'user': user,
+            'progress': progress,
             'user_achievements': user_achievements,
             'progress_percent': progress_percent,
             'tasks_with_status': tasks_with_status,
@@ -195,55 +211,132 @@ def take_test(request, test_id):
     Отображение страницы с тестом для прохождения и страницу с результатами теста после его завершения.
     """
     test = get_object_or_404(Test, id=test_id)  # Получаем тест по ID, если тест не найден, возвращаем 404 ошибку.
-    questions = test.questions.all()  # Получаем все вопросы для данного теста.
-    tasks = Task.objects.filter(lesson=test.lesson)  # Получаем задачи для текущей лекции, связанной с тестом.
-
-    score = 0  # Изначальный балл теста (0 баллов).
 
     if request.method == 'POST':  # Если форма была отправлена
-        # Обрабатываем ответы на каждый вопрос.
-        for question in questions:
-            selected_answers = request.POST.getlist(f'question_{question.id}')  # Получаем выбранные ответы пользователя.
-            correct_answers_for_question = question.answers.filter(is_correct=True)  # Получаем правильные ответы для текущего вопроса.
-
-            if question.question_type == 'one':  # Если вопрос одиночный (один правильный ответ)
-                if len(selected_answers) == 1 and selected_answers[0] == str(
-                        correct_answers_for_question.first().id):  # Проверяем правильность ответа
-                    score += 1  # Увеличиваем балл, если ответ правильный.
-            elif question.question_type == 'multiple':  # Если вопрос с несколькими правильными ответами
-                correct_answer_ids = [str(answer.id) for answer in correct_answers_for_question]  # Получаем правильные ответы
-                if sorted(selected_answers) == sorted(correct_answer_ids):  # Проверяем, совпадает ли выбранный ответ с правильными
-                    score += 1  # Увеличиваем балл за правильные ответы.
-
-        # Добавляем баллы за задачи, связанные с тестом.
-        for task in tasks:
-            if task.points in request.POST.getlist(f'task_{task.id}'):  # Проверяем, выбраны ли баллы задачи
-                score += task.points  # Добавляем баллы задачи, если они выбраны.
-
-        # Сохраняем результат теста в базе данных.
-        test_result = TestResult.objects.create(user=request.user, test=test, score=score)
-        test_result.save()  # Сохраняем результат теста.
-
-        # Присваиваем достижение, если набрано достаточно баллов.
-        if score >= test.total_points:  # Если пользователь набрал все возможные баллы в тесте
-            # Присваиваем достижение для всех задач с достижением.
-            for task in tasks:
-                if task.achievement:  # Если у задачи есть достижение
-                    achievement = task.achievement
-                    test_result.achieved_achievement = achievement  # Присваиваем достижение теста
-                    test_result.passed = True  # Отмечаем, что тест пройден успешно
-                    test_result.save()
-
-                    # Присваиваем достижение пользователю.
-                    user_achievement, created = UserAchievement.objects.get_or_create(
-                        user=request.user, achievement=achievement)
-                    if created:
-                        print(f"Достижение {achievement.title} присвоено пользователю {request.user.username}")
-                    else:
-                        print(f"Достижение {achievement.title} уже есть у пользователя {request.user.username}")
+        # При включённой очереди только сохраняем ответы — их проверит
+        # grade_worker, а пользователь подождёт на странице результата.
+        if submission_queue.is_enabled():
+            submission = submission_queue.enqueue(request.user, test, request.POST)
+            return redirect('submission_status', submission_id=submission.pk)
+
+        # Проверяем ответы и одной транзакцией сохраняем результат, историю
+        # прохождения и достижения (см. submissions.py).
+        test_result = submit_test(request.user, test, request.POST)
 
         # Отправляем результат теста на страницу.
-        return render(request, 'kyberapp/test_result.html', {'test_result': test_result, 'score': score})
+        return render(request, 'kyberapp/test_result.html',
+                      {'test_result': test_result, 'score': test_result.score})
 
     # Если форма не была отправлена, показываем страницу с тестом.
-    return render(request, 'kyberapp/take_test.html', {'test': test, 'questions': questions})
+    # Вопросы и ответы берём из закешированного дерева теста (без признаков правильности).
+    test_tree = load_test_tree(test)
+    return render(request, 'kyberapp/take_test.html', {'test': test, 'questions': test_tree['questions']})
+
+
+@login_required
+def submission_status(request, submission_id):
+    """
+    Страница результата теста, отправленного через очередь. Пока результат
+    не готов, страница периодически обновляется.
+
+    Параметры:
+    request: объект HttpRequest, содержащий информацию о запросе.
+    submission_id: ID отправки.
+    """
+    submission = get_object_or_404(
+        Submission.objects.select_related('test', 'result__test', 'result__achieved_achievement'),
+        pk=submission_id, user=request.user,  # Чужие отправки не показываем
+    )
+    if submission.status == Submission.DONE and submission.result:
+        return render(request, 'kyberapp/test_result.html',
+                      {'test_result': submission.result, 'score': submission.result.score})
+    return render(request, 'kyberapp/submission_status.html', {
+        'submission': submission,
+        'refresh_seconds': submission_queue.get_config()['REFRESH_SECONDS'],
+    })
+
+
+@login_required
+def inbox(request):
+    """
+    Уведомления пользователя, новые первыми, с постраничным выводом по курсору.
+    Параметр ``unread=1`` оставляет только непрочитанные.
+    """
+    unread_only = request.GET.get('unread') == '1'
+    notifications = Notification.objects.filter(user=request.user)
+    if unread_only:
+        notifications = notifications.filter(is_read=False)
+    paginator = KeysetPaginator(notifications, 20, ordering=('-created_at', '-id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    return render(request, 'kyberapp/inbox.html',
+                  {'page_obj': page_obj, 'unread_only': unread_only})
+
+
+@login_required
+@require_POST
+def mark_notifications_read(request):
+    """
+    Отмечает прочитанными выбранные уведомления (поле ``notification``)
+    или, если ничего не выбрано, все уведомления пользователя.
+    """
+    notification_ids = [value for value in request.POST.getlist('notification') if value.isdigit()]
+    if notification_ids:
+        mark_read(request.user, notification_ids)
+    else:
+        mark_all_read(request.user)
+    return redirect('inbox')
+
+
+@login_required
+def unread_count(request):
+    # Количество непрочитанных уведомлений для обновления шапки без перезагрузки.
+    return JsonResponse({'unread': get_unread_count(request.user)})
+
+
+def metrics(request):
+    """
+    Замеры производительности представлений в текстовом формате Prometheus
+    (см. perf.py).
+
+    Параметры:
+    request: объект HttpRequest; нужен вход сотрудника или заголовок
+             ``Authorization: Bearer <METRICS_TOKEN>``.
+
+    Возвращает:
+    Текст с гистограммами по представлениям или 403.
+    """
+    if not perf.metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(perf.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def leaderboard(request, scope=leaderboards.GLOBAL, object_id=0):
+    """
+    Рейтинг пользователей: общий, по уроку или по тесту (см. leaderboards.py).
+
+    Параметры:
+    request: объект HttpRequest; параметр ``page`` — номер страницы.
+    scope: вид рейтинга.
+    object_id: ID урока или теста.
+
+    Возвращает:
+    Страница с первыми местами рейтинга и местом текущего пользователя.
+    """
+    subject = None
+    if scope == leaderboards.TEST:
+        subject = get_object_or_404(Test, pk=object_id)
+    elif scope == leaderboards.LESSON:
+        subject = get_object_or_404(Lesson, pk=object_id)
+    board = leaderboards.get_board(scope, object_id)  # Снимок рейтинга из кеша
+    paginator = Paginator(board['top'], leaderboards.get_config()['PAGE_SIZE'])
+    page_obj = paginator.get_page(request.GET.get('page'))
+    my_rank = None
+    if request.user.is_authenticated:
+        my_rank = leaderboards.get_rank(request.user, scope, object_id, board)  # Место пользователя
+    return render(request, 'kyberapp/leaderboard.html', {
+        'scope': scope,
+        'subject': subject,
+        'page_obj': page_obj,
+        'participants': board['total'],
+        'my_rank': my_rank,
+    })
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kyberprotect.settings')
+# Под ASGI страницы для чтения обслуживают асинхронные представления
+# (kyberapp/async_views.py); KYBERAPP_ASYNC_VIEWS=0 возвращает синхронные.
+os.environ.setdefault('KYBERAPP_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
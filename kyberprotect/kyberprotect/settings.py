@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -20,7 +21,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'kyberapp.assets.StaticAssetsMiddleware',
+    'kyberapp.perf.PerfMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'kyberapp.routers.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -32,7 +36,8 @@ ROOT_URLCONF = 'kyberprotect.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени отрисовки (см. kyberapp/perf.py).
+        'BACKEND': 'kyberapp.perf.TimedTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -41,6 +46,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'kyberapp.context_processors.notifications',
             ],
         },
     },
@@ -52,9 +58,78 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Соединение переиспользуется между запросами; перед повторным
+        # использованием проверяется, что оно живо.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Реплика для чтения (см. kyberapp/routers.py). Локально — копия файла
+    # основной базы, которую обновляет manage.py sync_replica; путь к ней
+    # задаёт переменная окружения KYBERAPP_REPLICA_DB.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('KYBERAPP_REPLICA_DB') or BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['kyberapp.routers.ReplicaRouter']
+
+# Чтение публичного контента и отчётов с реплики включается вместе
+# с KYBERAPP_REPLICA_DB, см. kyberapp/routers.py.
+KYBERAPP_REPLICA = {
+    'ENABLED': bool(os.environ.get('KYBERAPP_REPLICA_DB')),
+}
+
+# PRAGMA при открытии соединения и повтор транзакций записи при занятой
+# базе, см. kyberapp/database.py.
+KYBERAPP_SQLITE = {
+    'ENABLED': True,
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Кеш публичных страниц для анонимных посетителей (kyberapp/page_cache.py).
+# Для нескольких процессов укажите общий бэкенд (Redis, Memcached) в CACHES.
+KYBERAPP_PAGE_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+    'STALE_TIMEOUT': 600,
+}
+
+# Очередь отправленных тестов (kyberapp/submission_queue.py). При ENABLED
+# ответы проверяет отдельный процесс: python manage.py grade_worker.
+# Обработчику и веб-процессам нужен общий кеш (см. CACHES), иначе версии
+# каталога и тестов в обработчике не обновляются до его перезапуска.
+KYBERAPP_SUBMISSION_QUEUE = {
+    'ENABLED': False,
+    'BATCH_SIZE': 50,
+}
+
+# Асинхронные версии страниц для чтения (kyberapp/async_views.py). Под ASGI
+# (kyberprotect/asgi.py) включаются переменной окружения KYBERAPP_ASYNC_VIEWS=1,
+# под WSGI остаются синхронные представления.
+KYBERAPP_ASYNC_VIEWS = {
+    'ENABLED': os.environ.get('KYBERAPP_ASYNC_VIEWS') == '1',
+}
+
+# Уменьшенные копии изображений (kyberapp/images.py). Копии лежат
+# в MEDIA_ROOT/variants/ под именами из хеша содержимого — веб-сервер может
+# отдавать этот каталог с "Cache-Control: public, max-age=31536000, immutable".
+# Уже загруженные изображения: python manage.py generate_image_variants.
+KYBERAPP_IMAGES = {
+    'ENABLED': True,
+    'WORKERS': 2,
+    'QUALITY': 80,
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -79,6 +154,39 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic склеивает CSS из base.html в один файл, добавляет хеш
+# в имена файлов и создаёт сжатые копии .gz/.br (kyberapp/assets.py).
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'kyberapp.assets.AssetsStorage',
+    },
+}
+
+# Раздача STATIC_ROOT (kyberapp.assets.StaticAssetsMiddleware): сжатые копии
+# по Accept-Encoding, ETag, Cache-Control immutable для файлов с хешем.
+KYBERAPP_STATIC = {
+    'SERVE': True,
+    'MAX_AGE': 60 * 60,
+}
+
+# Замеры запросов по представлениям, /metrics/ и manage.py perf_report
+# (см. kyberapp/perf.py). Без входа сотрудника /metrics/ отдаётся по токену.
+KYBERAPP_PERF = {
+    'ENABLED': True,
+    'METRICS_TOKEN': os.environ.get('KYBERAPP_METRICS_TOKEN', ''),
+}
+
+# Рейтинги (kyberapp/leaderboards.py): снимок рейтинга в кеше обновляется
+# раз в TIMEOUT секунд, место пользователя ищется по нему.
+KYBERAPP_LEADERBOARD = {
+    'TIMEOUT': 60,
+    'TOP_K': 100,
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'